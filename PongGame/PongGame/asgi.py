@@ -10,7 +10,6 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PongGame.settings')
@@ -18,12 +17,17 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PongGame.settings')
 django_asgi_app = get_asgi_application()
 
 import pong.routing
+from pong.backend import lifespan
+from pong.auth import TokenAuthMiddleware
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
+    # session HTTP partagee vers le backend (pong.backend), ignore par daphne
+    "lifespan": lifespan,
     "websocket":
         # AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
+        # tokens verifies une fois, sans session ni base de donnees
+        TokenAuthMiddleware(
             URLRouter(
                 pong.routing.websocket_urlpatterns
             )
@@ -0,0 +1,176 @@
+import asyncio
+import collections
+import os
+import time
+
+import jwt
+
+
+def _service_token(name):
+    return os.getenv(name, '').replace('Bearer', '').strip()
+
+
+# lus une seule fois au demarrage (voir pong.loadtest.setup_environment pour les surcharger)
+AI_SERVICE_TOKEN = _service_token('AI_SERVICE_TOKEN')
+CLI_SERVICE_TOKEN = _service_token('CLI_SERVICE_TOKEN')
+SERVICE_TOKENS = {token for token in (AI_SERVICE_TOKEN, CLI_SERVICE_TOKEN) if token}
+JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
+JWT_ALGORITHMS = ['HS256']
+
+TOKEN_CACHE_SIZE = int(os.getenv('JWT_CACHE_SIZE', '4096'))
+# duree pendant laquelle un uid verifie par le backend n'est pas redemande (secondes)
+UID_CACHE_TTL = float(os.getenv('UID_CACHE_TTL', '30'))
+UID_CACHE_SIZE = 4096
+
+
+class TokenCache:
+    """
+    Cache LRU borne des JWT deja verifies : token -> claims.
+    Une entree est retiree a son "exp", le token est alors de nouveau decode (et refuse).
+    """
+
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, token):
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        claims, expires = entry
+        if expires is not None and expires <= self.clock():
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return claims
+
+
+    def put(self, token, claims):
+        expires = claims.get('exp')
+        self._entries[token] = (claims, float(expires) if expires is not None else None)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+    def clear(self):
+        self._entries.clear()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache()
+
+
+def verify_jwt(token, secret_key=None, cache=token_cache):
+    """
+    Retourne les claims d'un JWT signe avec JWT_SECRET_KEY, un seul decode verifie par token
+    tant qu'il est dans le cache. Leve jwt.InvalidTokenError si le token est refuse.
+    """
+    claims = cache.get(token)
+    if claims is not None:
+        return claims
+    secret_key = secret_key or JWT_SECRET_KEY
+    if not secret_key:
+        raise jwt.InvalidTokenError("JWT_SECRET_KEY non definie")
+    claims = jwt.decode(token, secret_key, algorithms=JWT_ALGORITHMS)
+    cache.put(token, claims)
+    return claims
+
+
+def authenticate(subprotocols):
+    """
+    Verifie le token passe en premier sous-protocole ("token_<jwt ou token de service>").
+    Retourne {"token", "claims", "is_ai", "error"} ; error vaut None si le token est accepte.
+    """
+    result = {'token': None, 'claims': None, 'is_ai': False, 'error': None}
+    if not subprotocols:
+        result['error'] = "Aucun sous-protocole reçu"
+        return result
+    token = result['token'] = subprotocols[0].replace('token_', '')
+    if token in SERVICE_TOKENS:
+        result['is_ai'] = token == AI_SERVICE_TOKEN
+        return result
+    try:
+        result['claims'] = verify_jwt(token)
+    except jwt.InvalidTokenError as e:
+        result['error'] = f"Token JWT invalide: {str(e)}"
+    except Exception as e:
+        result['error'] = f"Erreur inattendue lors de la vérification: {str(e)}"
+    return result
+
+
+class TokenAuthMiddleware:
+    """
+    Remplace AuthMiddlewareStack pour le socket de jeu : le resultat de authenticate() est mis
+    dans scope["auth"], sans session Django ni acces a la base (ni passage par un thread).
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'websocket' and 'auth' not in scope:
+            scope = dict(scope, auth=authenticate(scope.get('subprotocols', [])))
+        return await self.inner(scope, receive, send)
+
+
+class VerificationCache:
+    """
+    Uids de partie acceptes par le backend (GET /game/verify/<uid>/), gardes `ttl` secondes.
+    Les verifications simultanees d'un meme uid partagent une seule requete ; un refus ou
+    une erreur n'est pas garde, le prochain connect redemande.
+    """
+
+    def __init__(self, ttl=UID_CACHE_TTL, maxsize=UID_CACHE_SIZE, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self._verified = collections.OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.shared = 0
+        self.requests = 0
+
+
+    async def verify(self, uid, check):
+        """Retourne True si l'uid est valide ; `check(uid)` n'est appele que si besoin."""
+        expires = self._verified.get(uid)
+        if expires is not None:
+            if expires > self.clock():
+                self.hits += 1
+                return True
+            del self._verified[uid]
+        future = self._inflight.get(uid)
+        if future is None:
+            self.requests += 1
+            future = asyncio.ensure_future(check(uid))
+            self._inflight[uid] = future
+            future.add_done_callback(lambda done: self._done(uid, done))
+        else:
+            self.shared += 1
+        # un client qui se deconnecte pendant la requete ne l'annule pas pour les autres
+        return await asyncio.shield(future)
+
+
+    def _done(self, uid, future):
+        self._inflight.pop(uid, None)
+        if future.cancelled() or future.exception() is not None or not future.result():
+            return
+        self._verified[uid] = self.clock() + self.ttl
+        self._verified.move_to_end(uid)
+        while len(self._verified) > self.maxsize:
+            self._verified.popitem(last=False)
+
+
+uid_cache = VerificationCache()
@@ -0,0 +1,90 @@
+"""
+Client HTTP partage par tous les consumers pour les appels au backend (nginx) :
+une seule aiohttp.ClientSession par process, connexions gardees ouvertes (keep-alive).
+
+Reglages (variables d'environnement) :
+    BACKEND_POOL_LIMIT          connexions ouvertes au maximum (100)
+    BACKEND_KEEPALIVE_TIMEOUT   secondes avant de fermer une connexion inutilisee (30)
+    BACKEND_CONNECT_TIMEOUT     secondes pour etablir une connexion (2)
+    BACKEND_TIMEOUT             secondes au total pour une requete (5)
+
+La session est ouverte au demarrage (evenement lifespan) et fermee a l'arret. Daphne
+n'envoie pas les evenements lifespan : la session est alors creee a la premiere requete
+et fermee a la sortie du process (atexit), sur la boucle qui l'a ouverte.
+"""
+import asyncio
+import atexit
+import logging
+import os
+
+import aiohttp
+
+
+POOL_LIMIT = int(os.getenv('BACKEND_POOL_LIMIT', '100'))
+KEEPALIVE_TIMEOUT = float(os.getenv('BACKEND_KEEPALIVE_TIMEOUT', '30'))
+CONNECT_TIMEOUT = float(os.getenv('BACKEND_CONNECT_TIMEOUT', '2'))
+REQUEST_TIMEOUT = float(os.getenv('BACKEND_TIMEOUT', '5'))
+
+
+class BackendClient:
+
+    def __init__(self, limit=POOL_LIMIT, keepalive_timeout=KEEPALIVE_TIMEOUT,
+                 connect_timeout=CONNECT_TIMEOUT, timeout=REQUEST_TIMEOUT):
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self._session = None
+        self._loop = None
+        self._lock = asyncio.Lock()
+
+
+    async def session(self):
+        if self._session is None or self._session.closed:
+            async with self._lock:
+                if self._session is None or self._session.closed:
+                    connector = aiohttp.TCPConnector(
+                        limit=self.limit,
+                        keepalive_timeout=self.keepalive_timeout,
+                        # certificat auto-signe de nginx
+                        ssl=False,
+                    )
+                    self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+                    self._loop = asyncio.get_running_loop()
+        return self._session
+
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+    def close_at_exit(self):
+        # boucle de daphne arretee mais pas fermee : on y termine la fermeture de la session
+        loop = self._loop
+        if self._session is None or self._session.closed or loop is None or loop.is_closed() or loop.is_running():
+            return
+        try:
+            loop.run_until_complete(self.close())
+        except Exception as e:
+            logging.error(f"Error closing backend session: {e}")
+
+
+backend = BackendClient()
+atexit.register(backend.close_at_exit)
+
+
+async def lifespan(scope, receive, send):
+    """Application ASGI "lifespan" : ouvre la session au demarrage, la ferme a l'arret."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await backend.session()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            try:
+                await backend.close()
+            except Exception as e:
+                logging.error(f"Error closing backend session: {e}")
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -0,0 +1,347 @@
+"""
+Microbenchmarks des chemins critiques du moteur de jeu (pong.game), sans Django.
+Toutes les parties sont creees avec une graine et des scenarios fixes.
+
+Lancer depuis PongGame/ :
+    python -m pong.benchmarks                          # affiche les resultats
+    python -m pong.benchmarks --output bench.json      # les enregistre
+    python -m pong.benchmarks --compare bench.json     # compare a un run precedent
+Le code de sortie vaut 1 si un benchmark est plus lent que la reference au-dela du seuil.
+"""
+import argparse
+import itertools
+import json
+import math
+import platform
+import random
+import sys
+import time
+import timeit
+
+from .game import delta as delta_stream
+from .game import wire
+from .game.game import Game
+
+
+SEED = 1234
+
+
+def next_collision_scenarios(count=200, seed=0):
+    # balles a des positions, angles et vitesses tires avec une graine fixe
+    rng = random.Random(seed)
+    scenarios = []
+    for _ in range(count):
+        game = Game(seed=rng.randrange(2 ** 32))
+        ball = game.ball
+        ball.x = rng.uniform(game.width * 0.1, game.width * 0.9)
+        ball.y = rng.uniform(ball.radius + 1, game.height - ball.radius - 1)
+        angle = math.radians(rng.uniform(-80, 80)) + rng.choice((0, math.pi))
+        speed = rng.uniform(ball.max_speed / 5, ball.max_speed)
+        ball.x_vel = speed * math.cos(angle)
+        ball.y_vel = speed * math.sin(angle)
+        paddle = game.paddle1 if ball.x_vel < 0 else game.paddle2
+        scenarios.append((ball, paddle))
+    return scenarios
+
+
+def aim(game, angle, speed_ratio=0.6):
+    ball = game.ball
+    speed = ball.max_speed * speed_ratio
+    ball.x_vel = speed * math.cos(math.radians(angle))
+    ball.y_vel = speed * math.sin(math.radians(angle))
+
+
+def long_rally():
+    # raquettes couvrant tout le but : la balle ne sort jamais, l'echange ne finit pas
+    game = Game(seed=SEED)
+    for paddle in (game.paddle1, game.paddle2):
+        paddle.y = 0
+        paddle.height = game.height
+    aim(game, 20)
+    return game
+
+
+def steep_angle():
+    # trajectoire presque verticale : beaucoup de rebonds sur les bords
+    game = Game(seed=SEED)
+    aim(game, 78)
+    game.paddle2.y = game.height - game.paddle2.height
+    return game
+
+
+def arete_hit():
+    # balle qui arrive sur le coin des raquettes ("arete")
+    game = Game(seed=SEED)
+    ball = game.ball
+    ball.x = game.paddle1.x + game.paddle1.width
+    ball.y = game.paddle1.y - ball.radius / 2
+    aim(game, -170)
+    game.paddle2.y = ball.y - game.paddle2.height + ball.radius / 2
+    return game
+
+
+SCENARIOS = {
+    "long_rally": long_rally,
+    "steep_angle": steep_angle,
+    "arete_hit": arete_hit,
+}
+
+
+def ball_state(ball):
+    return ball.x, ball.y, ball.x_vel, ball.y_vel
+
+
+def bench_move(game):
+    ball = game.ball
+    return ball.move
+
+
+def bench_check_collision(game):
+    ball = game.ball
+    paddle = game.paddle1
+    return lambda: ball.check_collision(paddle)
+
+
+def bench_update_trajectory(side):
+    def setup(game):
+        ball = game.ball
+        paddle = game.paddle1 if side == 1 else game.paddle2
+        update = ball.updateTrajectoryP1 if side == 1 else ball.updateTrajectoryP2
+        # la balle est remise dans son etat initial a chaque appel, et le temps
+        # avance d'une seconde pour ne pas etre bloque par la garde de 0.5 s
+        state = ball_state(game.ball)
+        clock = itertools.count()
+        def run():
+            ball.x, ball.y, ball.x_vel, ball.y_vel = state
+            update(paddle, next(clock))
+        return run
+    return setup
+
+
+def bench_next_collision(game):
+    ball = game.ball
+    paddle = game.paddle2 if ball.x_vel > 0 else game.paddle1
+    return lambda: ball.calculateNextCollisionPosition(paddle)
+
+
+def bench_next_collision_stepwise(game):
+    ball = game.ball
+    paddle = game.paddle2 if ball.x_vel > 0 else game.paddle1
+    return lambda: ball.simulateNextCollisionPosition(paddle)
+
+
+def next_collision_speedup(repeat=5):
+    # forme fermee contre version pas a pas, en moyenne sur les memes balles tirees au hasard
+    scenarios = next_collision_scenarios()
+
+    def run(predict):
+        def loop():
+            for ball, paddle in scenarios:
+                predict(ball, paddle)
+        return min(timeit.repeat(loop, number=1, repeat=repeat)) / len(scenarios)
+
+    stepwise = run(lambda ball, paddle: ball.simulateNextCollisionPosition(paddle))
+    closed_form = run(lambda ball, paddle: ball.calculateNextCollisionPosition(paddle))
+    return {
+        "scenarios": len(scenarios),
+        "stepwise_us": stepwise * 1e6,
+        "closed_form_us": closed_form * 1e6,
+        "speedup": stepwise / closed_form,
+    }
+
+
+def bench_ball_serialize(game):
+    game.nextCollision = game.predicted_collision()
+    return lambda: game.ball.serialize(game)
+
+
+def bench_game_serialize(game):
+    game.nextCollision = game.predicted_collision()
+    return game.serialize
+
+
+def bench_game_serialize_game(game):
+    game.nextCollision = game.predicted_collision()
+    return game.gameSerialize
+
+
+def bench_ai_serialize(game):
+    game.nextCollision = game.predicted_collision()
+    return game.aiSerialize
+
+
+def bench_tick(game):
+    # un tick complet de la boucle de jeu (physique + frame quand elle est due) ;
+    # pas de fin de partie pour que la mesure reste sur des ticks de jeu
+    game.scoreLimit = sys.maxsize
+    def run():
+        game.step()
+        if game.frame_due():
+            game.emit_frame()
+        if game.pause:
+            game.resume()
+    return run
+
+
+def consumer_frame(game):
+    # frame telle que le consumer l'envoie (champs ajoutes par generate_states)
+    game.nextCollision = game.predicted_collision()
+    frame = game.emit_frame()
+    frame["game_mode"] = "PVE"
+    frame["resumeOnGoal"] = False
+    return frame
+
+
+def json_frame(frame):
+    return json.dumps(frame)[:-1] + ', "side": "p1"}'
+
+
+def binary_frame(frame):
+    return wire.encode_frame(frame) + wire.side_suffix("p1")
+
+
+def bench_encode_json(game):
+    frame = consumer_frame(game)
+    return lambda: json_frame(frame)
+
+
+def bench_encode_binary(game):
+    frame = consumer_frame(game)
+    return lambda: binary_frame(frame)
+
+
+def consecutive_frames(game, count=120):
+    frames = []
+    for _ in range(count):
+        while not game.frame_due():
+            game.step()
+        frames.append(consumer_frame(game))
+        if game.pause:
+            game.resume()
+    return frames
+
+
+def delta_frame(stream, frame):
+    seq, delta = stream.push(frame)
+    if delta is None:
+        return json.dumps({**frame, "seq": seq})
+    return delta_stream.encode(seq, delta)
+
+
+def bench_encode_delta(game):
+    # flux de frames successives, keyframes periodiques comprises
+    frames = itertools.cycle(consecutive_frames(game))
+    stream = delta_stream.DeltaStream()
+    return lambda: delta_frame(stream, next(frames))
+
+
+def frame_sizes():
+    sizes = {}
+    for scenario_name, scenario in SCENARIOS.items():
+        game = scenario()
+        frame = consumer_frame(game)
+        sizes[scenario_name] = {
+            "json": len(json_frame(frame).encode()),
+            "binary": len(binary_frame(frame)),
+        }
+        stream = delta_stream.DeltaStream()
+        deltas = [len(delta_frame(stream, frame).encode()) for frame in consecutive_frames(scenario())]
+        sizes[scenario_name]["delta_mean"] = round(sum(deltas) / len(deltas))
+    return sizes
+
+
+BENCHMARKS = {
+    "Ball.move": bench_move,
+    "Ball.check_collision": bench_check_collision,
+    "Ball.updateTrajectoryP1": bench_update_trajectory(1),
+    "Ball.updateTrajectoryP2": bench_update_trajectory(2),
+    "Ball.calculateNextCollisionPosition": bench_next_collision,
+    "Ball.simulateNextCollisionPosition": bench_next_collision_stepwise,
+    "Ball.serialize": bench_ball_serialize,
+    "Game.serialize": bench_game_serialize,
+    "Game.gameSerialize": bench_game_serialize_game,
+    "Game.aiSerialize": bench_ai_serialize,
+    "Game.tick": bench_tick,
+    "encode.json": bench_encode_json,
+    "encode.binary": bench_encode_binary,
+    "encode.delta": bench_encode_delta,
+}
+
+
+def measure(func, repeat, min_time=0.05):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run_suite(repeat=5, only=None):
+    results = {}
+    for bench_name, setup in BENCHMARKS.items():
+        if only and only not in bench_name:
+            continue
+        for scenario_name, scenario in SCENARIOS.items():
+            func = setup(scenario())
+            results[f"{bench_name}[{scenario_name}]"] = measure(func, repeat) * 1e9
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": SEED,
+        "unit": "ns/call",
+        "results": results,
+        "frame_bytes": frame_sizes(),
+        "next_collision": next_collision_speedup(repeat),
+    }
+
+
+def compare(current, baseline, threshold):
+    regressions = []
+    for name, value in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            print(f"{name:60} {value:12.0f}  (new)")
+            continue
+        ratio = value / previous
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:60} {value:12.0f} {previous:12.0f} {ratio:7.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks du moteur de jeu")
+    parser.add_argument("--output", help="fichier JSON ou enregistrer les resultats")
+    parser.add_argument("--compare", help="resultats JSON d'un run precedent")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="ratio au-dela duquel un benchmark est une regression")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="ne lance que les benchmarks dont le nom contient ce texte")
+    args = parser.parse_args()
+
+    current = run_suite(repeat=args.repeat, only=args.only)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(current, baseline, args.threshold):
+            sys.exit(1)
+    else:
+        for name, value in current["results"].items():
+            print(f"{name:60} {value:12.0f} ns")
+    prediction = current["next_collision"]
+    print(f"next collision over {prediction['scenarios']} balls: stepwise {prediction['stepwise_us']:.1f} us, "
+          f"closed form {prediction['closed_form_us']:.2f} us, {prediction['speedup']:.0f}x faster")
+    for scenario_name, sizes in current["frame_bytes"].items():
+        print(f"frame size[{scenario_name}]: json {sizes['json']} B, binary {sizes['binary']} B, "
+              f"delta {sizes['delta_mean']} B on average")
+
+
+if __name__ == "__main__":
+    main()
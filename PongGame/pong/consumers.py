@@ -1,20 +1,54 @@
 import json
 import asyncio
+import re
 from channels.generic.websocket import AsyncWebsocketConsumer
 from .game.game_wrapper import GameWrapper
 import logging
-import aiohttp
-from .utils import get_new_csrf_string_async
 from enum import Enum
 from .game.game_manager import game_manager
+from .game.game_status import GameStatus
+from .game import wire
+from .game import delta as delta_stream
+from .sender import FrameSender
+from . import auth
+from .backend import backend
+from .outbox import AUTH_FORM, AUTH_HEADERS, outbox
 
 from urllib.parse import parse_qs
-import jwt
-import base64
 import time
 
 import os
 
+# Adresses du backend (nginx), surchargeables par exemple pour le test de charge (pong.loadtest)
+BACKEND_URL = os.getenv('BACKEND_URL', 'https://nginx:7777')
+BACKEND_HTTP_URL = os.getenv('BACKEND_HTTP_URL', 'http://nginx:7777')
+
+# Messages d'entree a forme fixe (keyDown du front, move de l'IA), lus sans json.loads.
+# Le message entier doit avoir exactement cette forme : champs dans cet ordre, au plus
+# une espace apres ":" et ",", actions -1, 0 ou 1. Sinon parse_input_fast renvoie None
+# et le message passe par json.loads
+KEY_DOWN_RE = re.compile(
+    r'\{"type": ?"keyDown", ?"sender": ?"(\w+)"(?:, ?"player": ?"(p[12])")?(?:, ?"event": ?"\w*")?'
+    r', ?"value": ?\[(-?[01]), ?(-?[01])\]\}'
+)
+MOVE_RE = re.compile(r'\{"type": ?"move", ?"sender": ?"(\w+)", ?"direction": ?"(up|down|still)"\}')
+AI_ACTIONS = {"up": 1, "down": -1, "still": 0}
+
+
+def parse_input_fast(text_data):
+    match = KEY_DOWN_RE.fullmatch(text_data)
+    if match is not None:
+        sender, player, first, second = match.groups()
+        event = {"type": "keyDown", "sender": sender, "value": [int(first), int(second)]}
+        if player is not None:
+            event["player"] = player
+        return event
+    match = MOVE_RE.fullmatch(text_data)
+    if match is not None:
+        return {"type": "move", "sender": match[1], "direction": match[2]}
+    return None
+
+
 class PlayerType(Enum):
     HUMAN = "Human"
     AI = "AI"
@@ -46,119 +80,66 @@ class PongConsumer(AsyncWebsocketConsumer):
     adversary = None
     error_on_connect = 0
     client = None
-    sleeping = False
-    message_timestamp = 0
     jwt_token = None
+    # claims du JWT verifie (None pour les tokens de service)
+    claims = None
+    # frames en binaire (sous-protocole pong.bin.v2) plutot qu'en JSON
+    binary = False
+    # flux keyframe + delta (sous-protocole pong.delta.v1), frames JSON seulement
+    delta = False
+    needs_keyframe = True
+    # client IA (token de service AI) : recoit les observations au lieu des frames
+    is_ai = False
+    frame_sender = None
+    connect_started = None
 
 
-    clients = {}
-
-    def decode_jwt_unsafe(self, token):
-        """Décode le JWT en base64 sans vérification de signature"""
-        try:
-            header_b64, payload_b64, _ = token.split('.')
-            padding = '=' * (-len(payload_b64) % 4)
-            payload_b64_padded = payload_b64 + padding
-            payload_json = base64.urlsafe_b64decode(payload_b64_padded)
-            return json.loads(payload_json)
-        except Exception as e:
-            logging.error(f"Erreur décodage base64: {str(e)}")
-            return None
-
 
     async def verify_token(self):
         """
         Vérifie le token d'authentification dans les sous-protocoles WebSocket.
         Supporte les tokens de service et les JWT.
         """
-        try:
-            protocols = self.scope.get('subprotocols', [])
-            # logging.info(f"Protocoles reçus: {protocols}")
-
-            if not protocols:
-                logging.error("Aucun sous-protocole reçu")
-                self.error_on_connect = Errors.WRONG_TOKEN.value
-                return False
-
-            # Extraire le token
-            token = protocols[0].replace('token_', '')
-            # logging.info(f"Token extrait: {token[:10]}...")  # Log début du token
-            self.jwt_token = token
-
-            # Vérification des tokens de service
-            service_tokens = [
-                os.getenv('AI_SERVICE_TOKEN', '').replace('Bearer', '').strip(),
-                os.getenv('CLI_SERVICE_TOKEN', '').replace('Bearer', '').strip()
-            ]
-
-            # Vérifier les tokens de service d'abord
-            if token in service_tokens:
-#                 logging.info("Token de service validé")
-                return True
-
-            # Pour les JWT, vérifier avec les deux méthodes
-            # 1. Décodage non sécurisé
-            unsafe_payload = self.decode_jwt_unsafe(token)
-            if not unsafe_payload:
-                logging.error("Échec du décodage base64")
-                self.error_on_connect = Errors.WRONG_TOKEN.value
-                return False
-
-#             logging.info(f"Payload décodé (non sécurisé): {unsafe_payload}")
-
-            # 2. Décodage sécurisé
-            secret_key = os.getenv('JWT_SECRET_KEY')
-            if not secret_key:
-                logging.error("JWT_SECRET_KEY non définie")
-                self.error_on_connect = Errors.WRONG_TOKEN.value
-                return False
-
-            secure_payload = jwt.decode(
-                token,
-                secret_key,
-                algorithms=['HS256']
-            )
-#             logging.info(f"Payload décodé (sécurisé): {secure_payload}")
-
-            # 3. Vérifier la correspondance
-            if unsafe_payload != secure_payload:
-                logging.error("Les payloads ne correspondent pas")
-                self.error_on_connect = Errors.WRONG_TOKEN.value
-                return False
-
-            # Token validé, sauvegarder l'utilisateur
-            self.user = secure_payload.get('username')
-#             logging.info(f"JWT validé pour l'utilisateur: {self.user}")
-
-            # Enregistrer le token pour les futures requêtes
-
-            return True
-
-        except jwt.InvalidTokenError as e:
-            logging.error(f"Token JWT invalide: {str(e)}")
+        # deja verifie par TokenAuthMiddleware (PongGame.asgi)
+        result = self.scope.get('auth') or auth.authenticate(self.scope.get('subprotocols', []))
+        self.jwt_token = result['token']
+        if result['error'] is not None:
+            logging.error(result['error'])
             self.error_on_connect = Errors.WRONG_TOKEN.value
             return False
 
-        except Exception as e:
-            logging.error(f"Erreur inattendue lors de la vérification: {str(e)}")
-            self.error_on_connect = Errors.WRONG_TOKEN.value
-            return False
+        self.is_ai = result['is_ai']
+        self.claims = result['claims']
+        if self.claims is not None:
+            # Token validé, sauvegarder l'utilisateur
+            self.user = self.claims.get('username')
+#             logging.info(f"JWT validé pour l'utilisateur: {self.user}")
+        return True
 
 
     async def connect(self):
         
         # jwt_token = self.scope["query_string"].decode("utf-8")
 
+        self.connect_started = time.monotonic()
         # logging.info(f"tentative de Connexion de {self.scope['user']}")
+        # reprend les requetes restees en attente (par exemple avant un redemarrage)
+        outbox.start()
         if not await self.verify_token():
             logging.info(f"verify token is false")
             await self.disconnect(4001)
             await self.close(4001)
             return
 
-        await self._setup_csrf()
-        if not await self.verify_game_uid():
+        self.group_name = f"pong_{self.scope['url_route']['kwargs']['uid']}"
+        # la verification de l'uid (backend) et l'inscription au groupe ne dependent pas l'une de l'autre
+        verified, _ = await asyncio.gather(
+            self.verify_game_uid(),
+            self.channel_layer.group_add(self.group_name, self.channel_name),
+        )
+        if not verified:
             logging.info("verify game uid failed")
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
             await self.disconnect(4002)
             await self.close(4002)
             return
@@ -167,49 +148,51 @@ class PongConsumer(AsyncWebsocketConsumer):
         # else:
 #             logging.info("verify token ok")
 
-        self.game_wrapper = await game_manager.create_or_get_game(self.game_id)
-
-        self.group_name = f"pong_{self.game_id}"
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        
-        if self.group_name not in self.clients:
-            self.clients[self.group_name] = []
-        if len(self.clients[self.group_name]) == 2:
+        # partie existante trouvee sans verrou ; les consumers sont inscrits sur la partie
+        game_wrapper = await game_manager.create_or_get_game(self.game_id)
+        if not game_wrapper.add_client(self):
             logging.info(f"Group {self.group_name} is full")
             await self.close(4005)
-        else:
-            self.clients[self.group_name].append(self)
-        # logging.info(f"in connect, number of groups: {len(self.clients)}\nName of groups: {self.clients.keys()}\nsize of current group[channel_name]: {len(self.clients[self.group_name])}")
+            return
+        self.game_wrapper = game_wrapper
 
 
         subprotocol = self.scope.get('subprotocols', [''])[0]
-        
+        # l'IA reste en JSON : ses observations n'existent pas dans les autres formats
+        self.binary = wire.SUBPROTOCOL in self.scope.get('subprotocols', []) and not self.is_ai
+        self.delta = delta_stream.SUBPROTOCOL in self.scope.get('subprotocols', []) and not self.is_ai
+
         await self.accept(subprotocol=subprotocol)
+        self.frame_sender = FrameSender(self.send, started=self.connect_started, label=f"game {self.game_id}")
 
-        await self._initialize_game_mode()
+        self._initialize_game_mode()
         # logging.info(f"Game mode: {self.mode}")
 #         logging.info(f"number of connected players: {self.game_wrapper.present_players}")
 
-        await self.get_name_from_jwt()
+        self.get_name_from_jwt()
+
+        if self.is_ai:
+            # une observation par frame, tant que l'IA n'a pas choisi un autre rythme
+            game = self.game_wrapper.game
+            game.ai_observation_rate = game.frame_rate
 
         if self.is_main is True:
             asyncio.ensure_future(self.generate_states())
 
         else:
-            asyncio.ensure_future(self.wait_for_second_player())
+            self.wait_for_second_player()
 
-    async def get_name_from_jwt(self):
+    def get_name_from_jwt(self):
 
         # logging.info(f"get_name_from_jwt, self.jwt_token: {self.jwt_token}")
 
         try:
 
-            if self.jwt_token == os.getenv('AI_SERVICE_TOKEN').replace('Bearer', '').strip():
-                # logging.info("AI service token !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
+            # tokens de service : pas de claims, pas de nom
+            if self.claims is None:
                 return
-            payload = jwt.decode(self.jwt_token, options={'verify_signature': False})
-            # logging.info(f"payload: {payload}")
-            username = payload['username']
+            # claims deja verifies dans verify_token
+            username = self.claims['username']
             # logging.info(f"username: {username}")
             if username.startswith('guest'):
                 return
@@ -224,42 +207,45 @@ class PongConsumer(AsyncWebsocketConsumer):
             logging.error(f"Error in get_name_from_jwt: {e}")
 
 
-    async def wait_for_second_player(self):
+    def wait_for_second_player(self):
+        timeout = 10  # 10 secondes
+        if self.mode == GameMode.PVP_LAN.value:
+            timeout = 5
+        # pas de tache par lobby : un timer de la roue partagee, annule quand le second joueur arrive.
+        # Le message d'init est envoye par le client principal (send_init)
+        self.game_wrapper.start_lobby_timer(
+            game_manager.timers, timeout, lambda: asyncio.ensure_future(self.handle_lobby_timeout()))
+
+    def wait_for_handshake(self):
+        timeout = 15  # 15 secondes
+        # les deux joueurs sont la mais un client n'envoie jamais son nom ou "start" : la partie
+        # est annulee par un timer de la roue partagee, annule au passage en IN_PROGRESS
+        self.game_wrapper.start_handshake_timer(
+            game_manager.timers, timeout, lambda: asyncio.ensure_future(self.handle_handshake_timeout()))
+
+    async def handle_handshake_timeout(self):
+        wrapper = self.game_wrapper
+        if wrapper is None:
+            return
+        wrapper.transition(GameStatus.CANCELLED)
+        for client in wrapper.clients:
+            try:
+                await client.send(json.dumps({
+                    "type": "timeout",
+                    "message": "Players failed to start the game",
+                    "game_mode": client.mode
+                }))
+                client.error_on_connect = Errors.TIMEOUT.value
+                await client.disconnect(close_code=4003)
+                await client.close(code=4003)
+            except Exception as e:
+                logging.error(f"Error in wait_for_handshake: {e}")
+
+    async def handle_lobby_timeout(self):
         try:
-            timestamp = time.time()
-            timeout = 10  # 10 secondes
-            if self.mode == GameMode.PVP_LAN.value:
-                timeout = 5
-    
-            while time.time() - timestamp < timeout:
-                if self.game_wrapper.all_players_connected.is_set():
-                    if self.game_wrapper.player_1.name not in (None, 'guest') and self.game_wrapper.player_1.name == self.game_wrapper.player_2.name:
-                        for client in self.clients[self.group_name]:
-                            await client.send(json.dumps({
-                            "type": "same_jwt",
-                        }))
-                        self.error_on_connect = Errors.SAME_JWT.value
-                        await self.disconnect(close_code=4003)
-                        await self.close(code=4003)
-                        return
-                        
-                    for client in self.clients[self.group_name]:
-                        await client.send(json.dumps({
-                           "type": "opponent_connected",
-                           "opponent_connected": True
-                        }))
-                        await client.send(json.dumps({
-                           "type": "names",
-                           "p1": self.game_wrapper.player_1.name,
-                           "p2": self.game_wrapper.player_2.name
-                        }))
-                        # logging.info("sent names")
-                    # logging.info("Second player connected successfully")
-                    return
-                await asyncio.sleep(0.1)
-    
             # Timeout atteint
             # logging.error("Timeout waiting for second player")
+            self.game_wrapper.transition(GameStatus.CANCELLED)
             await self.send(json.dumps({
                 "type": "timeout",
                 "message": "Second player failed to connect",
@@ -278,16 +264,38 @@ class PongConsumer(AsyncWebsocketConsumer):
             await self.close(code=4003)
             return
 
-              
-    async def _setup_csrf(self):
-        if 'csrf_token' not in self.scope['session']:
-            try:
-                csrf_token = await get_new_csrf_string_async()
-                self.scope['session']['csrf_token'] = csrf_token
-                await self.scope["session"].save()
-            except Exception:
-                pass
 
+    async def send_init(self):
+        """
+        Message d'init, un seul par client quand la partie est prete (a la place de greetings,
+        opponent_connected et names). Retourne False si les deux joueurs ont le meme JWT.
+        """
+        wrapper = self.game_wrapper
+        clients = wrapper.clients
+        if wrapper.player_1.name not in (None, 'guest') and wrapper.player_1.name == wrapper.player_2.name:
+            for client in clients:
+                await client.send(json.dumps({
+                    "type": "same_jwt",
+                }))
+            wrapper.transition(GameStatus.CANCELLED)
+            for client in clients:
+                if client is not self:
+                    client.error_on_connect = Errors.SAME_JWT.value
+                    await client.disconnect(close_code=4003)
+                    await client.close(code=4003)
+            return False
+
+        for client in clients:
+            await client.send(json.dumps({
+                "type": "init",
+                "side": client.side,
+                "game_mode": self.mode,
+                "opponent_connected": True,
+                "p1": wrapper.player_1.name,
+                "p2": wrapper.player_2.name,
+            }))
+        wrapper.mark_ready("init")
+        return True
 
     async def verify_game_uid(self):
         self.game_id = self.scope['url_route']['kwargs']['uid']
@@ -295,41 +303,45 @@ class PongConsumer(AsyncWebsocketConsumer):
         if self.game_id is None:
             self.error_on_connect = Errors.WRONG_UID.value
             return False
-        async with aiohttp.ClientSession() as session:
-                verify_url = f"https://nginx:7777/game/verify/{self.game_id}/"
-                headers = await self.generate_headers(self.scope['session'].get('csrf_token'))
-#                 # logging.info(f"in verify game_uid: headers: {headers}")
+        # partie deja creee : son uid a ete verifie par le premier joueur
+        if self.game_id in game_manager.active_games:
+            return True
+        return await auth.uid_cache.verify(self.game_id, self.request_game_uid_verification)
 
-                try:
-                    async with session.get(
-                            verify_url,
-                            ssl=False,
-                            headers=headers
-                    ) as response:
-                        # logging.info(f"verify uid response: {response}")
-                        response_text = await response.text()
-                        # logging.info(f"response.text: {response_text}")
-                        if response.status not in [200]:  # On accepte 404 si le jeu est déjà nettoyé
-                            # logging.error(f"verify failed: {response.status}")
-                            # logging.error(f"Response: {response_text}")
-                            return False
-                        else:
-#                             # logging.info(f"verify successful for game {self.game_id}")
-                            return True
-                except Exception as e:
-                    logging.error(f"verify request error: {str(e)}")
+    async def request_game_uid_verification(self, game_id):
+        verify_url = f"{BACKEND_URL}/game/verify/{game_id}/"
+        headers = self.generate_headers()
+#         # logging.info(f"in verify game_uid: headers: {headers}")
+
+        try:
+            session = await backend.session()
+            async with session.get(
+                    verify_url,
+                    headers=headers
+            ) as response:
+                # logging.info(f"verify uid response: {response}")
+                response_text = await response.text()
+                # logging.info(f"response.text: {response_text}")
+                if response.status not in [200]:  # On accepte 404 si le jeu est déjà nettoyé
+                    # logging.error(f"verify failed: {response.status}")
+                    # logging.error(f"Response: {response_text}")
                     return False
+                else:
+#                     # logging.info(f"verify successful for game {self.game_id}")
+                    return True
+        except Exception as e:
+            logging.error(f"verify request error: {str(e)}")
+            return False
 
 
 #*********************GAME MODE INITIALIZATION START********************************
-    async def _initialize_game_mode(self):
+    def _initialize_game_mode(self):
         if self._is_shared_screen_mode():
             self._init_shared_screen()
         elif self._is_lan_mode():
             self._init_lan_mode()
         else:
             self._init_pve_mode()
-        await self.send(json.dumps({"type": "greetings", "side": self.side}))
 
 
     #********************SHARED SCREEN MODE INITIALIZATION START*********************
@@ -347,8 +359,8 @@ class PongConsumer(AsyncWebsocketConsumer):
             player.type = PlayerType.HUMAN.value
             player.is_connected = True
 
-        self.game_wrapper.all_players_connected.set()
-        self.game_wrapper.ai_is_initialized.set()
+        self.game_wrapper.mark_ready("ai")
+        self.game_wrapper.transition(GameStatus.STARTING)
         self.game_wrapper.game.RUNNING_AI = False
 
     #********************SHARED SCREEN MODE INITIALIZATION STOP************************
@@ -380,13 +392,12 @@ class PongConsumer(AsyncWebsocketConsumer):
         self.side = "p2"
         self.is_main = True
         self.game_wrapper.player_2.is_connected = True
-        self.game_wrapper.all_players_connected.set()
+        self.game_wrapper.transition(GameStatus.STARTING)
         # logging.info("all players are connected")
         self.game_wrapper.player_2.type = PlayerType.HUMAN.value
 
     def _setup_lan_common(self):
-        self.game_wrapper.ai_is_initialized.set()
-        self.game_wrapper.waiting_for_ai.set()
+        self.game_wrapper.mark_ready("ai")
         self.game_wrapper.game.RUNNING_AI = False
 
     #*********************LAN MODE INITIALIZATION END********************************
@@ -439,7 +450,7 @@ class PongConsumer(AsyncWebsocketConsumer):
             self.game_wrapper.player_2.is_ready = True
 
         self.is_main = True
-        self.game_wrapper.all_players_connected.set()
+        self.game_wrapper.transition(GameStatus.STARTING)
         # logging.info("all players are connected")
 
     #*********************PVE MODE INITIALIZATION sideEND********************************
@@ -452,49 +463,34 @@ class PongConsumer(AsyncWebsocketConsumer):
     async def handle_connect_error(self, error_code):
         if hasattr(self, 'game_wrapper') and self.game_wrapper:
                 self.game_wrapper.present_players = max(0, self.game_wrapper.present_players - 1)
-                self.game_wrapper.game.pause = True
-                self.game_wrapper.game_over.set()
+                self.game_wrapper.game.suspend()
+                self.game_wrapper.transition(GameStatus.CANCELLED)
                 
                 if self.game_wrapper.present_players <= 0:
                     if hasattr(self, 'game_id'):
-                        await game_manager.remove_game(self.game_id)
+                        await game_manager.remove_game(self.game_id, self.game_wrapper)
                     self.game_wrapper = None
 
 
     async def send_user_stats(self):
+        # envoye plus tard par la boite d'envoi (pong.outbox), sans attendre le backend
         try:
-            url = 'https://nginx:7777/auth/incrementusercounters/'
-            
+            url = f'{BACKEND_URL}/auth/incrementusercounters/'
+
             # Préparation des données dans le format attendu par request.POST
-            form_data = aiohttp.FormData()
-            form_data.add_field('token', self.jwt_token)
-            form_data.add_field('goals', str(
-                self.game_wrapper.game.paddle1.score if self.side == "p1" else self.game_wrapper.game.paddle2.score
-            ))
-            form_data.add_field('winner', str(
-                (self.side == "p1" and self.get_winner() == "Player1") or 
-                (self.side == "p2" and self.get_winner() == "Player2")
-            ).lower())
-            form_data.add_field('game_service_token', os.getenv('GAME_SERVICE_TOKEN'))
-
-            headers = {
-                'Content-Type': 'application/x-www-form-urlencoded',
+            # token du joueur et token de service ajoutes a l'envoi (jamais ecrits sur disque)
+            form_data = {
+                'goals': str(
+                    self.game_wrapper.game.paddle1.score if self.side == "p1" else self.game_wrapper.game.paddle2.score
+                ),
+                'winner': str(
+                    (self.side == "p1" and self.get_winner() == "Player1") or
+                    (self.side == "p2" and self.get_winner() == "Player2")
+                ).lower(),
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    url,
-                    data=form_data,
-                    headers=headers,
-                    ssl=False
-                ) as response:
-                    response_text = await response.text()
-                    if response.status == 200:
-                        response_data = json.loads(response_text)
-                        # logging.info(f"Stats updated successfully: goals={response_data['goal_counter']}, wins={response_data['win_counter']}")
-                    else:
-                        logging.error(f"Stats update failed: {response.status}")
-                        logging.error(f"Response: {response_text}")
+            outbox.enqueue(f"stats:{self.game_id}:{self.side}", 'POST', url, data=form_data,
+                           auth=AUTH_FORM, **self.outbox_credentials())
 
         except Exception as e:
             logging.error(f"Error sending stats: {str(e)}")
@@ -502,6 +498,11 @@ class PongConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         # 2 joueurs sont deja presents
         logging.info(f"Disconnect, code: {close_code}")
+        if self.frame_sender is not None:
+            self.frame_sender.close()
+            if self.frame_sender.dropped:
+                logging.info(f"Client {self.side} of game {getattr(self, 'game_id', None)}: "
+                             f"{self.frame_sender.sent} frames sent, {self.frame_sender.dropped} dropped")
         if close_code == 1006:
             logging.info(f"Disconnect for instance {id(self)}")
             return
@@ -513,32 +514,21 @@ class PongConsumer(AsyncWebsocketConsumer):
             # logging.info(f"Starting disconnect for instance {id(self)}")
             # if hasattr(self, 'group_name'):
             #     logging.info(f"Group name: {self.group_name}")
-            # logging.info(f"Available groups: {list(self.clients.keys())}")
+            wrapper = self.game_wrapper
     
             # Nettoyage toujours effectué, même avec une erreur
             # Nettoyage du channel layer
             if hasattr(self, 'group_name'):
                 try:
-                    await self.channel_layer.group_discard("pong", self.channel_name)
+                    await self.channel_layer.group_discard(self.group_name, self.channel_name)
                 except Exception as e:
                     logging.warning(f"Error discarding from channel layer: {str(e)}")
             
             # Nettoyage des clients
             try:
-                if (hasattr(self, 'clients') and hasattr(self, 'group_name') 
-                    and isinstance(self.clients, dict)  
-                    and self.group_name in self.clients):
-                    
-                    if self in self.clients[self.group_name]:
-                        self.clients[self.group_name].remove(self)
-                        # logging.info(f"Removed client from group {self.group_name}")
-                    
-                    if not self.clients[self.group_name]:
-                        del self.clients[self.group_name]
-                        # logging.info(f"Deleted empty group {self.group_name}")
-                    
-                    # logging.info(f"After cleanup - Number of groups: {len(self.clients)}")
-                    # logging.info(f"Groups remaining: {list(self.clients.keys())}")
+                if wrapper is not None:
+                    wrapper.remove_client(self)
+                    # logging.info(f"Removed client from game {self.game_id}")
             except Exception as e:
                 logging.warning(f"Error cleaning up clients: {str(e)}")
     
@@ -558,12 +548,12 @@ class PongConsumer(AsyncWebsocketConsumer):
             elif hasattr(self, 'game_wrapper') and self.game_wrapper:
                 try:
                     self.game_wrapper.present_players = max(0, self.game_wrapper.present_players - 1)
-                    self.game_wrapper.game.pause = True
-                    self.game_wrapper.game_over.set()
+                    self.game_wrapper.game.suspend()
+                    self.game_wrapper.transition(GameStatus.CANCELLED)
                     
                     if self.game_wrapper.present_players <= 0:
                         if hasattr(self, 'game_id'):
-                            await game_manager.remove_game(self.game_id)
+                            await game_manager.remove_game(self.game_id, self.game_wrapper)
                         self.game_wrapper = None
                 except Exception as e:
                     logging.warning(f"Error cleaning up game wrapper: {str(e)}")
@@ -572,7 +562,7 @@ class PongConsumer(AsyncWebsocketConsumer):
                 if hasattr(self, 'game_id'):
                     try:
                         data = self.generate_gameover_data()
-                        await self.send_gameover_to_remaining_client(data)
+                        await self.send_gameover_to_remaining_client(data, wrapper)
                     except Exception as e:
                         pass
 
@@ -580,55 +570,50 @@ class PongConsumer(AsyncWebsocketConsumer):
             logging.error(f"Error in disconnect: {str(e)}")
             logging.error(f"Full error details: {e.__class__.__name__}")
             logging.error(f"group_name: {getattr(self, 'group_name', 'Not set')}")
-            logging.error(f"Available groups: {list(getattr(self, 'clients', {}).keys())}")
+            logging.error(f"game_id: {getattr(self, 'game_id', 'Not set')}")
 
     async def send_cleanup_request(self):
 
-        base_url = f"https://nginx:7777"
+        base_url = BACKEND_URL
         if self.game_id is None:
             self.game_id = self.scope['url_route']['kwargs']['uid']
-        async with aiohttp.ClientSession() as session:
-            # Cleanup request
-            cleanup_url = f"{base_url}/game/cleanup/{self.game_id}/"
-            headers = await self.generate_headers(self.scope['session'].get('csrf_token'))
+        # Cleanup request, envoye plus tard par la boite d'envoi
+        cleanup_url = f"{base_url}/game/cleanup/{self.game_id}/"
 
-            try:
-                async with session.delete(
-                        cleanup_url,
-                        ssl=False,
-                        headers=headers
-                ) as response:
-                    response_text = await response.text()
-                    if response.status not in [200, 404]:  # On accepte 404 si le jeu est déjà nettoyé
-                        logging.error(f"Cleanup failed: {response.status}")
-                        logging.error(f"Response: {response_text}")
-            except Exception as e:
-                logging.error(f"Cleanup request error: {str(e)}")
+        try:
+            # On accepte 404 si le jeu est déjà nettoyé
+            outbox.enqueue(f"cleanup:{self.game_id}", 'DELETE', cleanup_url, accept=(200, 404),
+                           auth=AUTH_HEADERS, **self.outbox_credentials())
+        except Exception as e:
+            logging.error(f"Cleanup request error: {str(e)}")
 
-    async def send_gameover_to_remaining_client(self, data):
+    async def send_gameover_to_remaining_client(self, data, wrapper=None):
 #         logging.info(f"Sending gameover event to remaining client")
         if self.mode == "PVP_keyboard":
             return
-        remaining_client = None
-        for client in self.clients[self.group_name]:
-            if client != self:
-                remaining_client = client
-                break
+        # disconnect passe la partie : self.game_wrapper a pu etre remis a None
+        wrapper = wrapper or self.game_wrapper
+        remaining_client = wrapper.peer(self) if wrapper is not None else None
         if remaining_client is not None:
             # logging.info(f"Sending gameover event to remaining client, data: {data}")
             await remaining_client.send(json.dumps(data))
 
-    async def generate_headers(self, token):
-        if not token:
-            token = await self._setup_csrf()
+    def generate_headers(self):
+        # requetes de service : le backend authentifie le jeu par GAME_SERVICE_TOKEN, pas de CSRF
         headers = {
             'Content-Type': 'application/json',
-            'X-CSRFToken': token,
             "Authorization": f"{os.getenv('GAME_SERVICE_TOKEN')}",
             "Client_token": self.jwt_token
         }
         return headers
 
+    def outbox_credentials(self):
+        # token du joueur garde en memoire par la boite d'envoi jusqu'a son exp
+        return {
+            'user_token': self.jwt_token,
+            'expires': self.claims.get('exp') if self.claims is not None else None,
+        }
+
     def generate_gameover_data(self):
         data = {
             'type': 'gameover',
@@ -695,27 +680,40 @@ class PongConsumer(AsyncWebsocketConsumer):
     #             return False
     #     return True
 
+    # (expediteur, type) -> gestionnaire ; "cli" est traite comme "front"
+    EVENT_HANDLERS = {
+        ("front", "resumeOnGoal"): "handle_resume_on_goal",
+        ("front", "greetings"): "get_player_name",
+        ("front", "start"): "handle_start",
+        ("front", "keyDown"): "handle_key_down",
+        ("front", "keyframe"): "handle_keyframe_request",
+        ("AI", "greetings"): "handle_ai_greetings",
+        ("AI", "move"): "handle_ai_move",
+        ("AI", "observation_rate"): "handle_observation_rate",
+        ("AI", "keyframe"): "handle_keyframe_request",
+        ("game", "gameover"): "handle_game_input",
+    }
+
     async def receive(self, text_data):
-        # Traiter les messages reçus du client
-        current_time = time.time()
-        if current_time - self.message_timestamp >= 1/80 or not text_data.startswith("{\"type\":\"keyDown"):
-            self.message_timestamp = time.time()
-            try:
-                event = json.loads(text_data)
-                if event["sender"] == "front" or event["sender"] == "cli":
-                    await self.handle_front_input(event)
-                elif event["sender"] == "AI":
-                    await self.handle_ai_input(event)
-                    # self.game_wrapper.waiting_for_ai.set()
-                elif event["sender"] == "game":
-                    await self.handle_game_input(event)
-            except Exception as e:
-                self.logger.info(f"Error in receive: {e}")
-                await self.disconnect(4004)
-                await self.close(4004)
-                return
-        # else:
-        #     logging.info(f"SPAMMMMMMMMMMMMMMMMMMMMM")
+        # Traiter les messages reçus du client : les entrees sont deposees dans le tampon
+        # de la partie (la plus recente gagne), il n'y a donc plus besoin d'en jeter
+        try:
+            event = parse_input_fast(text_data) or json.loads(text_data)
+            sender = event["sender"]
+            if sender == "cli":
+                sender = "front"
+            if sender == "front":
+                self.client = ClientType.FRONT
+            elif sender == "AI":
+                self.client = ClientType.AI
+            handler = self.EVENT_HANDLERS.get((sender, event["type"]))
+            if handler is not None:
+                await getattr(self, handler)(event)
+        except Exception as e:
+            self.logger.info(f"Error in receive: {e}")
+            await self.disconnect(4004)
+            await self.close(4004)
+            return
 
     
     async def handle_game_input(self, event):
@@ -726,231 +724,222 @@ class PongConsumer(AsyncWebsocketConsumer):
             return
 
 
-    async def handle_ai_input(self, event):
-        self.client = ClientType.AI
-        if event["type"] == "greetings":
-            self.game_wrapper.ai_is_initialized.set()
-            self.game_wrapper.received_names.set()
-            self.game_wrapper.received_names.set()
-        if event["type"] == "move":
+    async def handle_keyframe_request(self, event):
+        self.needs_keyframe = True
+
+    async def handle_observation_rate(self, event):
+        # nombre d'observations par seconde, plafonne a une par frame
+        game = self.game_wrapper.game
+        game.ai_observation_rate = min(max(float(event["rate"]), 0.1), game.frame_rate)
+
+    async def handle_ai_greetings(self, event):
+        self.game_wrapper.mark_ready("ai")
+        self.game_wrapper.mark_ready("names")
+
+    async def handle_ai_move(self, event):
 #             # logging.info(f"AI move event: {event}\n\n")
-            if event["direction"] == "up":
-                if self.side == "p1":
-                    self.game_wrapper.player_1.action = 1
-                else:
-                    self.game_wrapper.player_2.action = 1
-            elif event["direction"] == "down":
-                if self.side == "p1":
-                    self.game_wrapper.player_1.action = -1
-                else:
-                    self.game_wrapper.player_2.action = -1
-            else:
-                if self.side == "p1":
-                    self.game_wrapper.player_1.action = 0
-                else:
-                    self.game_wrapper.player_2.action = 0
+        action = AI_ACTIONS.get(event["direction"], 0)
+        self.game_wrapper.game.inputs.push(0 if self.side == "p1" else 1, action)
 
     async def handle_player1_input(self, event):
         if event["player"] == "p1" and self.side == "p1":
-            self.game_wrapper.player_1.action = event["value"][0]
+            self.game_wrapper.game.inputs.push(0, event["value"][0])
 
     async def handle_player2_input(self, event):
         if event["player"] == "p2" and self.side == "p2":
-            self.game_wrapper.player_2.action = event["value"][1]
+            self.game_wrapper.game.inputs.push(1, event["value"][1])
 
 
     async def get_player_name(self, event):
         # logging.info(f"got in get_player_name: {event}")
-        if "name" not in event:
-            # logging.error("got no name")
-            # logging.info(f"present_players: {self.game_wrapper.present_players}, all_players_connected: {self.game_wrapper.all_players_connected}")
-            if self.game_wrapper.present_players == 2:
-                self.game_wrapper.received_names.set()
-                # logging.info("received names set, DIDNT RECEIVE ANY")
-            return
-        names = event["name"]
-        # logging.info(f"received names: {names}")
-        if len(names) != 2:
-            if self.side == "p1":
-                self.game_wrapper.player_1.name = event["name"][0]
-            else:
-                self.game_wrapper.player_2.name = event["name"][1]
-        else:
-            self.game_wrapper.player_1.name = event["name"][0]
-            self.game_wrapper.player_2.name = event["name"][1]
-        await asyncio.sleep(1)
-        for client in self.clients[self.group_name]:
-            await client.send(json.dumps({
-                           "type": "names",
-                           "p1": self.game_wrapper.player_1.name,
-                           "p2": self.game_wrapper.player_2.name
-                           }))
-        self.game_wrapper.received_names.set()
-        await asyncio.sleep(1)
-        for client in self.clients[self.group_name]:
-            await client.send(json.dumps({
-                           "type": "names",
-                           "p1": self.game_wrapper.player_1.name,
-                           "p2": self.game_wrapper.player_2.name
-                           }))
-        self.game_wrapper.received_names.set()
-
-
-    async def handle_front_input(self, event):
-        self.client = ClientType.FRONT
-        # logging.info(f"got in handle_front_input: {event}")
-        if event["type"] == "resumeOnGoal":
-            # logging.info(f"got resumeOnGoal")
-            if self.mode == "PVP_LAN":
+        if "name" in event:
+            names = event["name"]
+            # logging.info(f"received names: {names}")
+            if len(names) != 2:
                 if self.side == "p1":
-                    self.game_wrapper.player_1.is_ready_for_next_point = True
-                elif self.side == "p2":
-                    self.game_wrapper.player_2.is_ready_for_next_point = True
-                if self.game_wrapper.player_1.is_ready_for_next_point == True and self.game_wrapper.player_2.is_ready_for_next_point == True:
-                    self.game_wrapper.player_1.is_ready_for_next_point = False
-                    self.game_wrapper.player_2.is_ready_for_next_point = False
-                    await self.game_wrapper.game.resume_on_goal()
-                    self.game_wrapper.has_resumed.set()
+                    self.game_wrapper.player_1.name = event["name"][0]
+                else:
+                    self.game_wrapper.player_2.name = event["name"][1]
             else:
+                self.game_wrapper.player_1.name = event["name"][0]
+                self.game_wrapper.player_2.name = event["name"][1]
+        if "init" in self.game_wrapper.ready:
+            # noms arrives apres le message d'init
+            for client in self.game_wrapper.clients:
+                await client.send(json.dumps({
+                               "type": "names",
+                               "p1": self.game_wrapper.player_1.name,
+                               "p2": self.game_wrapper.player_2.name
+                               }))
+        elif self.game_wrapper.all_players_connected:
+            self.game_wrapper.mark_ready("names")
+
+
+    async def handle_resume_on_goal(self, event):
+        # logging.info(f"got resumeOnGoal")
+        if self.mode == "PVP_LAN":
+            if self.side == "p1":
+                self.game_wrapper.player_1.is_ready_for_next_point = True
+            elif self.side == "p2":
+                self.game_wrapper.player_2.is_ready_for_next_point = True
+            if self.game_wrapper.player_1.is_ready_for_next_point == True and self.game_wrapper.player_2.is_ready_for_next_point == True:
+                self.game_wrapper.player_1.is_ready_for_next_point = False
+                self.game_wrapper.player_2.is_ready_for_next_point = False
                 await self.game_wrapper.game.resume_on_goal()
-                self.game_wrapper.has_resumed.set()
-    
-        if event["type"] == "greetings":
-            await self.get_player_name(event)
-            return
-        
-        elif event["type"] == "start":
-            # logging.info(f"got start from {event["sender"]}")
-            if self.mode == "PVE":
-                if self.side == "p1":
-                    self.game_wrapper.player_1.is_ready = True
-                    self.game_wrapper.start_event.set()
-                elif self.side == "p2":
-                    self.game_wrapper.player_2.is_ready = True
-                    self.game_wrapper.start_event.set()
-            elif self.mode == "PVP_keyboard":
-                self.game_wrapper.start_event.set()
-            elif self.mode == "PVP_LAN":
-                if self.side == "p1":
-                    self.game_wrapper.player_1.is_ready = True
-                elif self.side == "p2":
-                    self.game_wrapper.player_2.is_ready = True
-                if self.game_wrapper.player_1.is_ready == True and self.game_wrapper.player_2.is_ready == True:
-                    self.game_wrapper.start_event.set()
-
-        elif event["type"] == "keyDown" and self.sleeping is False:
-            # logging.info("got keydown from front")
-            # logging.info(f"mode: {self.mode}")
-            # logging.info(f"GameModePVP_KEYBOARD: {GameMode.PVP_KEYBOARD.value}")
-            # if event["event"] == "pause":
-            #     if self.mode == GameMode.PVE.value or self.mode == GameMode.PVP_KEYBOARD.value:
-            #         self.game_wrapper.game.pause = not self.game_wrapper.game.pause
-            if self.mode == GameMode.PVP_KEYBOARD.value:
-                await self.handle_PVP_keyboard_input(event)
-            else:
-                if self.side == "p1":
-                    await self.handle_player1_input(event)
-                if self.side == "p2":
-                    await self.handle_player2_input(event)
+                self.game_wrapper.has_resumed = True
+        else:
+            await self.game_wrapper.game.resume_on_goal()
+            self.game_wrapper.has_resumed = True
+
+    async def handle_start(self, event):
+        # logging.info(f"got start from {event["sender"]}")
+        if self.mode == "PVE":
+            if self.side == "p1":
+                self.game_wrapper.player_1.is_ready = True
+                self.game_wrapper.mark_ready("start")
+            elif self.side == "p2":
+                self.game_wrapper.player_2.is_ready = True
+                self.game_wrapper.mark_ready("start")
+        elif self.mode == "PVP_keyboard":
+            self.game_wrapper.mark_ready("start")
+        elif self.mode == "PVP_LAN":
+            if self.side == "p1":
+                self.game_wrapper.player_1.is_ready = True
+            elif self.side == "p2":
+                self.game_wrapper.player_2.is_ready = True
+            if self.game_wrapper.player_1.is_ready == True and self.game_wrapper.player_2.is_ready == True:
+                self.game_wrapper.mark_ready("start")
+
+    async def handle_key_down(self, event):
+        if self.mode == GameMode.PVP_KEYBOARD.value:
+            await self.handle_PVP_keyboard_input(event)
+        else:
+            if self.side == "p1":
+                await self.handle_player1_input(event)
+            if self.side == "p2":
+                await self.handle_player2_input(event)
 
     async def handle_PVP_keyboard_input(self, event):
         # logging.info(f"got in PVP_keyboard_input")
         value = event["value"]
-        # logging.info(f"value: {value}")
-        # logging.info(f"value [0]: {value[0]}")
-        self.game_wrapper.player_1.action = value[0]
-        self.game_wrapper.player_2.action = value[1]
+        inputs = self.game_wrapper.game.inputs
+        inputs.push(0, value[0])
+        inputs.push(1, value[1])
 
 
     async def generate_states(self):
         try:
             # self.logger.info("in generate states")
-            await self.game_wrapper.ai_is_initialized.wait()
-            # self.logger.info("in generate states, ai is initialized")
-            await self.game_wrapper.received_names.wait()
-            # self.logger.info("in generate states, names received")
-            await self.game_wrapper.start_event.wait()
+            wrapper = self.game_wrapper
+            self.wait_for_handshake()
+            # chaque attente se termine aussi si la partie est annulee entre-temps
+            if not await wrapper.wait_until(lambda w: {"ai", "names"} <= w.ready):
+                return
+            # self.logger.info("in generate states, ai is initialized and names received")
+            if not await self.send_init():
+                return
+            # le "start" des clients dit qu'ils sont prets
+            if not await wrapper.wait_until(lambda w: "start" in w.ready):
+                return
+            if not wrapper.transition(GameStatus.IN_PROGRESS):
+                return
             # self.logger.info("state gen set")
             x = 0
-            self.sleeping = True
-            await asyncio.sleep(2)
-            self.sleeping = False
             # logging.info("starting game")
-            
-            async for state in self.game_wrapper.game.rungame():
+
+            frames = asyncio.Queue()
+            stream = delta_stream.DeltaStream()
+            if not game_manager.start_game(self.game_id, frames.put_nowait):
+                return
+
+            while True:
+                state_dict = await frames.get()
+                if state_dict is None:
+                    # la partie a quitte le scheduler
+                    return
                 # Vérifier si game_wrapper existe encore
                 if not hasattr(self, 'game_wrapper') or self.game_wrapper is None:
                     # logging.info("Game wrapper no longer exists, stopping generate_states")
                     return
                     
-                state_dict = json.loads(state)
+                observation = state_dict.pop("observation", None)
                 state_dict["game_mode"] = self.mode
                 
-                if self.game_wrapper.has_resumed.is_set() is False:
-                    state_dict["resumeOnGoal"] = False
-                else:
-                    state_dict["resumeOnGoal"] = True
-                    self.game_wrapper.has_resumed.clear()
+                state_dict["resumeOnGoal"] = self.game_wrapper.has_resumed
+                self.game_wrapper.has_resumed = False
+                # pause apres un but (ou une deconnexion) et reprise, vues dans la frame
+                if state_dict["game"]["pause"]:
+                    if self.game_wrapper.status is GameStatus.IN_PROGRESS:
+                        self.game_wrapper.transition(GameStatus.PAUSED)
+                elif self.game_wrapper.status is GameStatus.PAUSED:
+                    self.game_wrapper.transition(GameStatus.IN_PROGRESS)
     
                 try:
                     if state_dict['winner'] is not None:
-                        winner = state_dict['winner']
-                    else:
-                        winner = None
+                        state_dict = await self.determine_winner(state_dict, state_dict['winner'], None)
     
                     # Vérifier à nouveau si le groupe existe encore
-                    if not hasattr(self, 'group_name') or self.group_name not in self.clients:
+                    clients = self.game_wrapper.clients
+                    if not clients:
                         # logging.info("Group no longer exists, stopping generate_states")
                         return
-    
-                    for client in self.clients[self.group_name]:
-                        state_dict['side'] = client.side
-                        if winner is not None:
-                            state_dict = await self.determine_winner(state_dict, winner, client)
-                        await client.send(text_data=json.dumps(state_dict))
-                        await asyncio.sleep(0.0000001)
+
+                    # frame encodee une seule fois par format, seul "side" (dernier champ) change par client
+                    json_frame = binary_frame = keyframe = delta_frame = observation_frame = None
+                    gameover = state_dict["gameover"] is not None
+                    if any(client.delta and not client.binary for client in clients):
+                        seq, delta = stream.push(state_dict)
+                    for client in clients:
+                        if client.is_ai and not gameover:
+                            # l'IA ne recoit que ses observations, et la frame de fin de partie
+                            if observation is None:
+                                continue
+                            if observation_frame is None:
+                                observation_frame = json.dumps(observation)[:-1]
+                            client.frame_sender.push(text_data=observation_frame + client.side_suffix())
+                        elif client.binary:
+                            if binary_frame is None:
+                                binary_frame = wire.encode_frame(state_dict)
+                            client.frame_sender.push(bytes_data=binary_frame + wire.side_suffix(client.side))
+                        elif client.delta and (delta is None or client.needs_keyframe or client.frame_sender.has_pending):
+                            # un delta ecrase avant d'etre parti casserait la chaine : keyframe a la place
+                            client.needs_keyframe = False
+                            if keyframe is None:
+                                keyframe = json.dumps({**state_dict, "seq": seq})[:-1]
+                            client.frame_sender.push(text_data=keyframe + client.side_suffix())
+                        elif client.delta:
+                            if delta_frame is None:
+                                delta_frame = delta_stream.encode(seq, delta)
+                            client.frame_sender.push(text_data=delta_frame)
+                        else:
+                            if json_frame is None:
+                                json_frame = json.dumps(state_dict)[:-1]
+                            client.frame_sender.push(text_data=json_frame + client.side_suffix())
                         
                     if state_dict["gameover"] == "Score":
-                        self.game_wrapper.game_over.set()
+                        # la derniere frame part avant le message de fin de partie
+                        for client in clients:
+                            await client.frame_sender.flush()
+                        self.game_wrapper.transition(GameStatus.FINISHED)
                         await self.handle_gameover_score_limit()
                         return
-                        
-                    await self.move_paddles()
     
                 except Exception as e:
                     logging.error(f"Error in generate_states loop: {str(e)}")
                     return
     
                 x += 1
-                await asyncio.sleep(0.00000001)
 
         except Exception as e:
             logging.error(f"Error in generate_states: {str(e)}")
             return
 
-    async def move_paddles(self):
-        asyncio.create_task(self._move_paddle_1())
-        asyncio.create_task(self._move_paddle_2())
-
-    async def _move_paddle_1(self):
-        if self.game_wrapper.player_1.action == 1:
-            for _ in range(5):
-                await self.game_wrapper.game.paddle1.move(self.game_wrapper.game.height, up=True)
-                await asyncio.sleep(0)
-        elif self.game_wrapper.player_1.action == -1:
-            for _ in range(5):
-                await self.game_wrapper.game.paddle1.move(self.game_wrapper.game.height, up=False)
-                await asyncio.sleep(0)
-
-    async def _move_paddle_2(self):
-        if self.game_wrapper.player_2.action == 1:
-            for _ in range(5):
-                await self.game_wrapper.game.paddle2.move(self.game_wrapper.game.height, up=True)
-                await asyncio.sleep(0)
-        elif self.game_wrapper.player_2.action == -1:
-            for _ in range(5):
-                await self.game_wrapper.game.paddle2.move(self.game_wrapper.game.height, up=False)
-                await asyncio.sleep(0)
+        finally:
+            game_manager.stop_game(self.game_id)
+
+    def side_suffix(self):
+        # fin de frame propre a ce client, identique a ce que json.dumps produirait
+        return f', "side": {json.dumps(self.side)}}}'
 
     async def determine_winner(self, state_dict, winner, client):
         state_dict["winner"] = winner
@@ -958,20 +947,18 @@ class PongConsumer(AsyncWebsocketConsumer):
 
     async def handle_gameover_score_limit(self):
         try:
-            url = 'http://nginx:7777/game/new/'
-            csrf_token = await self.scope['session'].get('csrf_token', get_new_csrf_string_async())
+            url = f'{BACKEND_HTTP_URL}/game/new/'
             data = self.generate_gameover_data()
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                        url,
-                        json= data,
-                        headers= self.generate_headers(csrf_token),
-                        cookies= {'csrftoken': csrf_token}
-                ) as response:
-                    if response.status == 403:
-                        logging.error("CSRF validation failed")
-                        return None
+            # envoye plus tard par la boite d'envoi, la fin de partie n'attend pas le backend
+            outbox.enqueue(
+                    f"game_new:{self.game_id}",
+                    'POST',
+                    url,
+                    json= data,
+                    auth= AUTH_HEADERS,
+                    **self.outbox_credentials()
+            )
 
             await self.send_gameover_to_remaining_client(data)
 
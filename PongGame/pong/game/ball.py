@@ -1,5 +1,4 @@
 import math
-import time
 import copy
 import random
 from .paddle import Paddle
@@ -7,7 +6,9 @@ import logging
 
 class Ball:
     
-    def __init__(self, x, y, radius, win_width, win_height):
+    def __init__(self, x, y, radius, win_width, win_height, rng=None):
+        # generateur aleatoire de la partie (module random par defaut)
+        self.rng = rng if rng is not None else random
         self.lastTouch = 0
         self.touchedWall = None
         self.x = x
@@ -17,32 +18,40 @@ class Ball:
         self.max_speed = self.win_width * self.win_height / 2500000
         self.radius = radius
         self.x_vel = self.max_speed / 2.5
-        if random.choice((1, 2)) == 1:
+        if self.rng.choice((1, 2)) == 1:
             self.x_vel = -self.x_vel
         self.y_vel = 0
-        self.frictionTimestamp = time.time()
+        # temps de simulation (secondes) du dernier freinage
+        self.frictionTimestamp = 0
+        # change a chaque modification de trajectoire (raquette, bord, reset, freinage) ;
+        # les predictions de collision sont mises en cache pour une trajectoire donnee
+        self.trajectory_epoch = 0
+        self._collisionCache = {}
+        self._collisionCacheEpoch = -1
 
 
-    def move(self):
-        self.x += self.x_vel
-        self.y += self.y_vel
+    def move(self, scale=1.0):
+        # les vitesses sont exprimees en pixels par tick de reference (1 ms)
+        self.x += self.x_vel * scale
+        self.y += self.y_vel * scale
 
 
     def reset(self, x):
         self.x = self.win_width // 2
         self.y = self.win_height // 2
         if x > 0:
-            goalAngle = random.uniform(-30, 30)
+            goalAngle = self.rng.uniform(-30, 30)
         else:
-            rng = random.choice((1, 2))
+            rng = self.rng.choice((1, 2))
             if rng == 1:
-                goalAngle = random.uniform(-150, -180)
+                goalAngle = self.rng.uniform(-150, -180)
             else:
-                goalAngle = random.uniform(150, 180)
+                goalAngle = self.rng.uniform(150, 180)
         angle_rad = math.radians(goalAngle)
         speed = self.max_speed / 3.5
         self.x_vel = speed * math.cos(angle_rad)
         self.y_vel = speed * math.sin(angle_rad)
+        self.trajectory_epoch += 1
 
 
     # matrix
@@ -52,14 +61,12 @@ class Ball:
     #          |
     #          90
 
-    def updateTrajectoryP2(self, paddle):
+    def updateTrajectoryP2(self, paddle, now):
 
-        currentTs = time.time()
-
-        if paddle.lastTouch > currentTs - 0.5:
+        if paddle.lastTouch > now - 0.5:
             return
         
-        paddle.lastTouch = currentTs
+        paddle.lastTouch = now
         currentSpeed = math.sqrt(self.x_vel ** 2 + self.y_vel ** 2)
         relativeImpactPoint = (self.y - paddle.y) / paddle.height
         currentAngle = math.degrees(math.atan2(self.y_vel, self.x_vel))
@@ -109,6 +116,7 @@ class Ball:
                     goalAngle = 130
 
         self.lastTouch = "2"
+        self.trajectory_epoch += 1
 
         self.x_vel = currentSpeed * (1 + (1 * (1-(currentSpeed / self.max_speed)))) * math.cos(math.radians(goalAngle))
         self.y_vel = currentSpeed * (1 + (1 * (1 - (currentSpeed / self.max_speed)))) * math.sin(math.radians(goalAngle))
@@ -123,14 +131,12 @@ class Ball:
             self.y_vel = self.y_vel / math.sqrt(self.x_vel ** 2 + self.y_vel ** 2) * self.max_speed
 
 
-    def updateTrajectoryP1(self, paddle):
-
-        currentTs = time.time()
+    def updateTrajectoryP1(self, paddle, now):
 
-        if paddle.lastTouch > currentTs - 0.5:
+        if paddle.lastTouch > now - 0.5:
             return
         
-        paddle.lastTouch = currentTs
+        paddle.lastTouch = now
         currentSpeed = math.sqrt(self.x_vel ** 2 + self.y_vel ** 2)
         relativeImpactPoint = (self.y - paddle.y) / paddle.height
         currentAngle = math.degrees(math.atan2(self.y_vel, self.x_vel))
@@ -182,6 +188,7 @@ class Ball:
                     self.x += 2
 
         self.lastTouch = "1"
+        self.trajectory_epoch += 1
 
         self.x_vel = currentSpeed * (1 + (1* (1-(currentSpeed / self.max_speed)))) * math.cos(math.radians(goalAngle))
         self.y_vel = currentSpeed * (1 + (1 * (1 - (currentSpeed / self.max_speed)))) * math.sin(math.radians(goalAngle))
@@ -205,7 +212,121 @@ class Ball:
         return False
 
 
-    def calculateNextCollisionPosition(self, paddle:Paddle):
+    def timeOfImpact(self, paddle:Paddle, dx, dy):
+        # fraction t du deplacement (dx, dy), dans [0, 1], a laquelle la balle touche la raquette ;
+        # meme boite que check_collision : la raquette elargie du rayon de la balle
+        enter, leave = 0.0, 1.0
+        for position, delta, low, high in (
+                (self.x, dx, paddle.x - self.radius, paddle.x + paddle.width + self.radius),
+                (self.y, dy, paddle.y - self.radius, paddle.y + paddle.height + self.radius)):
+            if delta == 0:
+                if position <= low or position >= high:
+                    return None
+                continue
+            t0 = (low - position) / delta
+            t1 = (high - position) / delta
+            if t0 > t1:
+                t0, t1 = t1, t0
+            enter = max(enter, t0)
+            leave = min(leave, t1)
+            if enter >= leave:
+                return None
+        return enter
+
+
+    def calculateNextCollisionPosition(self, paddle:Paddle, scale=1.0):
+        """
+        Position [cote, y] de la balle quand elle atteindra la raquette ou la ligne de but.
+        Meme resultat que simulateNextCollisionPosition, mais calcule directement :
+        le nombre de pas jusqu'a l'arrivee se deduit de x et x_vel, puis la hauteur
+        est deroulee rebond par rebond (un calcul par rebond au lieu d'un par pas).
+        Un pas deplace la balle de sa vitesse * scale, comme Ball.move.
+        """
+        res = []
+        if paddle.x < self.win_width // 2:
+            res.append(-1)
+        else:
+            res.append(1)
+
+        if self.check_collision(paddle) or self.x <= 0 or self.x >= self.win_width or self.x_vel == 0:
+            res.append(self.y)
+            return res
+
+        steps = self.stepsToReach(paddle, scale)
+
+        # hauteur apres `steps` pas : la vitesse verticale s'inverse des que la balle
+        # touche un bord (y - radius <= 0 ou y + radius >= hauteur), sans correction de position
+        low = self.radius
+        high = self.win_height - self.radius
+        y = self.y
+        y_vel = self.y_vel * scale
+        while steps > 0 and y_vel != 0:
+            if y + y_vel <= low or y + y_vel >= high:
+                bounce = 1
+            elif y_vel > 0:
+                bounce = math.ceil((high - y) / y_vel)
+            else:
+                bounce = math.ceil((low - y) / y_vel)
+            if bounce > steps:
+                y += steps * y_vel
+                break
+            y += bounce * y_vel
+            y_vel = -y_vel
+            steps -= bounce
+
+        res.append(y)
+        return res
+
+
+    def cachedNextCollisionPosition(self, paddle:Paddle, scale=1.0):
+        # la position d'arrivee ne change pas tant que la trajectoire reste la meme, sauf quand
+        # la balle chevauche deja la raquette, est sortie du terrain ou ne bouge plus en x
+        # (le resultat est alors sa position, obtenu sans derouler la trajectoire)
+        if self.check_collision(paddle) or self.x <= 0 or self.x >= self.win_width or self.x_vel == 0:
+            return self.calculateNextCollisionPosition(paddle, scale)
+        if self._collisionCacheEpoch != self.trajectory_epoch:
+            self._collisionCache = {}
+            self._collisionCacheEpoch = self.trajectory_epoch
+        # dans la bande de la raquette (sans la toucher), l'arrivee est le pas suivant ;
+        # une fois la raquette depassee sans renvoi, c'est la ligne de but
+        left = paddle.x - self.radius
+        right = paddle.x + paddle.width + self.radius
+        if self.x_vel > 0:
+            entered, passed = self.x >= left, self.x >= right
+        else:
+            entered, passed = self.x <= right, self.x <= left
+        if entered and not passed:
+            return self.calculateNextCollisionPosition(paddle, scale)
+        key = (paddle.x, scale, passed)
+        res = self._collisionCache.get(key)
+        if res is None:
+            res = self.calculateNextCollisionPosition(paddle, scale)
+            self._collisionCache[key] = res
+        return res
+
+
+    def stepsToReach(self, paddle:Paddle, scale=1.0):
+        # nombre de pas avant que la balle touche la raquette (sur l'axe x) ou sorte du terrain
+        left = paddle.x - self.radius
+        right = paddle.x + paddle.width + self.radius
+        x_vel = self.x_vel * scale
+        if x_vel > 0:
+            steps = math.ceil((self.win_width - self.x) / x_vel)
+            if self.x < right:
+                to_paddle = max(1, math.floor((left - self.x) / x_vel) + 1)
+                if self.x + to_paddle * x_vel < right:
+                    steps = min(steps, to_paddle)
+        else:
+            steps = math.ceil(self.x / -x_vel)
+            if self.x > left:
+                to_paddle = max(1, math.floor((self.x - right) / -x_vel) + 1)
+                if self.x + to_paddle * x_vel > left:
+                    steps = min(steps, to_paddle)
+        return steps
+
+
+    def simulateNextCollisionPosition(self, paddle:Paddle, scale=1.0):
+        # version pas a pas, gardee comme reference pour calculateNextCollisionPosition
         res = []
         if paddle.x < self.win_width // 2:
             res.append(-1)
@@ -217,8 +338,8 @@ class Ball:
         # Déplacement de la balle jusqu'à ce qu'elle atteigne la position x = paddle2_x
         while tempBall.check_collision(tempPaddle) == False and tempBall.x > 0 and tempBall.x < self.win_width:
             # Calcule la nouvelle position de la balle en ajoutant la vitesse de la balle à sa position actuelle
-            tempBall.x = tempBall.x + tempBall.x_vel
-            tempBall.y = tempBall.y + tempBall.y_vel
+            tempBall.x = tempBall.x + tempBall.x_vel * scale
+            tempBall.y = tempBall.y + tempBall.y_vel * scale
             tempPaddle.y = tempBall.y
 
             # Vérifie si la nouvelle position de la balle dépasse les bords du terrain
@@ -239,13 +360,13 @@ class Ball:
         res["touchedWall"] = self.touchedWall
         res["rounded_angle"] = round((math.atan2(self.y_vel, self.x_vel)), 2)
         res["rounded_angle"] = round(math.atan2(self.y_vel, self.x_vel) * 2) / 2
-        res["next_collision"] = self.calculateNextCollisionPosition(game.paddle2)
         self.touchedWall = None
 
         return res
-    def friction(self):
-        if time.time() - self.frictionTimestamp > 0.4 and math.sqrt(self.x_vel ** 2 + self.y_vel ** 2) > self.max_speed / 5:
-            self.frictionTimestamp = time.time()
+    def friction(self, now):
+        if now - self.frictionTimestamp > 0.4 and math.sqrt(self.x_vel ** 2 + self.y_vel ** 2) > self.max_speed / 5:
+            self.frictionTimestamp = now
+            self.trajectory_epoch += 1
             self.x_vel = self.x_vel * 0.93
             self.y_vel = self.y_vel * 0.93
 
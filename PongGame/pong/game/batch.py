@@ -0,0 +1,218 @@
+import numpy as np
+
+from .game import Game
+
+
+# (tableau, objet porteur, attribut, dtype) : un tableau numpy par champ, une case par partie
+_FIELDS = (
+    ("x", "ball", "x", np.float64),
+    ("y", "ball", "y", np.float64),
+    ("x_vel", "ball", "x_vel", np.float64),
+    ("y_vel", "ball", "y_vel", np.float64),
+    ("friction_ts", "ball", "frictionTimestamp", np.float64),
+    ("epoch", "ball", "trajectory_epoch", np.int64),
+    ("p1_y", "paddle1", "y", np.float64),
+    ("p1_can_move", "paddle1", "canMove", np.bool_),
+    ("score1", "paddle1", "score", np.int64),
+    ("p2_y", "paddle2", "y", np.float64),
+    ("p2_can_move", "paddle2", "canMove", np.bool_),
+    ("score2", "paddle2", "score", np.int64),
+    ("tick", None, "tick", np.int64),
+    ("last_frame_time", None, "last_frame_time", np.float64),
+    ("pause", None, "pause", np.bool_),
+    ("goal1", None, "goal1", np.bool_),
+    ("goal2", None, "goal2", np.bool_),
+    ("new_calc", None, "NewCalculusNeeded", np.bool_),
+)
+
+# champs de configuration, lus une seule fois et jamais reecrits
+_CONFIG = (
+    ("radius", "ball", "radius", np.float64),
+    ("max_speed", "ball", "max_speed", np.float64),
+    ("p1_x", "paddle1", "x", np.float64),
+    ("p1_w", "paddle1", "width", np.float64),
+    ("p1_h", "paddle1", "height", np.float64),
+    ("p2_x", "paddle2", "x", np.float64),
+    ("p2_w", "paddle2", "width", np.float64),
+    ("p2_h", "paddle2", "height", np.float64),
+    ("p1_vel", "paddle1", "vel", np.float64),
+    ("p2_vel", "paddle2", "vel", np.float64),
+    ("width", None, "width", np.float64),
+    ("height", None, "height", np.float64),
+    ("tick_rate", None, "tick_rate", np.float64),
+    ("frame_rate", None, "frame_rate", np.float64),
+)
+
+_WALL_CODES = {None: 0, "top": 1, "bottom": 2}
+_WALL_NAMES = (None, "top", "bottom")
+
+
+def _owner(game, name):
+    return game if name is None else getattr(game, name)
+
+
+class BatchPhysics:
+    """
+    Moteur vectorise : l'etat de toutes les parties est charge dans des tableaux numpy
+    et chaque tick (Game.step) est execute pour toutes les parties a la fois.
+    Les evenements rares (renvoi par une raquette, nouvelle prediction) sont delegues
+    aux methodes scalaires de Ball / Game sur la partie concernee, pour garder
+    exactement les memes trajectoires.
+    Seule la detection discrete des collisions est vectorisee : les parties avec
+    swept_collisions sont refusees (le scheduler les fait avancer une par une).
+
+    Le lot peut etre garde d'une frame a l'autre : sync() ne recharge que les actions des
+    joueurs et les parties modifiees hors du lot depuis (Game.revision), emitted() reporte
+    une frame envoyee.
+    """
+
+    def __init__(self, games):
+        self.games = list(games)
+        if any(game.swept_collisions for game in self.games):
+            raise ValueError("BatchPhysics ne gere pas swept_collisions")
+        self.index = {game: i for i, game in enumerate(self.games)}
+        self.load()
+
+
+    def load(self):
+        for name, owner, attr, dtype in _FIELDS + _CONFIG:
+            values = [getattr(_owner(game, owner), attr) for game in self.games]
+            setattr(self, name, np.array(values, dtype=dtype))
+        self.touched_wall = np.array([_WALL_CODES[game.ball.touchedWall] for game in self.games], dtype=np.int8)
+        # actions des joueurs, fixes pour toute la duree du lot
+        self.action1 = np.array([game.players[0].action for game in self.games], dtype=np.int64)
+        self.action2 = np.array([game.players[1].action for game in self.games], dtype=np.int64)
+        self.revisions = [game.revision for game in self.games]
+
+
+    def sync(self):
+        # actions echantillonnees pour le prochain lot, et parties reprises ou arretees entre-temps
+        self.action1 = np.array([game.players[0].action for game in self.games], dtype=np.int64)
+        self.action2 = np.array([game.players[1].action for game in self.games], dtype=np.int64)
+        for i, game in enumerate(self.games):
+            if game.revision != self.revisions[i]:
+                self._load_game(i)
+
+
+    def emitted(self, game):
+        # Game.emit_frame : last_frame_time avance, serialize() remet touchedWall a None
+        i = self.index.get(game)
+        if i is not None:
+            self.last_frame_time[i] = game.last_frame_time
+            self.touched_wall[i] = 0
+
+
+    def store(self):
+        columns = [(owner, attr, getattr(self, name).tolist()) for name, owner, attr, _ in _FIELDS]
+        walls = self.touched_wall.tolist()
+        for i, game in enumerate(self.games):
+            for owner, attr, values in columns:
+                setattr(_owner(game, owner), attr, values[i])
+            game.ball.touchedWall = _WALL_NAMES[walls[i]]
+            game.sim_time = game.tick / game.tick_rate
+
+
+    def _store_game(self, i):
+        game = self.games[i]
+        for name, owner, attr, _ in _FIELDS:
+            setattr(_owner(game, owner), attr, getattr(self, name)[i].item())
+        game.ball.touchedWall = _WALL_NAMES[self.touched_wall[i]]
+        game.sim_time = game.tick / game.tick_rate
+
+
+    def _load_game(self, i):
+        game = self.games[i]
+        for name, owner, attr, _ in _FIELDS:
+            getattr(self, name)[i] = getattr(_owner(game, owner), attr)
+        self.touched_wall[i] = _WALL_CODES[game.ball.touchedWall]
+        self.revisions[i] = game.revision
+
+
+    def _run_scalar(self, indices, action):
+        for i in indices:
+            self._store_game(i)
+            action(self.games[i])
+            self._load_game(i)
+
+
+    def _collides(self, px, py, pw, ph):
+        # Ball.check_collision
+        return ((self.x - self.radius < px + pw) &
+                (self.x + self.radius > px) &
+                (self.y - self.radius < py + ph) &
+                (self.y + self.radius > py))
+
+
+    def _move_paddle(self, y, action, distance, paddle_height):
+        # Paddle.move
+        up = np.maximum(y - distance, 0.0)
+        down = np.minimum(y + distance, self.height - paddle_height)
+        return np.where(action == 1, up, np.where(action == -1, down, y))
+
+
+    def step(self, ticks=1):
+        if ticks:
+            # Game.record_inputs : les actions du lot prennent effet a son premier tick
+            for i, game in enumerate(self.games):
+                game.record_inputs(int(self.tick[i]) + 1)
+        for _ in range(ticks):
+            self._step()
+
+
+    def _step(self):
+        self.tick += 1
+        sim_time = self.tick / self.tick_rate
+
+        if self.new_calc.any():
+            self._run_scalar(np.flatnonzero(self.new_calc), lambda game: game.update_prediction())
+
+        # Game.move_paddles
+        scale = Game.REFERENCE_TICK_RATE / self.tick_rate
+        self.p1_y = self._move_paddle(self.p1_y, self.action1, self.p1_vel * Game.PADDLE_STEPS_PER_TICK * scale, self.p1_h)
+        self.p2_y = self._move_paddle(self.p2_y, self.action2, self.p2_vel * Game.PADDLE_STEPS_PER_TICK * scale, self.p2_h)
+
+        active = ~self.pause
+
+        # Ball.move
+        self.x += np.where(active, self.x_vel * scale, 0.0)
+        self.y += np.where(active, self.y_vel * scale, 0.0)
+
+        # Ball.friction
+        speed = np.sqrt(self.x_vel ** 2 + self.y_vel ** 2)
+        braking = active & (sim_time - self.friction_ts > 0.4) & (speed > self.max_speed / 5)
+        self.friction_ts = np.where(braking, sim_time, self.friction_ts)
+        self.x_vel *= np.where(braking, 0.93, 1.0)
+        self.y_vel *= np.where(braking, 0.93, 1.0)
+        self.epoch += braking
+
+        # Game.handle_collisions_on_paddle : detection vectorisee, renvoi scalaire
+        epoch = self.epoch.copy()
+        hit1 = active & self._collides(self.p1_x, self.p1_y, self.p1_w, self.p1_h)
+        if hit1.any():
+            self._run_scalar(np.flatnonzero(hit1), lambda game: game.ball.updateTrajectoryP1(game.paddle1, game.sim_time))
+        hit2 = active & self._collides(self.p2_x, self.p2_y, self.p2_w, self.p2_h)
+        if hit2.any():
+            self._run_scalar(np.flatnonzero(hit2), lambda game: game.ball.updateTrajectoryP2(game.paddle2, game.sim_time))
+        # nouvelle prediction seulement pour les balles renvoyees
+        self.new_calc |= self.epoch != epoch
+
+        # Game.handle_collisions_on_border
+        top = self.y - self.radius <= 0
+        wall = active & (top | (self.y + self.radius >= self.height))
+        self.touched_wall = np.where(wall, np.where(top, 1, 2), self.touched_wall).astype(np.int8)
+        self.y_vel = np.where(wall, -self.y_vel, self.y_vel)
+        self.epoch += wall
+
+        # Game.handle_scores
+        goal2 = active & (self.x <= 0)
+        goal1 = active & (self.x >= self.width)
+        scored = goal1 | goal2
+        self.goal1 |= goal1
+        self.goal2 |= goal2
+        self.score1 += goal1
+        self.score2 += goal2
+        self.p1_can_move |= scored
+        self.p2_can_move |= scored
+        self.new_calc |= scored
+        self.pause |= scored
+        self.last_frame_time = np.where(scored, sim_time - 1 / self.frame_rate, self.last_frame_time)
@@ -0,0 +1,34 @@
+import asyncio
+import time
+
+
+class MonotonicClock:
+    """Horloge reelle, monotone : ne saute pas quand l'heure systeme est ajustee."""
+
+    def now(self):
+        return time.monotonic()
+
+    async def sleep(self, delay):
+        await asyncio.sleep(delay)
+
+
+class SimulatedClock:
+    """
+    Horloge simulee : sleep() avance le temps sans attendre. Une partie (ou le scheduler)
+    qui l'utilise tourne aussi vite que le CPU le permet, avec le meme comportement
+    qu'en jeu reel. Sert aux benchmarks, aux simulations en masse et aux tests.
+    """
+
+    def __init__(self, start=0.0):
+        self._now = start
+
+    def now(self):
+        return self._now
+
+    def advance(self, delay):
+        self._now += max(0.0, delay)
+
+    async def sleep(self, delay):
+        self.advance(delay)
+        # laisse tout de meme la main aux autres taches
+        await asyncio.sleep(0)
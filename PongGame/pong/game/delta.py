@@ -0,0 +1,85 @@
+"""
+Flux keyframe + delta, sous-protocole websocket "pong.delta.v1" (frames JSON).
+
+Une keyframe est une frame complete avec un numero de sequence "seq". Entre deux keyframes,
+le client recoit {"type": "delta", "seq": n, ...} avec seulement les champs qui ont change
+depuis la frame precedente (un niveau de profondeur pour game, ball, paddle1 et paddle2).
+Un trou dans les numeros de sequence veut dire qu'une frame a ete perdue : le client
+demande alors une keyframe avec {"type": "keyframe", "sender": ...}.
+"""
+
+import json
+import math
+
+
+SUBPROTOCOL = "pong.delta.v1"
+# une keyframe par seconde a 60 frames/s
+KEYFRAME_INTERVAL = 60
+NESTED = ("game", "ball", "paddle1", "paddle2")
+NUMBERS = (int, float)
+
+
+def diff(previous, frame):
+    delta = {}
+    for key, value in frame.items():
+        old = previous.get(key)
+        if key in NESTED and isinstance(value, dict) and isinstance(old, dict):
+            # game et les raquettes ne bougent presque jamais : egalite testee en C avant de descendre champ par champ
+            if value == old:
+                continue
+            changed = {field: item for field, item in value.items() if old.get(field) != item}
+            if changed:
+                delta[key] = changed
+        elif old != value or key not in previous:
+            delta[key] = value
+    return delta
+
+
+def encode(seq, delta):
+    """Meme texte que json.dumps({"type": "delta", "seq": seq, **delta}), sans passer par json quand le delta
+    ne contient que des nombres dans game, ball, paddle1 ou paddle2 (en pratique ball.x et ball.y)."""
+    blocks = []
+    for key, value in delta.items():
+        if key not in NESTED or type(value) is not dict:
+            return json.dumps({"type": "delta", "seq": seq, **delta})
+        fields = []
+        for field, item in value.items():
+            # repr d'un int ou d'un float fini == json.dumps ; bool, None, chaines et NaN passent par json
+            if type(item) not in NUMBERS or not math.isfinite(item):
+                return json.dumps({"type": "delta", "seq": seq, **delta})
+            fields.append(f'"{field}": {item!r}')
+        blocks.append(f'"{key}": {{{", ".join(fields)}}}')
+    if not blocks:
+        return f'{{"type": "delta", "seq": {seq}}}'
+    return f'{{"type": "delta", "seq": {seq}, {", ".join(blocks)}}}'
+
+
+def apply(state, delta):
+    """Applique un delta a la derniere frame connue et retourne la nouvelle frame."""
+    state = dict(state)
+    for key, value in delta.items():
+        if key == "type":
+            continue
+        if key in NESTED and isinstance(value, dict):
+            state[key] = {**state.get(key, {}), **value}
+        else:
+            state[key] = value
+    return state
+
+
+class DeltaStream:
+    """Numerote les frames d'une partie et calcule le delta de chacune par rapport a la precedente."""
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.previous = None
+
+
+    def push(self, frame):
+        """Retourne (seq, delta) ; delta vaut None quand une keyframe periodique est due."""
+        self.seq += 1
+        previous, self.previous = self.previous, frame
+        if previous is None or self.seq % self.keyframe_interval == 0:
+            return self.seq, None
+        return self.seq, diff(previous, frame)
@@ -1,24 +1,40 @@
-import logging
-
 from .paddle import Paddle
 from .ball import Ball
+from .clock import MonotonicClock
+from .player import Player
+from .input_log import InputLog
+from .input_buffer import InputBuffer
 import math
-import time
-import json
 import random
-import asyncio
 
 
 class Game:
 
-    def __init__(self):
+    # frequence a laquelle les vitesses de la balle et des raquettes sont exprimees
+    REFERENCE_TICK_RATE = 1000
+    MAX_CONTACTS_PER_TICK = 4
+
+    # deplacement des raquettes, en pas de paddle.vel par tick de reference
+    # (5 pas par frame a 60 frames/s, la vitesse d'origine)
+    PADDLE_STEPS_PER_TICK = 5 * 60 / REFERENCE_TICK_RATE
+
+    def __init__(self, clock=None, seed=None, players=None):
+        # horloge utilisee pour cadencer les ticks (reelle en jeu, simulee hors ligne)
+        self.clock = clock if clock is not None else MonotonicClock()
+        # tout l'aleatoire de la partie vient de ce generateur : une graine = un match rejouable
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        self.players = players if players is not None else (Player(), Player())
+        self.inputs = InputBuffer(self.players)
+        self.input_log = InputLog(self.seed)
+        self.logged_actions = [0, 0]
         self.width = 1500
         self.height = 1000
         self.white = (255, 255, 255)
         self.black = (0, 0, 0)
 
         # Init objects
-        self.ball: Ball = Ball(self.width // 2, self.height // 2, self.height // 100, self.width, self.height)
+        self.ball: Ball = Ball(self.width // 2, self.height // 2, self.height // 100, self.width, self.height, rng=self.rng)
         self.paddle1: Paddle = Paddle(self.width // 30, self.height // 2 - (self.height // 6 // 2), self.height // 150, self.height // 6, self.width, self.height)
         self.paddle2: Paddle = Paddle(self.width - self.width // 30, self.height // 2 - (self.height // 6 // 2), self.height // 150, self.height // 6, self.width, self.height)
 
@@ -34,7 +50,7 @@ class Game:
         self.pause = False
         self.goal1 = False
         self.goal2 = False
-        self.currentTs = time.time()
+        self.currentTs = self.clock.now()
         self.NewCalculusNeeded = True
         self.pauseCoolDown = self.currentTs
         self.lastSentInfos = 0
@@ -48,15 +64,37 @@ class Game:
         # self.paddle2.vel *= self.speed_multiplier
 
         self.frame_rate = 60
+        # observations de l'IA (ai_data), a part des frames : None tant qu'aucune IA n'est connectee
+        self.ai_observation_rate = None
+        self.last_observation_time = float("-inf")
+
+        # simulation a pas fixe : la physique avance en temps simule,
+        # independamment de la frequence a laquelle la boucle est reveillee
+        self.tick_rate = 1000
+        self.max_catch_up_ticks = 50
+        self.tick = 0
+        self.sim_time = 0.0
+        self.next_tick_time = None
+        self.dropped_ticks = 0
+        # temps CPU passe a faire avancer la partie (mesure par le scheduler)
+        self.cpu_time = 0.0
+        self.nextCollision = None
+        # detection continue des collisions, necessaire pour un tick_rate bas (60-120 Hz)
+        self.swept_collisions = False
+        # incremente quand l'etat est modifie hors de step() (reprise, arret) :
+        # le moteur numpy recharge alors la partie dans ses tableaux
+        self.revision = 0
 
 
     def handle_collisions_on_paddle(self):
-        # Gestion des collisions avec les raquettes
+        # Gestion des collisions avec les raquettes ; nouvelle prediction seulement
+        # si la balle est renvoyee (pas pendant la garde de 0.5 s apres un renvoi)
+        epoch = self.ball.trajectory_epoch
         if self.ball.check_collision(self.paddle1):
-            self.ball.updateTrajectoryP1(self.paddle1)
-            self.NewCalculusNeeded = True
+            self.ball.updateTrajectoryP1(self.paddle1, self.sim_time)
         if self.ball.check_collision(self.paddle2):
-            self.ball.updateTrajectoryP2(self.paddle2)
+            self.ball.updateTrajectoryP2(self.paddle2, self.sim_time)
+        if self.ball.trajectory_epoch != epoch:
             self.NewCalculusNeeded = True
 
     
@@ -67,6 +105,67 @@ class Game:
             else:
                 self.ball.touchedWall = "bottom"
             self.ball.y_vel = -self.ball.y_vel
+            self.ball.trajectory_epoch += 1
+
+
+    def move_ball_swept(self, scale):
+        """
+        Deplace la balle d'un tick en cherchant le premier contact (raquette ou bord) sur
+        son trajet : le rebond est applique a l'instant exact de l'impact, puis la balle
+        termine le tick avec sa nouvelle vitesse. La balle ne peut donc plus traverser
+        une raquette, meme si elle parcourt plus que son epaisseur en un tick.
+        """
+        ball = self.ball
+        ignored = []
+        remaining = 1.0
+
+        for _ in range(self.MAX_CONTACTS_PER_TICK):
+            dx = ball.x_vel * scale * remaining
+            dy = ball.y_vel * scale * remaining
+
+            contact = None
+            impact = 1.0
+            for paddle in (self.paddle1, self.paddle2):
+                if paddle in ignored:
+                    continue
+                t = ball.timeOfImpact(paddle, dx, dy)
+                if t is not None and t <= impact:
+                    contact, impact = paddle, t
+
+            if dy < 0:
+                t = max(0.0, (ball.radius - ball.y) / dy)
+            elif dy > 0:
+                t = max(0.0, (self.height - ball.radius - ball.y) / dy)
+            else:
+                t = None
+            if t is not None and t <= impact and (contact is None or t < impact):
+                contact, impact = "wall", t
+
+            if contact is None:
+                ball.x += dx
+                ball.y += dy
+                return
+
+            ball.x += dx * impact
+            ball.y += dy * impact
+            remaining *= 1 - impact
+
+            if contact == "wall":
+                ball.touchedWall = "top" if dy < 0 else "bottom"
+                ball.y_vel = -ball.y_vel
+                ball.trajectory_epoch += 1
+                continue
+
+            lastTouch = contact.lastTouch
+            if contact is self.paddle1:
+                ball.updateTrajectoryP1(contact, self.sim_time)
+            else:
+                ball.updateTrajectoryP2(contact, self.sim_time)
+            if contact.lastTouch == lastTouch:
+                # renvoi refuse (deja touchee il y a moins de 0.5 s) : la balle poursuit sa route
+                ignored.append(contact)
+            else:
+                self.NewCalculusNeeded = True
 
 
     def handle_scores(self):
@@ -77,7 +176,7 @@ class Game:
             self.paddle2.canMove = True
             self.NewCalculusNeeded = True
             self.pause = True
-            self.last_frame_time = 0
+            self.request_frame()
 
         if self.ball.x >= self.width:
             self.goal1 = True
@@ -86,46 +185,150 @@ class Game:
             self.paddle2.canMove = True
             self.NewCalculusNeeded = True
             self.pause = True
-            self.last_frame_time = 0
+            self.request_frame()
 
 
-    async def rungame(self):
-        ball = self.ball
+    def predicted_collision(self):
+        # point d'impact sur la raquette vers laquelle la balle se dirige,
+        # avec le deplacement par tick de step() (vitesses exprimees au tick de reference)
+        scale = self.REFERENCE_TICK_RATE / self.tick_rate
+        if self.ball.x_vel < 0:
+            return self.ball.cachedNextCollisionPosition(self.paddle1, scale)
+        return self.ball.cachedNextCollisionPosition(self.paddle2, scale)
+
+
+    def update_prediction(self):
         paddle1 = self.paddle1
         paddle2 = self.paddle2
 
-        while self.run:
-            current_time = time.time()
+        self.nextCollision = self.predicted_collision()
+        if self.TRAININGPARTNER is True:
+            half_height = paddle2.height // 2
+            if self.partner_side == "right":
+                paddle2.y = self.nextCollision[1] + self.rng.uniform(-half_height, half_height) - half_height
+            else:
+                paddle1.y = self.nextCollision[1] + self.rng.uniform(-half_height, half_height) - half_height
+        self.NewCalculusNeeded = False
+
 
-            if self.NewCalculusNeeded == True:
-                if ball.x_vel < 0:
-                    self.nextCollision = ball.calculateNextCollisionPosition(paddle1)
-                else:
-                    self.nextCollision = ball.calculateNextCollisionPosition(paddle2)
-                if self.TRAININGPARTNER is True:
-                    half_height = paddle2.height // 2
-                    if self.partner_side == "right":
-                        paddle2.y = self.nextCollision[1] + random.uniform(-half_height, half_height) - half_height
-                    else:
-                        paddle1.y = self.nextCollision[1] + random.uniform(-half_height, half_height) - half_height
-                self.NewCalculusNeeded = False
+    def step(self):
+        """Avance la simulation d'un tick fixe de 1 / tick_rate secondes."""
+        self.inputs.sample()
+        self.tick += 1
+        self.sim_time = self.tick / self.tick_rate
+        self.record_inputs(self.tick)
 
-            await asyncio.sleep(0.001)  
+        if self.NewCalculusNeeded == True:
+            self.update_prediction()
 
-            if not self.pause:
+        scale = self.REFERENCE_TICK_RATE / self.tick_rate
+        self.move_paddles(scale)
 
-                ball.move()
-                ball.friction()
+        if not self.pause:
+            if self.swept_collisions:
+                self.move_ball_swept(scale)
+                self.ball.friction(self.sim_time)
+            else:
+                self.ball.move(scale)
+                self.ball.friction(self.sim_time)
                 self.handle_collisions_on_paddle()
                 self.handle_collisions_on_border()
-                self.handle_scores()
-
-            # send JSON game state
-            if current_time - self.last_frame_time >= 1/self.frame_rate or self.isgameover() == True:
-                self.serialize()
-                self.last_frame_time = current_time
-
-                yield json.dumps(self.gameState)
+            self.handle_scores()
+
+
+    def frame_due(self):
+        # sim_time = tick / tick_rate tombe a quelques ulp sous l'echeance quand la periode
+        # est un nombre entier de ticks : sans la marge, la frame part un tick trop tard
+        return self.sim_time - self.last_frame_time >= 1 / self.frame_rate - 1e-9 or self.isgameover() == True
+
+
+    def request_frame(self):
+        # force l'envoi d'une frame au prochain tick
+        self.last_frame_time = self.sim_time - 1 / self.frame_rate
+
+
+    def advance(self, now):
+        """
+        Execute les ticks dont l'echeance est passee a l'instant `now` (horloge de la partie),
+        et s'arrete des qu'une frame est due. Au-dela de max_catch_up_ticks de retard,
+        les ticks en trop sont abandonnes plutot que rattrapes.
+        Renvoie True si une frame doit etre envoyee.
+        """
+        dt = 1 / self.tick_rate
+        if self.next_tick_time is None:
+            self.next_tick_time = now
+
+        backlog = (now - self.next_tick_time) * self.tick_rate
+        if backlog > self.max_catch_up_ticks:
+            self.dropped_ticks += int(backlog) - self.max_catch_up_ticks
+            self.next_tick_time = now - self.max_catch_up_ticks * dt
+
+        while self.next_tick_time <= now:
+            self.step()
+            self.next_tick_time += dt
+            if self.frame_due():
+                return True
+        return self.frame_due()
+
+
+    def next_deadline(self):
+        """Instant (horloge de la partie) auquel la prochaine frame sera due."""
+        remaining = (self.last_frame_time + 1 / self.frame_rate - self.sim_time) * self.tick_rate
+        ticks = max(1, math.ceil(remaining - 1e-9))
+        return self.next_tick_time + (ticks - 1) / self.tick_rate
+
+
+    def emit_frame(self):
+        # instantane structure : l'encodage est fait une seule fois, par le consumer.
+        # Copie de surface suffisante, serialize() recree les sous-dictionnaires a chaque frame
+        self.serialize()
+        # une periode exacte apres la frame precedente (60 fps a 1000 Hz, pas 1000 / 17),
+        # sans rafale pour rattraper un retard de plus d'une periode
+        period = 1 / self.frame_rate
+        self.last_frame_time += period
+        if self.sim_time - self.last_frame_time >= period - 1e-9:
+            self.last_frame_time = self.sim_time
+        frame = dict(self.gameState)
+        if self.observation_due():
+            # sur la grille des frames et pas sur sim_time, arrondi au tick : a 60 par seconde
+            # une frame sur trois arrivait 16 ms apres la precedente et perdait son observation
+            interval = 1 / self.ai_observation_rate
+            self.last_observation_time += interval
+            if self.last_frame_time - self.last_observation_time >= interval - 1e-9:
+                self.last_observation_time = self.last_frame_time
+            frame["observation"] = self.aiSerialize()
+        return frame
+
+
+    def observation_due(self):
+        # au plus une observation par frame, au rythme choisi par l'IA (appele apres l'avance de last_frame_time)
+        rate = self.ai_observation_rate
+        return rate is not None and self.last_frame_time - self.last_observation_time >= 1 / rate - 1e-9
+
+
+    def record_inputs(self, tick):
+        # journalise les changements d'action, au tick ou ils prennent effet
+        for index, player in enumerate(self.players):
+            action = player.action
+            if action != self.logged_actions[index]:
+                self.logged_actions[index] = action
+                self.input_log.record(tick, index + 1, action)
+
+
+    def move_paddles(self, scale):
+        # la vitesse des raquettes vient de l'action des joueurs, au meme pas de temps que la balle
+        height = self.height
+        for player, paddle in zip(self.players, (self.paddle1, self.paddle2)):
+            action = player.action
+            if action == 1:
+                paddle.move(height, up=True, distance=paddle.vel * self.PADDLE_STEPS_PER_TICK * scale)
+            elif action == -1:
+                paddle.move(height, up=False, distance=paddle.vel * self.PADDLE_STEPS_PER_TICK * scale)
+
+
+    def save_input_log(self, path):
+        self.input_log.capture_config(self)
+        self.input_log.dump(path)
 
 
     def resetPaddles(self):
@@ -178,17 +381,39 @@ class Game:
 
         res["scoreLimit"] = self.scoreLimit
         res["pause"] = self.pause
+
+        return res
+
+
+    def aiSerialize(self):
+        res:dict = {}
+
+        res["type"] = "observation"
+        res["pause"] = self.pause
         res['ai_data'] = self.getGameState()
-        res['ai_data'].append(self.nextCollision)
+        res['ai_data'].append(self.predicted_collision())
         res['ai_data'].append(self.paddle2.y)
+        res["next_collision"] = self.ball.cachedNextCollisionPosition(self.paddle2, self.REFERENCE_TICK_RATE / self.tick_rate)
 
         return res
 
 
     async def resume_on_goal(self):
+        self.resume()
+
+
+    def resume(self):
+        self.input_log.record(self.tick, InputLog.RESUME, 1)
         self.ball.reset(self.ball.x)
         self.goal1 = False
         self.goal2 = False
-        self.lastSentInfos = time.time() - 0.25
+        self.lastSentInfos = self.clock.now() - 0.25
         self.pause = False
+        self.revision += 1
+
+
+    def suspend(self):
+        # partie arretee de l'exterieur (deconnexion) : la balle ne bouge plus
+        self.pause = True
+        self.revision += 1
     
@@ -1,33 +1,134 @@
 import asyncio
+import os
 from typing import Optional
+from .game import Game
 from .game_wrapper import GameWrapper
+from .input_log import InputLog
 from _datetime import datetime
 from .game_status import GameStatus
+from .scheduler import GameScheduler
+from .clock import MonotonicClock
+from .timer_wheel import TimerWheel
 import logging
 
 class GameManager:
+    """
+    Registre des parties du process (uid -> GameWrapper), qui tiennent aussi leurs consumers.
+    Une partie existante est trouvee sans verrou ; creation et suppression prennent le verrou
+    de la bande de l'uid (hash(uid) % LOCK_STRIPES), les autres uids ne l'attendent pas.
+    """
+
+    LOCK_STRIPES = 64
+
     def __init__(self):
         self.active_games = {}
-        self._lock = asyncio.Lock()
+        self._locks = [asyncio.Lock() for _ in range(self.LOCK_STRIPES)]
+        self.clock = MonotonicClock()
+        # "scalar" (une partie a la fois) ou "numpy" (toutes les parties en un lot)
+        self.scheduler = GameScheduler(engine=os.getenv('PONG_PHYSICS_ENGINE', 'scalar'), clock=self.clock)
+        # frequence de la physique (Hz) ; en dessous de 1000 Hz la balle peut traverser une
+        # raquette en un tick, la detection continue des collisions est alors activee par defaut
+        self.tick_rate = int(os.getenv('PONG_TICK_RATE', str(Game.REFERENCE_TICK_RATE)))
+        swept = os.getenv('PONG_SWEPT_COLLISIONS', '')
+        if swept:
+            self.swept_collisions = swept.lower() in ('1', 'true', 'yes')
+        else:
+            self.swept_collisions = self.tick_rate < Game.REFERENCE_TICK_RATE
+        if self.swept_collisions and self.scheduler.engine == "numpy":
+            logging.warning("PONG_SWEPT_COLLISIONS: the numpy engine steps swept games one by one")
+        # journaux d'entrees des parties terminees ; sans repertoire, rien n'est garde
+        self.replay_dir = os.getenv('PONG_REPLAY_DIR')
+        # tous les delais d'attente des parties (lobbies)
+        self.timers = TimerWheel(clock=self.clock)
+        # boucle des consumers, pour les retraits demandes hors de la boucle (GC)
+        self._loop = None
+
+    def _lock_for(self, game_id: str) -> asyncio.Lock:
+        return self._locks[hash(game_id) % self.LOCK_STRIPES]
 
     async def create_or_get_game(self, game_id: str) -> GameWrapper:
-        async with self._lock:
+        self._loop = asyncio.get_running_loop()
+        game_wrapper = self.active_games.get(game_id)
+        if game_wrapper is not None and not game_wrapper.is_over:
+            # logging.info(f"Game RETRIEVED with id: {game_id}")
+            return game_wrapper
+        async with self._lock_for(game_id):
             # logging.info(f"Creating or getting game with id: {game_id}")
+            game_wrapper = self.active_games.get(game_id)
+            if game_wrapper is not None and game_wrapper.is_over:
+                # partie terminee ou annulee, pas encore retiree : une reconnexion en ouvre une nouvelle
+                self._remove(game_id, game_wrapper)
             if game_id not in self.active_games:
                 # logging.info(f"Game CREATED with id: {game_id}")
-                self.active_games[game_id] = GameWrapper(game_id)
+                game_wrapper = GameWrapper(game_id, clock=self.clock)
+                game_wrapper.game.tick_rate = self.tick_rate
+                game_wrapper.game.swept_collisions = self.swept_collisions
+                if not self.replay_dir:
+                    game_wrapper.game.input_log.max_entries = 0
+                game_wrapper.on_orphaned = self._remove_orphan
+                self.active_games[game_id] = game_wrapper
                 # logging.info(f"number of active games: {len(self.active_games)}")
-                # logging.info(f"Game created with id: {game_id}")
-            # else:
-                # logging.info(f"Game RETRIEVED with id: {game_id}")
             return self.active_games[game_id]
         
-    async def remove_game(self, game_id: str):
-        async with self._lock:
-            if game_id in self.active_games:
-                del self.active_games[game_id]
-                return True
+    async def remove_game(self, game_id: str, game_wrapper: Optional[GameWrapper] = None):
+        # avec game_wrapper, seulement si l'uid n'a pas deja ete repris par une nouvelle partie
+        async with self._lock_for(game_id):
+            return self._remove(game_id, game_wrapper)
+
+    def _remove(self, game_id: str, game_wrapper: Optional[GameWrapper] = None):
+        if game_id not in self.active_games:
+            return False
+        if game_wrapper is not None and self.active_games[game_id] is not game_wrapper:
+            return False
+        game_wrapper = self.active_games.pop(game_id)
+        self.scheduler.remove(game_id)
+        self.save_input_log(game_wrapper)
+        return True
+
+    def _remove_orphan(self, game_wrapper: GameWrapper):
+        # tous les consumers ont disparu sans passer par disconnect. Appele par un callback
+        # weakref, pendant un GC qui peut avoir lieu n'importe ou (y compris dans un thread) :
+        # le retrait est fait par la boucle, a son prochain tour
+        if self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._remove_orphan_now, game_wrapper)
+        except RuntimeError:
+            # boucle fermee : le process s'arrete
+            pass
+
+    def _remove_orphan_now(self, game_wrapper: GameWrapper):
+        if self._remove(game_wrapper.game_id, game_wrapper):
+            game_wrapper.transition(GameStatus.CANCELLED)
+            logging.warning(f"Game {game_wrapper.game_id} removed: no consumer left")
+
+    def save_input_log(self, game_wrapper: GameWrapper):
+        # Journal des entrees, pour rejouer la partie hors ligne (python -m pong.game.replay).
+        # Le contenu est copie sur la boucle, le fichier est ecrit dans un thread
+        game = game_wrapper.game
+        if not self.replay_dir or game.tick == 0:
+            return
+        log = game.input_log
+        log.game_id = game_wrapper.game_id
+        log.capture_config(game)
+        path = os.path.join(self.replay_dir, f"{game_wrapper.game_id}-{game.seed}.json")
+        write = asyncio.get_running_loop().run_in_executor(None, InputLog.write, path, log.to_dict())
+        write.add_done_callback(lambda done: self._input_log_saved(game_wrapper.game_id, done))
+
+    def _input_log_saved(self, game_id: str, write):
+        if not write.cancelled() and write.exception() is not None:
+            logging.error(f"Error saving input log for game {game_id}: {write.exception()}")
+
+    def start_game(self, game_id: str, on_frame) -> bool:
+        # La partie est avancee par le scheduler partage, on_frame recoit chaque frame
+        game_wrapper = self.active_games.get(game_id)
+        if game_wrapper is None:
             return False
+        self.scheduler.add(game_id, game_wrapper.game, on_frame)
+        return True
+
+    def stop_game(self, game_id: str):
+        self.scheduler.remove(game_id)
 
 # Instance unique
 game_manager = GameManager()
@@ -4,32 +4,150 @@ from _datetime import datetime
 from .game_status import GameStatus
 
 import asyncio
+import logging
+import weakref
 
 class GameWrapper:
-    def __init__(self, game_id: str):
+    """
+    Cycle de vie d'une partie :
+        WAITING -> STARTING -> IN_PROGRESS <-> PAUSED -> FINISHED
+    et CANCELLED depuis tout etat non termine (deconnexion, timeout, meme JWT).
+
+    STARTING : tous les joueurs sont connectes, le handshake se termine. Les etapes du
+    handshake deja faites sont dans `ready` ("ai", "names", "init", "start").
+
+    Les consumers de la partie (deux au plus) sont gardes par reference faible, une case
+    chacun : un consumer dont le nettoyage a echoue ne garde pas la partie en vie, et
+    on_orphaned(wrapper) est appele quand le dernier disparait sans s'etre retire.
+    """
+
+    MAX_CLIENTS = 2
+
+    TRANSITIONS = {
+        GameStatus.WAITING: {GameStatus.STARTING, GameStatus.CANCELLED},
+        GameStatus.STARTING: {GameStatus.IN_PROGRESS, GameStatus.CANCELLED},
+        GameStatus.IN_PROGRESS: {GameStatus.PAUSED, GameStatus.FINISHED, GameStatus.CANCELLED},
+        GameStatus.PAUSED: {GameStatus.IN_PROGRESS, GameStatus.FINISHED, GameStatus.CANCELLED},
+        GameStatus.FINISHED: set(),
+        GameStatus.CANCELLED: set(),
+    }
+    TERMINAL = (GameStatus.FINISHED, GameStatus.CANCELLED)
+
+    def __init__(self, game_id: str, clock=None):
 
         self.created_at = datetime.now()
         self.status = GameStatus.WAITING
 
         self.game_id = game_id
-        self.game_is_initialized = asyncio.Event()
-        self.ai_is_initialized = asyncio.Event()
-        self.start_event = asyncio.Event()
-        self.game_over = asyncio.Event()
-        self.all_players_connected = asyncio.Event()
-        self.resume_on_goal = asyncio.Event()
-        self.waiting_for_ai = asyncio.Event()
-        self.received_names = asyncio.Event()
-        self.ai_partner = True
-
-        self.has_resumed_count = 0
-        self.has_resumed = asyncio.Event()
+        self.ready = set()
+        self._clients = [None] * self.MAX_CLIENTS
+        self.on_orphaned = None
+        self._waiters = []
+        # timer de la phase en cours (WAITING ou STARTING) : (status, timer)
+        self._phase_timer = None
+
+        # un joueur a demande la reprise apres un but, pas encore signale dans une frame
+        self.has_resumed = False
 
         self.player_1 = Player()
         self.player_2 = Player()
 
         self.present_players = 0
-        self.game = Game()  # Supposant que vous avez une classe GameInstance
+        self.game = Game(clock=clock, players=(self.player_1, self.player_2))  # Supposant que vous avez une classe GameInstance
 
     def get_game(self):
         return self.game
+
+    @property
+    def all_players_connected(self):
+        return self.status is not GameStatus.WAITING
+
+    @property
+    def is_over(self):
+        return self.status in self.TERMINAL
+
+    def transition(self, status: GameStatus) -> bool:
+        if status is self.status:
+            return True
+        if status not in self.TRANSITIONS[self.status]:
+            if not self.is_over:
+                logging.warning(f"Game {self.game_id}: invalid transition {self.status} -> {status}")
+            return False
+        if self._phase_timer is not None and self._phase_timer[0] is self.status:
+            self._phase_timer[1].cancel()
+            self._phase_timer = None
+        self.status = status
+        self._notify()
+        return True
+
+    def mark_ready(self, step: str):
+        if step not in self.ready:
+            self.ready.add(step)
+            self._notify()
+
+    async def wait_until(self, predicate):
+        """Attend que predicate(self) soit vrai ou que la partie soit terminee ; retourne predicate(self)."""
+        if not predicate(self) and not self.is_over:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append((predicate, future))
+            await future
+        return predicate(self)
+
+    def _notify(self):
+        waiters, self._waiters = self._waiters, []
+        for predicate, future in waiters:
+            if future.done():
+                continue
+            if predicate(self) or self.is_over:
+                future.set_result(None)
+            else:
+                self._waiters.append((predicate, future))
+
+    def start_lobby_timer(self, timers, timeout, on_timeout):
+        """Appelle on_timeout() si la partie attend encore ses joueurs dans `timeout` secondes."""
+        self._start_phase_timer(GameStatus.WAITING, timers, timeout, on_timeout)
+
+    def start_handshake_timer(self, timers, timeout, on_timeout):
+        """Appelle on_timeout() si le handshake (noms, init, start) n'est pas fini dans `timeout` secondes."""
+        self._start_phase_timer(GameStatus.STARTING, timers, timeout, on_timeout)
+
+    def _start_phase_timer(self, status, timers, timeout, on_timeout):
+        if self._phase_timer is not None:
+            self._phase_timer[1].cancel()
+        self._phase_timer = (status, timers.call_later(timeout, self._phase_expired, status, on_timeout))
+
+    def _phase_expired(self, status, on_timeout):
+        self._phase_timer = None
+        if self.status is status:
+            on_timeout()
+
+    @property
+    def clients(self):
+        return [client for client in (ref() for ref in self._clients if ref is not None) if client is not None]
+
+    def add_client(self, consumer) -> bool:
+        """Prend une case libre ; False si la partie a deja tous ses clients."""
+        for index, ref in enumerate(self._clients):
+            if ref is None or ref() is None:
+                self._clients[index] = weakref.ref(consumer, self._client_gone)
+                return True
+        return False
+
+    def remove_client(self, consumer):
+        for index, ref in enumerate(self._clients):
+            if ref is not None and ref() is consumer:
+                self._clients[index] = None
+
+    def peer(self, consumer):
+        """L'autre client de la partie, ou None."""
+        for ref in self._clients:
+            client = ref() if ref is not None else None
+            if client is not None and client is not consumer:
+                return client
+        return None
+
+    def _client_gone(self, ref):
+        # consumer detruit sans etre passe par remove_client
+        self._clients = [None if slot is ref else slot for slot in self._clients]
+        if not self.clients and self.on_orphaned is not None:
+            self.on_orphaned(self)
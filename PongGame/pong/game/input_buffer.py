@@ -0,0 +1,25 @@
+class InputBuffer:
+    """
+    Dernieres actions recues pour chaque joueur. Les consumers y deposent les entrees
+    au fil des messages (la plus recente gagne), le moteur les echantillonne une fois par tick.
+    """
+
+    def __init__(self, players):
+        self.players = players
+        self.pending = [None] * len(players)
+        self.dirty = False
+
+
+    def push(self, index, action):
+        self.pending[index] = action
+        self.dirty = True
+
+
+    def sample(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        for index, action in enumerate(self.pending):
+            if action is not None:
+                self.players[index].action = action
+                self.pending[index] = None
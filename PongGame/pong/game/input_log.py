@@ -0,0 +1,80 @@
+import json
+import os
+
+
+# entrees gardees au plus par partie ; au-dela le journal est marque tronque
+MAX_ENTRIES = int(os.getenv('PONG_REPLAY_MAX_INPUTS', '50000'))
+
+
+class InputLog:
+    """
+    Journal compact des entrees d'une partie : (tick, joueur, action) a chaque changement
+    d'action pris en compte par le moteur. Avec la graine de la partie et sa configuration,
+    il suffit a rejouer le match a l'identique (voir pong.game.replay).
+    Le journal est borne a max_entries entrees ; un journal tronque ne rejoue la partie
+    que jusqu'a sa derniere entree.
+    """
+
+    VERSION = 1
+    # joueur fictif : reprise du jeu apres un but
+    RESUME = 0
+    CONFIG_FIELDS = ("tick_rate", "frame_rate", "swept_collisions", "scoreLimit", "TRAININGPARTNER", "partner_side")
+
+    def __init__(self, seed, config=None, entries=None, game_id=None, max_entries=MAX_ENTRIES, truncated=False):
+        self.seed = seed
+        self.config = config or {}
+        self.entries = entries if entries is not None else []
+        self.game_id = game_id
+        self.max_entries = max_entries
+        self.truncated = truncated
+
+
+    def record(self, tick, player, action):
+        if len(self.entries) >= self.max_entries:
+            self.truncated = True
+            return
+        self.entries.append((tick, player, action))
+
+
+    def capture_config(self, game):
+        self.config = {field: getattr(game, field) for field in self.CONFIG_FIELDS}
+
+
+    def apply_config(self, game):
+        for field, value in self.config.items():
+            setattr(game, field, value)
+
+
+    def to_dict(self):
+        return {
+            "version": self.VERSION,
+            "game_id": self.game_id,
+            "seed": self.seed,
+            "config": self.config,
+            "truncated": self.truncated,
+            # copie : le dictionnaire peut etre ecrit dans un autre thread
+            "inputs": list(self.entries),
+        }
+
+
+    @classmethod
+    def from_dict(cls, data):
+        entries = [tuple(entry) for entry in data["inputs"]]
+        return cls(data["seed"], data.get("config"), entries, data.get("game_id"),
+                   max_entries=max(MAX_ENTRIES, len(entries)), truncated=data.get("truncated", False))
+
+
+    @staticmethod
+    def write(path, data):
+        with open(path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+
+    def dump(self, path):
+        self.write(path, self.to_dict())
+
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
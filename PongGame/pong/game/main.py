@@ -1,9 +1,20 @@
-from game import Game
+from .game import Game
+from .scheduler import GameScheduler
 import asyncio
 
+# python -m pong.game.main : une partie seule, avancee par le scheduler, frames affichees
 async def launch(game):
-    async for state in game.rungame():
-        print(state)
+    scheduler = GameScheduler(clock=game.clock)
+    done = asyncio.get_running_loop().create_future()
+
+    def on_frame(frame):
+        if frame is not None:
+            print(frame)
+        elif not done.done():
+            done.set_result(None)
+
+    scheduler.add("main", game, on_frame)
+    await done
 
 if __name__ == "__main__":
     game = Game()
@@ -10,7 +10,8 @@ class Paddle:
         self.win_width = win_width
         self.win_height = win_height
         self.vel = round(win_height / 333)
-        self.lastTouch = 0
+        # temps de simulation du dernier renvoi de balle
+        self.lastTouch = float("-inf")
         self.canMove = True
         self.score = 0
 
@@ -29,15 +30,17 @@ class Paddle:
                 self.move(self.win_height, up=True)
 
 
-    async def move(self, height, up=True):
+    def move(self, height, up=True, distance=None):
 
+        if distance is None:
+            distance = self.vel
         temp = self.y
         if up:
-            temp -= self.vel
+            temp -= distance
             if temp < 0:
                 temp = 0
         else:
-            temp += self.vel
+            temp += distance
             if temp > height - self.height:
                 temp = height - self.height
         self.y = temp
@@ -0,0 +1,64 @@
+"""
+Rejoue hors ligne une partie enregistree (journal ecrit dans PONG_REPLAY_DIR),
+tick par tick et sans aucune attente.
+Lancer depuis PongGame/ : python -m pong.game.replay <journal.json> [--frames]
+Pour profiler : python -m cProfile -s cumtime -m pong.game.replay <journal.json>
+"""
+import argparse
+import json
+import time
+
+from .game import Game
+from .input_log import InputLog
+
+
+def replay(log, on_frame=None):
+    """Reconstruit la partie decrite par `log` et la fait tourner jusqu'a sa fin."""
+    game = Game(seed=log.seed)
+    log.apply_config(game)
+
+    entries = log.entries
+    last_tick = entries[-1][0] if entries else 0
+    index = 0
+
+    while not game.gameOver and (game.tick < last_tick or not game.pause):
+        # en jeu, les actions sont journalisees au tick ou elles prennent effet
+        # et les reprises apres le tick : on respecte le meme ordre
+        while index < len(entries) and entries[index][0] <= game.tick + 1 and entries[index][1] != InputLog.RESUME:
+            _, player, action = entries[index]
+            game.players[player - 1].action = action
+            index += 1
+
+        game.step()
+
+        if game.frame_due():
+            frame = game.emit_frame()
+            if on_frame is not None:
+                on_frame(frame)
+
+        while index < len(entries) and entries[index][0] <= game.tick and entries[index][1] == InputLog.RESUME:
+            game.resume()
+            index += 1
+
+    return game
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rejoue une partie a partir de son journal d'entrees")
+    parser.add_argument("log", help="journal JSON ecrit par le serveur de jeu")
+    parser.add_argument("--frames", action="store_true", help="affiche chaque frame produite")
+    args = parser.parse_args()
+
+    log = InputLog.load(args.log)
+    if log.truncated:
+        print(f"warning: truncated log, the replay is exact only up to tick {log.entries[-1][0]}")
+    started = time.perf_counter()
+    game = replay(log, on_frame=(lambda frame: print(json.dumps(frame))) if args.frames else None)
+    elapsed = time.perf_counter() - started
+
+    print(f"game {log.game_id} seed {log.seed}: {game.tick} ticks ({game.sim_time:.1f} s of play) "
+          f"replayed in {elapsed:.3f} s, score {game.paddle1.score}-{game.paddle2.score}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from .batch import BatchPhysics
+from .clock import MonotonicClock
+
+
+class GameScheduler:
+    """
+    Boucle unique qui fait avancer toutes les parties actives du process.
+    Chaque partie est reveillee a l'echeance de sa prochaine frame, dans l'ordre
+    des echeances (earliest deadline first). Les phases des parties sont decalees
+    sur la periode d'une frame pour ne pas les reveiller toutes sur la meme milliseconde.
+
+    Avec engine="numpy", toutes les parties avancent en phase a chaque frame,
+    en un seul lot vectorise (voir BatchPhysics). Le lot est garde tant que les parties
+    inscrites ne changent pas ; les parties avec swept_collisions avancent a cote, une par une.
+    """
+
+    # ratio d'or : les phases successives se repartissent uniformement sur la periode
+    PHASE_SPREAD = 0.6180339887498949
+    OVERRUN_LOG_INTERVAL = 10
+
+    def __init__(self, engine="scalar", clock=None):
+        # les parties inscrites doivent utiliser la meme horloge que le scheduler
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.engine = engine
+        self._heap = []
+        self._entries = {}
+        self._seq = itertools.count()
+        self._started = 0
+        self._task = None
+        self._batch = None
+        self.overruns = 0
+        self.max_lateness = 0.0
+        self.dropped_ticks = 0
+        self._overruns_since_log = 0
+        # le premier depassement est toujours journalise, quelle que soit l'origine de l'horloge
+        self._last_overrun_log = float("-inf")
+
+
+    def add(self, game_id, game, on_frame):
+        """
+        Inscrit une partie. on_frame(frame) est appele (de facon synchrone) a chaque frame,
+        puis on_frame(None) quand la partie quitte le scheduler.
+        """
+        now = self.clock.now()
+        phase = (self._started * self.PHASE_SPREAD) % 1 / game.frame_rate
+        self._started += 1
+
+        game.next_tick_time = now + phase
+        entry = (game, on_frame)
+        self.remove(game_id)
+        self._entries[game_id] = entry
+        self._batch = None
+        if self.engine != "numpy":
+            heapq.heappush(self._heap, (game.next_tick_time, next(self._seq), game_id, entry))
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+
+    def remove(self, game_id):
+        # l'entree reste dans le tas et sera ignoree a son echeance
+        entry = self._entries.pop(game_id, None)
+        if entry is not None:
+            self._batch = None
+            entry[1](None)
+
+
+    def stats(self):
+        return {
+            "games": len(self._entries),
+            "overruns": self.overruns,
+            "max_lateness": self.max_lateness,
+            "dropped_ticks": self.dropped_ticks + sum(game.dropped_ticks for game, _ in self._entries.values()),
+        }
+
+
+    async def _run(self):
+        if self.engine == "numpy":
+            await self._run_batch()
+            return
+
+        while self._entries and self._heap:
+            delay = self._heap[0][0] - self.clock.now()
+            if delay > 0:
+                await self.clock.sleep(delay)
+
+            now = self.clock.now()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, game_id, entry = heapq.heappop(self._heap)
+                if self._entries.get(game_id) is not entry:
+                    continue
+                self._step(game_id, entry, now - deadline)
+
+            # laisse les consumers envoyer les frames produites
+            await asyncio.sleep(0)
+
+
+    def _step(self, game_id, entry, lateness):
+        game, on_frame = entry
+        if lateness > 1 / game.frame_rate:
+            self._report_overrun(lateness)
+
+        started = time.thread_time()
+        try:
+            while game.run and game.advance(self.clock.now()):
+                on_frame(game.emit_frame())
+                if game.gameOver:
+                    break
+        except Exception as e:
+            logging.error(f"Error while stepping game {game_id}: {e}")
+            self.remove(game_id)
+            return
+        finally:
+            game.cpu_time += time.thread_time() - started
+
+        if game.gameOver or not game.run:
+            self.remove(game_id)
+            return
+        heapq.heappush(self._heap, (game.next_deadline(), next(self._seq), game_id, entry))
+
+
+    async def _run_batch(self):
+        # grille fixe : la frame k part a start + k * period, le lot a alors fait
+        # round(k * period * tick_rate) ticks (16 ou 17 a 1000 Hz, 2 a 120 Hz), soit
+        # exactement une frame par reveil et par partie, sans arrondi cumule
+        start = self.clock.now()
+        frame = 0
+        ticks_done = 0
+
+        while self._entries:
+            entries = list(self._entries.items())
+            sample = entries[0][1][0]
+            period = 1 / sample.frame_rate
+
+            now = self.clock.now()
+            late = now - (start + frame * period)
+            if late > period:
+                self._report_overrun(late)
+                # les frames manquees ne sont pas envoyees, la grille reprend a la frame courante
+                frame = int((now - start) / period)
+
+            ticks = round(frame * period * sample.tick_rate) - ticks_done
+            if ticks > sample.max_catch_up_ticks:
+                self.dropped_ticks += ticks - sample.max_catch_up_ticks
+                ticks_done += ticks - sample.max_catch_up_ticks
+                ticks = sample.max_catch_up_ticks
+            ticks_done += ticks
+
+            started = time.thread_time()
+            try:
+                if self._batch is None:
+                    self._batch = BatchPhysics(game for game, _ in self._entries.values() if not game.swept_collisions)
+                batch = self._batch
+                # le lot avance de plusieurs ticks d'un coup : entrees lues une fois par lot
+                for _, entry in entries:
+                    entry[0].inputs.sample()
+                if ticks:
+                    batch.sync()
+                    batch.step(ticks)
+                    batch.store()
+                    for game, _ in self._entries.values():
+                        if game.swept_collisions:
+                            for _ in range(ticks):
+                                game.step()
+                # le cout du lot est reparti egalement entre les parties
+                share = (time.thread_time() - started) / len(entries)
+
+                # une frame par partie a chaque point de la grille
+                for game_id, entry in entries:
+                    game, on_frame = entry
+                    if self._entries.get(game_id) is not entry:
+                        continue
+                    started = time.thread_time()
+                    on_frame(game.emit_frame())
+                    batch.emitted(game)
+                    game.cpu_time += share + time.thread_time() - started
+                    if game.gameOver or not game.run:
+                        self.remove(game_id)
+            except Exception as e:
+                logging.error(f"Error while stepping game batch: {e}")
+                for game_id, _ in entries:
+                    self.remove(game_id)
+
+            frame += 1
+            await self.clock.sleep(max(0, start + frame * period - self.clock.now()))
+
+
+    def _report_overrun(self, lateness):
+        self.overruns += 1
+        self._overruns_since_log += 1
+        self.max_lateness = max(self.max_lateness, lateness)
+
+        now = self.clock.now()
+        if now - self._last_overrun_log >= self.OVERRUN_LOG_INTERVAL:
+            logging.warning(
+                f"Game scheduler overran {self._overruns_since_log} tick deadlines "
+                f"(max lateness {self.max_lateness * 1000:.1f} ms, {len(self._entries)} games)"
+            )
+            self._overruns_since_log = 0
+            self._last_overrun_log = now
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+
+from .clock import MonotonicClock
+
+
+class Timer:
+    __slots__ = ("deadline_tick", "callback", "args", "_wheel")
+
+    def __init__(self, wheel, deadline_tick, callback, args):
+        self._wheel = wheel
+        self.deadline_tick = deadline_tick
+        self.callback = callback
+        self.args = args
+
+
+    @property
+    def active(self):
+        return self._wheel is not None
+
+
+    def cancel(self):
+        if self._wheel is not None:
+            self._wheel._discard(self)
+            self._wheel = None
+
+
+class TimerWheel:
+    """
+    Roue de timers hachee, une par process : tous les delais d'attente (lobbies, etc.)
+    passent par elle au lieu d'une boucle ou d'une tache par connexion.
+
+    Le temps est decoupe en ticks de `resolution` secondes ; un timer est range dans la case
+    (tick d'echeance % slots) et n'est declenche que quand son tick est atteint.
+    Ajouter et annuler un timer sont en O(1). Une seule tache tourne, et seulement tant
+    qu'il reste des timers ; les ticks sont cales sur l'horloge et ne derivent pas.
+    """
+
+    def __init__(self, resolution=0.05, slots=512, clock=None):
+        self.resolution = resolution
+        self.clock = clock if clock is not None else MonotonicClock()
+        self._slots = [set() for _ in range(slots)]
+        self._origin = self.clock.now()
+        # dernier tick traite
+        self._tick = 0
+        self._count = 0
+        self._task = None
+        self.fired = 0
+
+
+    def __len__(self):
+        return self._count
+
+
+    def call_later(self, delay, callback, *args):
+        """Appelle callback(*args) (de facon synchrone) dans `delay` secondes ; retourne un Timer annulable."""
+        if not self._count:
+            # roue au repos : reprend au tick courant, sans rejouer les ticks vides
+            self._tick = self._current_tick()
+        # arrondi au tick superieur : jamais declenche en avance
+        deadline_tick = max(self._current_tick() + 1,
+                            -int(-(self.clock.now() + delay - self._origin) // self.resolution))
+        timer = Timer(self, deadline_tick, callback, args)
+        self._slots[deadline_tick % len(self._slots)].add(timer)
+        self._count += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return timer
+
+
+    def _current_tick(self):
+        return int((self.clock.now() - self._origin) // self.resolution)
+
+
+    def _discard(self, timer):
+        slot = self._slots[timer.deadline_tick % len(self._slots)]
+        if timer in slot:
+            slot.remove(timer)
+            self._count -= 1
+
+
+    def advance(self):
+        """Declenche les timers dont le tick est atteint (appele par la tache, et par les tests)."""
+        now_tick = self._current_tick()
+        while self._tick < now_tick:
+            self._tick += 1
+            slot = self._slots[self._tick % len(self._slots)]
+            if not slot:
+                continue
+            due = [timer for timer in slot if timer.deadline_tick <= self._tick]
+            for timer in due:
+                slot.remove(timer)
+                self._count -= 1
+                timer._wheel = None
+                self.fired += 1
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    logging.error(f"Error in timer callback {timer.callback}: {e}")
+
+
+    async def _run(self):
+        while self._count:
+            next_tick_time = self._origin + (self._current_tick() + 1) * self.resolution
+            await self.clock.sleep(max(0.0, next_tick_time - self.clock.now()))
+            self.advance()
@@ -0,0 +1,122 @@
+"""
+Format binaire des frames, sous-protocole websocket "pong.bin.v2" (le JSON reste le defaut).
+
+Disposition fixe, little endian, 22 octets :
+    B  version (2 ; la v1 de 25 octets portait aussi next_collision)
+    H  drapeaux (voir FLAG_* ci-dessous)
+    H  ball.x, H ball.y          positions normalisees [0, 1] quantifiees sur 0..65535
+    H  ball.speed                vitesse / max_speed, sur 0..65535 pour [0, 2]
+    b  ball.rounded_angle * 2    l'angle est un multiple de 0.5 rad
+    H  paddle1.x, H paddle1.y, H paddle2.x, H paddle2.y   normalises comme la balle
+    B  paddle1.score, B paddle2.score, B scoreLimit
+    B  side du client destinataire (0 aucun, 1 p1, 2 p2), ajoute a part pour chaque client
+
+Les donnees de l'IA n'en font pas partie : elles ont leur propre message (Game.aiSerialize).
+"""
+import struct
+
+
+SUBPROTOCOL = "pong.bin.v2"
+VERSION = 2
+
+FRAME = struct.Struct("<BHHHHbHHHHBBB")
+SIZE = FRAME.size + 1
+
+POSITION_SCALE = 65535
+SPEED_SCALE = 32767
+
+FLAG_PLAYING = 1 << 0
+FLAG_PAUSE = 1 << 1
+FLAG_RESUME_ON_GOAL = 1 << 2
+FLAG_GAMEOVER = 1 << 3
+# champs a trois valeurs, sur deux bits
+GOAL_SHIFT = 4
+WINNER_SHIFT = 6
+GAME_MODE_SHIFT = 8
+LAST_TOUCH_SHIFT = 10
+TOUCHED_WALL_SHIFT = 12
+
+GOALS = {"None": 0, "1": 1, "2": 2}
+WINNERS = {None: 0, "1": 1, "2": 2}
+GAME_MODES = {"PVP_keyboard": 0, "PVP_LAN": 1, "PVE": 2}
+LAST_TOUCHES = {0: 0, "1": 1, "2": 2}
+WALLS = {None: 0, "top": 1, "bottom": 2}
+SIDES = {None: b"\x00", "p1": b"\x01", "p2": b"\x02"}
+
+
+def quantize(value, scale=POSITION_SCALE):
+    value = int(value * scale + 0.5)
+    return 0 if value < 0 else 65535 if value > 65535 else value
+
+
+def encode_frame(frame):
+    """Encode une frame (Game.serialize + champs du consumer), sans le side du client."""
+    game = frame["game"]
+    ball = frame["ball"]
+    paddle1 = frame["paddle1"]
+    paddle2 = frame["paddle2"]
+
+    flags = (
+        (FLAG_PLAYING if frame["playing"] else 0)
+        | (FLAG_PAUSE if game["pause"] else 0)
+        | (FLAG_RESUME_ON_GOAL if frame.get("resumeOnGoal") else 0)
+        | (FLAG_GAMEOVER if frame["gameover"] is not None else 0)
+        | GOALS[frame["goal"]] << GOAL_SHIFT
+        | WINNERS[frame["winner"]] << WINNER_SHIFT
+        | GAME_MODES.get(frame.get("game_mode"), 0) << GAME_MODE_SHIFT
+        | LAST_TOUCHES[ball["lastTouch"]] << LAST_TOUCH_SHIFT
+        | WALLS[ball["touchedWall"]] << TOUCHED_WALL_SHIFT
+    )
+    return FRAME.pack(
+        VERSION,
+        flags,
+        quantize(ball["x"]),
+        quantize(ball["y"]),
+        quantize(ball["speed"], SPEED_SCALE),
+        int(ball["rounded_angle"] * 2),
+        quantize(paddle1["x"]),
+        quantize(paddle1["y"]),
+        quantize(paddle2["x"]),
+        quantize(paddle2["y"]),
+        paddle1["score"],
+        paddle2["score"],
+        game["scoreLimit"],
+    )
+
+
+def side_suffix(side):
+    return SIDES[side]
+
+
+def decode_frame(data):
+    """Inverse de encode_frame (aux arrondis pres), pour les tests et les clients Python."""
+    (version, flags, ball_x, ball_y, speed, angle, paddle1_x, paddle1_y, paddle2_x, paddle2_y,
+     score1, score2, score_limit) = FRAME.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"unsupported frame version {version}")
+
+    def field(values, shift):
+        code = flags >> shift & 3
+        return next(value for value, index in values.items() if index == code)
+
+    side = data[FRAME.size] if len(data) > FRAME.size else 0
+    return {
+        "playing": bool(flags & FLAG_PLAYING),
+        "goal": field(GOALS, GOAL_SHIFT),
+        "game": {"scoreLimit": score_limit, "pause": bool(flags & FLAG_PAUSE)},
+        "ball": {
+            "x": ball_x / POSITION_SCALE,
+            "y": ball_y / POSITION_SCALE,
+            "speed": speed / SPEED_SCALE,
+            "lastTouch": field(LAST_TOUCHES, LAST_TOUCH_SHIFT),
+            "touchedWall": field(WALLS, TOUCHED_WALL_SHIFT),
+            "rounded_angle": angle / 2,
+        },
+        "paddle1": {"x": paddle1_x / POSITION_SCALE, "y": paddle1_y / POSITION_SCALE, "score": score1},
+        "paddle2": {"x": paddle2_x / POSITION_SCALE, "y": paddle2_y / POSITION_SCALE, "score": score2},
+        "gameover": "Score" if flags & FLAG_GAMEOVER else None,
+        "winner": field(WINNERS, WINNER_SHIFT),
+        "game_mode": field(GAME_MODES, GAME_MODE_SHIFT),
+        "resumeOnGoal": bool(flags & FLAG_RESUME_ON_GOAL),
+        "side": (None, "p1", "p2")[side],
+    }
@@ -0,0 +1,498 @@
+"""
+Test de charge en process : des clients factices jouent contre la vraie application ASGI
+(PongGame.asgi) via le WebsocketCommunicator de channels. Un faux backend local remplace
+nginx (verify, cleanup, stats et game/new), avec une latence reglable.
+
+Chaque "slot" enchaine des parties jusqu'a la fin du test : PVE (humain + IA factice),
+PVP_LAN (deux clients) ou PVP_keyboard (un client pour les deux raquettes).
+Les clients suivent la balle avec leur raquette pour faire durer les echanges.
+
+Lancer depuis PongGame/ :
+    python -m pong.loadtest --games 50 --duration 30 --latency 20
+    python -m pong.loadtest --games 200 --mix pve:2,lan:1,keyboard:1 --output load.json
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+
+import jwt
+from aiohttp import web
+
+from .game import delta as delta_stream
+from .game import wire
+from .sender import FrameSender
+
+
+STUB_HOST = "127.0.0.1"
+CONNECT_TIMEOUT = 10
+RECEIVE_TIMEOUT = 15
+# ecart (en hauteur normalisee) en dessous duquel une raquette ne bouge plus
+TRACKING_DEADZONE = 0.03
+# dimensions du terrain, pour lire les observations de l'IA (en pixels)
+FIELD_HEIGHT = 1000
+PADDLE_HEIGHT = FIELD_HEIGHT // 6
+
+
+class StubBackend:
+    """Remplace nginx et le backend : repond 200 a tout, apres `latency` secondes."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = collections.Counter()
+        # connexions TCP distinctes vues (port du client), pour verifier le keep-alive
+        self.connections = set()
+        self.runner = None
+        self.url = None
+
+        app = web.Application(middlewares=[self.delay])
+        app.router.add_get("/game/verify/{uid}/", self.reply("verify"))
+        app.router.add_delete("/game/cleanup/{uid}/", self.reply("cleanup"))
+        app.router.add_post("/auth/incrementusercounters/", self.reply("stats", {"goal_counter": 0, "win_counter": 0}))
+        app.router.add_post("/game/new/", self.reply("game_new"))
+        self.app = app
+
+
+    @web.middleware
+    async def delay(self, request, handler):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+
+    def reply(self, name, payload=None):
+        async def handler(request):
+            self.requests[name] += 1
+            self.connections.add(request.transport.get_extra_info("peername"))
+            await request.read()
+            return web.json_response(payload or {"status": "ok"})
+        return handler
+
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, STUB_HOST, 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://{STUB_HOST}:{port}"
+        return self.url
+
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+
+def setup_environment(backend_url):
+    # a faire avant d'importer l'application : les consumers lisent ces variables a l'import
+    os.environ["BACKEND_URL"] = backend_url
+    os.environ["BACKEND_HTTP_URL"] = backend_url
+    os.environ.setdefault("AI_SERVICE_TOKEN", "loadtest-ai-token")
+    os.environ.setdefault("JWT_SECRET_KEY", "loadtest-secret")
+    os.environ.setdefault("GAME_SERVICE_TOKEN", "loadtest-game-token")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "PongGame.settings")
+    # boite d'envoi propre a chaque run, rien a renvoyer d'un run precedent
+    os.environ.setdefault("PONG_OUTBOX_PATH", os.path.join(tempfile.mkdtemp(prefix="pong-loadtest-"), "outbox.sqlite3"))
+
+
+def user_token(username):
+    return jwt.encode(
+        {"username": username, "exp": int(time.time()) + 3600},
+        os.environ["JWT_SECRET_KEY"],
+        algorithm="HS256",
+    )
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Metrics:
+    def __init__(self, frame_period):
+        self.frame_period = frame_period
+        self.connect = []
+        self.first_frame = []
+        # mesure cote serveur (FrameSender.first_frame_delays)
+        self.server_first_frame = []
+        self.intervals = []
+        self.cpu_per_game = []
+        self.games = 0
+        self.finished_games = 0
+        self.frames = 0
+        self.errors = collections.Counter()
+
+
+    def summary(self):
+        jitter = [abs(interval - self.frame_period) for interval in self.intervals]
+        rows = {
+            "connect_latency_ms": [value * 1000 for value in self.connect],
+            "time_to_first_frame_ms": [value * 1000 for value in self.first_frame],
+            "server_first_frame_ms": [value * 1000 for value in self.server_first_frame],
+            "frame_interval_ms": [value * 1000 for value in self.intervals],
+            "frame_jitter_ms": [value * 1000 for value in jitter],
+            "cpu_per_game_ms_per_s": self.cpu_per_game,
+        }
+        return {
+            name: {"count": len(values), "p50": percentile(values, 50), "p99": percentile(values, 99)}
+            for name, values in rows.items()
+        }
+
+
+class FakeClient:
+    """Un client websocket factice : front humain (ou clavier partage) ou IA."""
+
+    def __init__(self, application, uid, token, metrics, sender="front", binary=False, delta=False):
+        from channels.testing import WebsocketCommunicator
+
+        subprotocols = [f"token_{token}"]
+        if binary:
+            subprotocols.append(wire.SUBPROTOCOL)
+        if delta:
+            subprotocols.append(delta_stream.SUBPROTOCOL)
+        self.communicator = WebsocketCommunicator(application, f"/ws/pong/{uid}/", subprotocols=subprotocols)
+        self.metrics = metrics
+        self.sender = sender
+        self.side = None
+        self.connect_started = None
+        self.last_frame = None
+        self.actions = None
+        self.state = None
+        self.seq = None
+        self.resumed = False
+        self.gameover = False
+        self.closed = False
+
+
+    async def connect(self):
+        self.connect_started = time.perf_counter()
+        connected, _ = await self.communicator.connect(timeout=CONNECT_TIMEOUT)
+        if not connected:
+            self.closed = True
+            self.metrics.errors["connect_refused"] += 1
+            return False
+        self.metrics.connect.append(time.perf_counter() - self.connect_started)
+        return True
+
+
+    async def send(self, **event):
+        await self.communicator.send_to(text_data=json.dumps({**event, "sender": self.sender}))
+
+
+    async def receive(self, timeout=RECEIVE_TIMEOUT):
+        # pas de receive_output(timeout) : a expiration, il annule l'application
+        message = await asyncio.wait_for(self.communicator.output_queue.get(), timeout)
+        if message["type"] == "websocket.close":
+            self.closed = True
+            return None
+        if message.get("bytes") is not None:
+            return wire.decode_frame(message["bytes"])
+        return json.loads(message["text"])
+
+
+    async def play(self, deadline):
+        while not self.closed and not self.gameover:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            try:
+                message = await self.receive(min(remaining, RECEIVE_TIMEOUT))
+            except asyncio.TimeoutError:
+                if deadline - time.perf_counter() > 0:
+                    self.metrics.errors["receive_timeout"] += 1
+                return
+            if message is None:
+                continue
+            if message.get("type") == "init":
+                self.side = message.get("side")
+                continue
+            if message.get("type") == "observation":
+                self.record_frame()
+                await self.observe(message)
+                continue
+            if message.get("type") == "delta":
+                if self.state is None or message["seq"] != self.seq + 1:
+                    # frame perdue : on redemande une keyframe
+                    self.metrics.errors["sequence_gap"] += 1
+                    self.state = None
+                    await self.send(type="keyframe")
+                    continue
+                message = delta_stream.apply(self.state, message)
+            if "ball" not in message:
+                continue
+            self.state = message
+            self.seq = message.get("seq")
+            await self.on_frame(message)
+
+
+    def record_frame(self):
+        now = time.perf_counter()
+        if self.last_frame is None:
+            self.metrics.first_frame.append(now - self.connect_started)
+        else:
+            self.metrics.intervals.append(now - self.last_frame)
+        self.last_frame = now
+        self.metrics.frames += 1
+
+
+    async def on_frame(self, frame):
+        self.record_frame()
+
+        if frame["gameover"] is not None:
+            self.gameover = True
+            return
+
+        if self.sender == "front":
+            # reprise apres un but, une seule fois par but
+            if frame["goal"] != "None":
+                if not self.resumed:
+                    self.resumed = True
+                    await self.send(type="resumeOnGoal")
+                return
+            self.resumed = False
+
+        await self.track(frame["ball"]["y"], frame["paddle1"]["y"], frame["paddle2"]["y"])
+
+
+    async def observe(self, observation):
+        # l'IA factice joue a droite (p2) et vise le point d'impact prevu
+        target = observation["next_collision"][1] / FIELD_HEIGHT
+        paddle = (observation["ai_data"][5] + PADDLE_HEIGHT / 2) / FIELD_HEIGHT
+        await self.track(target, None, paddle)
+
+
+    async def track(self, ball, paddle1, paddle2):
+        sides = ("p1", "p2") if self.side is None else (self.side,)
+        actions = []
+        for side in ("p1", "p2"):
+            action = 0
+            if side in sides:
+                paddle = paddle1 if side == "p1" else paddle2
+                if ball < paddle - TRACKING_DEADZONE:
+                    action = 1
+                elif ball > paddle + TRACKING_DEADZONE:
+                    action = -1
+            actions.append(action)
+        if actions == self.actions:
+            return
+        self.actions = actions
+
+        if self.sender == "AI":
+            action = actions[0 if self.side == "p1" else 1]
+            await self.send(type="move", direction={1: "up", -1: "down", 0: "still"}[action])
+        else:
+            await self.send(type="keyDown", player=self.side, event="move", value=actions)
+
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await self.communicator.disconnect(timeout=CONNECT_TIMEOUT)
+        except (Exception, asyncio.CancelledError):
+            self.metrics.errors["disconnect"] += 1
+
+
+class LoadTest:
+    MODES = ("pve", "lan", "keyboard")
+
+    def __init__(self, application, games, duration, mix, metrics, binary=False, delta=False, ai_rate=None):
+        self.application = application
+        self.games = games
+        self.duration = duration
+        self.mix = mix
+        self.binary = binary
+        self.delta = delta
+        self.ai_rate = ai_rate
+        self.metrics = metrics
+        self._ids = itertools.count()
+
+
+    def client(self, uid, username=None, sender="front"):
+        token = os.environ["AI_SERVICE_TOKEN"] if username is None else user_token(username)
+        # l'IA reste en JSON (ses observations n'existent pas en binaire)
+        binary = self.binary and sender == "front"
+        return FakeClient(self.application, uid, token, self.metrics, sender=sender, binary=binary, delta=self.delta)
+
+
+    async def run(self):
+        modes = [mode for mode in self.MODES for _ in range(self.mix.get(mode, 0))]
+        deadline = time.perf_counter() + self.duration
+        await asyncio.gather(*(self.slot(modes[i % len(modes)], deadline) for i in range(self.games)))
+
+
+    async def slot(self, mode, deadline):
+        while time.perf_counter() < deadline:
+            try:
+                await getattr(self, f"play_{mode}")(next(self._ids), deadline)
+            except Exception as e:
+                self.metrics.errors[type(e).__name__] += 1
+                logging.error(f"Load test {mode} game failed: {e!r}")
+                await asyncio.sleep(1)
+
+
+    async def play_pve(self, n, deadline):
+        # un uid qui finit par 2 met l'IA en p2
+        uid = f"pve{n}-2"
+        human = self.client(uid, f"load{n}")
+        ai = self.client(uid, sender="AI")
+        await self.play(uid, [human, ai], deadline, starters=[human], greeters=[ai])
+
+
+    async def play_lan(self, n, deadline):
+        uid = f"PVP{n}"
+        clients = [self.client(uid, f"load{n}a"), self.client(uid, f"load{n}b")]
+        await self.play(uid, clients, deadline, starters=clients, greeters=clients)
+
+
+    async def play_keyboard(self, n, deadline):
+        uid = f"k{n}k"
+        client = self.client(uid, f"load{n}")
+        await self.play(uid, [client], deadline, starters=[client], greeters=[client])
+
+
+    async def play(self, uid, clients, deadline, starters, greeters):
+        from .game.game_manager import game_manager
+
+        self.metrics.games += 1
+        game = None
+        try:
+            for client in clients:
+                if not await client.connect():
+                    return
+            wrapper = game_manager.active_games.get(uid)
+            game = wrapper.game if wrapper is not None else None
+
+            for client in greeters:
+                await client.send(type="greetings")
+                if client.sender == "AI" and self.ai_rate:
+                    await client.send(type="observation_rate", rate=self.ai_rate)
+            for client in starters:
+                await client.send(type="start", data="init")
+
+            await asyncio.gather(*(client.play(deadline) for client in clients))
+            if any(client.gameover for client in clients):
+                self.metrics.finished_games += 1
+        finally:
+            for client in clients:
+                await client.close()
+            if game is not None and game.sim_time > 0:
+                self.metrics.cpu_per_game.append(game.cpu_time * 1000 / game.sim_time)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        mode, _, weight = part.partition(":")
+        if mode not in LoadTest.MODES:
+            raise argparse.ArgumentTypeError(f"unknown game mode {mode!r}")
+        mix[mode] = int(weight or 1)
+    return mix
+
+
+async def main_async(args):
+    stub = StubBackend(latency=args.latency / 1000)
+    setup_environment(await stub.start())
+
+    from .game.game import Game
+    from .backend import backend
+    from .outbox import outbox
+    from .game.game_manager import game_manager
+    from PongGame.asgi import application
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    metrics = Metrics(frame_period=1 / Game().frame_rate)
+    load = LoadTest(application, args.games, args.duration, args.mix, metrics, binary=args.binary, delta=args.delta,
+                    ai_rate=args.ai_rate)
+
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    try:
+        await load.run()
+    finally:
+        # les requetes de fin de partie partent en differe
+        await outbox.drain()
+        await outbox.close()
+        await backend.close()
+        await stub.stop()
+    cpu = time.process_time() - cpu_started
+    wall = time.perf_counter() - wall_started
+
+    metrics.server_first_frame = list(FrameSender.first_frame_delays)
+    report = {
+        "games": args.games,
+        "duration": args.duration,
+        "latency_ms": args.latency,
+        "mix": args.mix,
+        "binary": args.binary,
+        "delta": args.delta,
+        "ai_rate": args.ai_rate,
+        "physics_engine": game_manager.scheduler.engine,
+        "games_played": metrics.games,
+        "games_finished": metrics.finished_games,
+        "frames_received": metrics.frames,
+        "frames_sent": FrameSender.total_sent,
+        "frames_dropped": FrameSender.total_dropped,
+        "process_cpu_percent": cpu / wall * 100,
+        "process_cpu_per_game_ms_per_s": cpu * 1000 / wall / args.games,
+        "scheduler": game_manager.scheduler.stats(),
+        "backend_requests": dict(stub.requests),
+        "backend_connections": len(stub.connections),
+        "errors": dict(metrics.errors),
+        "metrics": metrics.summary(),
+    }
+    return report
+
+
+def print_report(report):
+    print(f"{report['games']} concurrent games for {report['duration']} s "
+          f"(mix {report['mix']}, backend latency {report['latency_ms']} ms, engine {report['physics_engine']})")
+    print(f"games played {report['games_played']}, finished {report['games_finished']}, "
+          f"frames received {report['frames_received']} (sent {report['frames_sent']}, "
+          f"dropped {report['frames_dropped']})")
+    print(f"process CPU {report['process_cpu_percent']:.1f} %, "
+          f"{report['process_cpu_per_game_ms_per_s']:.2f} ms/s per game")
+    print(f"scheduler {report['scheduler']}")
+    print(f"backend requests {report['backend_requests']} over {report['backend_connections']} connections")
+    if report["errors"]:
+        print(f"errors {report['errors']}")
+    print(f"{'':28} {'count':>8} {'p50':>10} {'p99':>10}")
+    for name, row in report["metrics"].items():
+        print(f"{name:28} {row['count']:8} {row['p50']:10.2f} {row['p99']:10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge du serveur de jeu, en process")
+    parser.add_argument("--games", type=int, default=20, help="nombre de parties simultanees")
+    parser.add_argument("--duration", type=float, default=30, help="duree du test, en secondes")
+    parser.add_argument("--latency", type=float, default=0, help="latence du faux backend, en ms")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("pve,lan,keyboard"),
+                        help="repartition des modes, par exemple pve:2,lan:1,keyboard:1")
+    parser.add_argument("--output", help="fichier JSON ou enregistrer le rapport")
+    parser.add_argument("--binary", action="store_true", help="frames binaires (pong.bin.v2) pour les clients humains")
+    parser.add_argument("--delta", action="store_true", help="flux keyframe + delta (pong.delta.v1)")
+    parser.add_argument("--ai-rate", type=float, help="observations par seconde demandees par l'IA (une par frame sinon)")
+    parser.add_argument("--verbose", action="store_true", help="garde les logs du serveur")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
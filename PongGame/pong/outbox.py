@@ -0,0 +1,424 @@
+"""
+Boite d'envoi des requetes au backend qui n'ont pas besoin de reponse (stats des joueurs,
+cleanup de la partie, resultat de fin de partie).
+
+Le consumer confie la requete a la boite d'envoi et continue sans attendre le backend. Une
+tache de fond l'ecrit dans une base SQLite locale, envoie les requetes en attente par lots, en
+parallele sur la session partagee (pong.backend), et recommence plus tard en cas d'echec (delai
+doublant a chaque essai, borne). Chaque requete a une cle (par exemple "cleanup:<uid>") : une
+requete deja en attente avec la meme cle est remplacee au lieu d'etre envoyee deux fois.
+Les requetes restent dans la base jusqu'a leur envoi, y compris si le process redemarre.
+
+Aucun secret n'est ecrit dans la base : seuls la cle et le contenu de la requete y sont. Les
+en-tetes d'authentification (GAME_SERVICE_TOKEN) sont reconstruits depuis l'environnement au
+moment de l'envoi, et le token du joueur reste en memoire jusqu'a son "exp" : une requete qui
+en a besoin est abandonnee si le token a expire ou a ete perdu par un redemarrage.
+
+SQLite tourne dans un thread dedie, jamais sur la boucle asyncio. Si le fichier ne peut pas
+etre ouvert (systeme de fichiers en lecture seule, dossier absent...), la boite d'envoi garde
+les requetes en memoire : elles sont toujours envoyees et retentees, mais perdues au redemarrage.
+
+Reglages (variables d'environnement) :
+    PONG_OUTBOX_PATH         fichier SQLite (<repertoire temporaire>/pong/outbox.sqlite3)
+    PONG_OUTBOX_BATCH_SIZE   requetes envoyees par lot (32)
+    PONG_OUTBOX_BACKOFF_MAX  delai maximum entre deux essais, en secondes (60)
+"""
+import asyncio
+import concurrent.futures
+import functools
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+from .backend import backend
+
+
+OUTBOX_PATH = os.getenv('PONG_OUTBOX_PATH', os.path.join(tempfile.gettempdir(), 'pong', 'outbox.sqlite3'))
+BATCH_SIZE = int(os.getenv('PONG_OUTBOX_BATCH_SIZE', '32'))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = float(os.getenv('PONG_OUTBOX_BACKOFF_MAX', '60'))
+# attente maximale de la tache quand rien n'est du
+POLL_INTERVAL = 5
+
+# authentification ajoutee a l'envoi : en-tetes (Authorization, Client_token) ou champs du formulaire
+AUTH_HEADERS = 'headers'
+AUTH_FORM = 'form'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    key TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    method TEXT NOT NULL,
+    url TEXT NOT NULL,
+    request TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created REAL NOT NULL
+)
+"""
+
+
+def retryable(status):
+    # les autres 4xx ne passeront pas mieux au prochain essai
+    return status >= 500 or status in (408, 429)
+
+
+async def http_send(method, url, request):
+    """Envoie une requete enregistree et retourne le code HTTP."""
+    session = await backend.session()
+    async with session.request(
+            method,
+            url,
+            json=request.get('json'),
+            data=request.get('data'),
+            headers=request.get('headers'),
+    ) as response:
+        await response.read()
+        return response.status
+
+
+class SqliteStore:
+    """Requetes en attente dans un fichier SQLite, utilise seulement depuis le thread de l'outbox."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, isolation_level=None)
+        try:
+            # ecritures courtes et sans fsync a chaque commit
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(SCHEMA)
+        except sqlite3.Error:
+            self.db.close()
+            raise
+
+
+    def save(self, requests):
+        self.db.executemany(
+            "INSERT INTO outbox (key, method, url, request, next_attempt, created) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET version = version + 1, method = excluded.method, url = excluded.url, "
+            "request = excluded.request, attempts = 0, next_attempt = excluded.next_attempt",
+            [(key, method, url, _dumps(request), now, now) for key, (method, url, request, now) in requests.items()],
+        )
+
+
+    def due(self, now, limit):
+        rows = self.db.execute(
+            "SELECT key, version, method, url, request, attempts FROM outbox "
+            "WHERE next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+            (now, limit),
+        ).fetchall()
+        return [(key, version, method, url, json.loads(request), attempts)
+                for key, version, method, url, request, attempts in rows]
+
+
+    def next_attempt(self):
+        return self.db.execute("SELECT MIN(next_attempt) FROM outbox").fetchone()[0]
+
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+    def record(self, retries, done):
+        """Reprogramme ou retire les requetes envoyees, retourne les cles retirees."""
+        removed = []
+        # un seul commit pour tout le lot
+        self.db.execute("BEGIN")
+        try:
+            self.db.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt = ? WHERE key = ? AND version = ?",
+                [(next_attempt, key, version) for key, version, next_attempt in retries],
+            )
+            for key, version in done:
+                # une version plus recente, enregistree pendant l'envoi, reste en attente
+                if self.db.execute("DELETE FROM outbox WHERE key = ? AND version = ?", (key, version)).rowcount:
+                    removed.append(key)
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+        return removed
+
+
+    def close(self):
+        self.db.close()
+
+
+class MemoryStore:
+    """Meme interface que SqliteStore, sans fichier : les requetes sont perdues au redemarrage."""
+
+    def __init__(self):
+        self.rows = {}
+
+
+    def save(self, requests):
+        for key, (method, url, request, now) in requests.items():
+            previous = self.rows.get(key)
+            version = previous['version'] + 1 if previous is not None else 0
+            self.rows[key] = {'version': version, 'method': method, 'url': url, 'request': request,
+                              'attempts': 0, 'next_attempt': now}
+
+
+    def due(self, now, limit):
+        rows = sorted((row['next_attempt'], key) for key, row in self.rows.items() if row['next_attempt'] <= now)
+        return [(key, self.rows[key]['version'], self.rows[key]['method'], self.rows[key]['url'],
+                 self.rows[key]['request'], self.rows[key]['attempts']) for _, key in rows[:limit]]
+
+
+    def next_attempt(self):
+        return min((row['next_attempt'] for row in self.rows.values()), default=None)
+
+
+    def count(self):
+        return len(self.rows)
+
+
+    def record(self, retries, done):
+        for key, version, next_attempt in retries:
+            row = self.rows.get(key)
+            if row is not None and row['version'] == version:
+                row['attempts'] += 1
+                row['next_attempt'] = next_attempt
+        removed = []
+        for key, version in done:
+            row = self.rows.get(key)
+            if row is not None and row['version'] == version:
+                del self.rows[key]
+                removed.append(key)
+        return removed
+
+
+    def close(self):
+        self.rows.clear()
+
+
+class Outbox:
+
+    def __init__(self, path=OUTBOX_PATH, send=http_send, batch_size=BATCH_SIZE,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, clock=time.time):
+        self.path = path
+        self.send = send
+        self.batch_size = batch_size
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self.delivered = 0
+        self.failed = 0
+        self._store = None
+        self._executor = None
+        # requetes pas encore ecrites dans le store (par cle, la plus recente gagne)
+        self._incoming = {}
+        # tokens des joueurs, jamais ecrits dans le store : cle -> (token, exp)
+        self._user_tokens = {}
+        self._task = None
+        self._wake = asyncio.Event()
+
+
+    def enqueue(self, key, method, url, json=None, data=None, accept=(200,), auth=None,
+                user_token=None, expires=None):
+        """
+        Enregistre une requete ; remplace celle qui attend deja sous la meme cle.
+        auth (AUTH_HEADERS, AUTH_FORM) ajoute les tokens a l'envoi, user_token est garde en memoire
+        jusqu'a expires (timestamp, None si le token n'expire pas).
+        """
+        request = {'json': json, 'data': data, 'accept': list(accept), 'auth': auth}
+        if user_token:
+            self._user_tokens[key] = (user_token, float(expires) if expires is not None else None)
+        else:
+            self._user_tokens.pop(key, None)
+        self._incoming[key] = (method, url, request, self.clock())
+        self.start()
+        self._wake.set()
+
+
+    async def pending(self):
+        return len(self._incoming) + await self._call(self._count)
+
+
+    def start(self):
+        """Lance la tache d'envoi (a appeler depuis la boucle asyncio), reprend ce qui est en base."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+
+    async def drain(self, timeout=5):
+        """Attend que tout soit envoye (ou abandonne), pour l'arret et les tests."""
+        deadline = time.monotonic() + timeout
+        while await self.pending() and time.monotonic() < deadline:
+            self._wake.set()
+            await asyncio.sleep(0.02)
+        return await self.pending() == 0
+
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self._flush()
+        except sqlite3.Error as e:
+            logging.error(f"Outbox database error, {len(self._incoming)} requests lost: {e}")
+            self._incoming = {}
+        if self._executor is None:
+            return
+        await self._call(self._close_store)
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+
+    async def _run(self):
+        errors = 0
+        while True:
+            self._wake.clear()
+            try:
+                await self._flush()
+                batch = await self._call(self._due)
+                if batch:
+                    statuses = await asyncio.gather(*(self._deliver(row) for row in batch))
+                    await self._record(batch, statuses)
+                    errors = 0
+                    continue
+                delay = await self._call(self._idle_delay)
+                errors = 0
+            except sqlite3.Error as e:
+                # base verrouillee, disque plein... : on reessaie plus tard sans perdre la tache
+                delay = min(self.backoff_base * 2 ** errors, self.backoff_max)
+                errors += 1
+                logging.error(f"Outbox database error, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+    async def _call(self, function, *args):
+        # un seul thread : la connexion SQLite n'est utilisee que depuis celui-ci
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='pong-outbox')
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(function, *args))
+
+
+    def _open(self):
+        if self._store is None:
+            try:
+                self._store = SqliteStore(self.path)
+            except (sqlite3.Error, OSError) as e:
+                logging.warning(f"Outbox database {self.path} unavailable ({e}), "
+                                f"pending requests are kept in memory only")
+                self._store = MemoryStore()
+        return self._store
+
+
+    def _close_store(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+
+    def _count(self):
+        return self._open().count()
+
+
+    async def _flush(self):
+        if not self._incoming:
+            return
+        incoming, self._incoming = self._incoming, {}
+        try:
+            await self._call(self._save, incoming)
+        except BaseException:
+            # gardees pour le prochain essai, sans ecraser celles arrivees entre temps
+            self._incoming = {**incoming, **self._incoming}
+            raise
+
+
+    def _save(self, incoming):
+        self._open().save(incoming)
+
+
+    def _due(self):
+        return self._open().due(self.clock(), self.batch_size)
+
+
+    def _idle_delay(self):
+        next_attempt = self._open().next_attempt()
+        if next_attempt is None:
+            return POLL_INTERVAL
+        return min(POLL_INTERVAL, max(0.0, next_attempt - self.clock()))
+
+
+    def _record_sent(self, retries, done):
+        return self._open().record(retries, done)
+
+
+    def _authorize(self, key, request):
+        """Requete prete a envoyer avec ses tokens, None si le token du joueur manque."""
+        auth = request.get('auth')
+        if auth is None:
+            return request
+        token, expires = self._user_tokens.get(key, (None, None))
+        if expires is not None and expires <= self.clock():
+            # jamais de token expire renvoye au backend
+            token = None
+        service_token = os.getenv('GAME_SERVICE_TOKEN')
+        if auth == AUTH_FORM:
+            if token is None:
+                return None
+            return dict(request, data=dict(request['data'], token=token, game_service_token=service_token))
+        headers = {'Content-Type': 'application/json', 'Authorization': f"{service_token}"}
+        if token is not None:
+            headers['Client_token'] = token
+        return dict(request, headers=headers)
+
+
+    async def _deliver(self, row):
+        key, _, method, url, request, _ = row
+        authorized = self._authorize(key, request)
+        if authorized is None:
+            logging.warning(f"Outbox request {key} dropped: the player token expired or was lost")
+            return 'expired'
+        try:
+            return await self.send(method, url, authorized)
+        except Exception as e:
+            logging.warning(f"Outbox request {key} failed: {e}")
+            return None
+
+
+    async def _record(self, batch, statuses):
+        now = self.clock()
+        retries = []
+        done = []
+        for (key, version, method, url, request, attempts), status in zip(batch, statuses):
+            if status is None or (status != 'expired' and status not in request['accept'] and retryable(status)):
+                retries.append((key, version, now + min(self.backoff_base * 2 ** attempts, self.backoff_max)))
+                continue
+            if status in request['accept']:
+                self.delivered += 1
+            else:
+                self.failed += 1
+                if status != 'expired':
+                    logging.error(f"Outbox request {key} rejected: {method} {url} -> {status}")
+            done.append((key, version))
+        removed = await self._call(self._record_sent, retries, done)
+        for key in removed:
+            if key not in self._incoming:
+                self._user_tokens.pop(key, None)
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+outbox = Outbox()
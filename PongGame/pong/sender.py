@@ -0,0 +1,87 @@
+import asyncio
+import collections
+import logging
+import time
+
+
+class FrameSender:
+    """
+    File d'envoi des frames d'un client, avec sa propre tache d'envoi : la boucle de jeu
+    ne fait que deposer la frame, elle n'attend jamais le socket.
+    Une seule frame en attente : la plus recente remplace celle qui n'est pas encore partie,
+    et la frame remplacee est comptee comme perdue.
+    """
+
+    # totaux sur tous les clients du process (rapport du test de charge)
+    total_sent = 0
+    total_dropped = 0
+    # delais connect -> premiere frame envoyee (secondes), les plus recents
+    first_frame_delays = collections.deque(maxlen=10000)
+
+    def __init__(self, send, started=None, label=None):
+        self._send = send
+        # instant du connect (time.monotonic), pour mesurer le delai jusqu'a la premiere frame
+        self.started = started
+        # nom du client dans les logs
+        self.label = label
+        self.first_frame_delay = None
+        self.sent = 0
+        self.dropped = 0
+        self._pending = None
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task = asyncio.ensure_future(self._run())
+
+
+    def push(self, **message):
+        if self._task.done():
+            return
+        if self._pending is not None:
+            self.dropped += 1
+            FrameSender.total_dropped += 1
+        self._pending = message
+        self._idle.clear()
+        self._ready.set()
+
+
+    @property
+    def has_pending(self):
+        # la prochaine frame deposee remplacera celle-ci
+        return self._pending is not None
+
+
+    async def flush(self, timeout=1):
+        """Attend que la derniere frame deposee soit partie (avant un message hors frames)."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+    def close(self):
+        self._task.cancel()
+        self._idle.set()
+
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            message, self._pending = self._pending, None
+            if message is not None:
+                try:
+                    await self._send(**message)
+                except Exception as e:
+                    logging.error(f"Error sending frame: {e}")
+                    self._idle.set()
+                    return
+                self.sent += 1
+                FrameSender.total_sent += 1
+                if self.started is not None and self.first_frame_delay is None:
+                    self.first_frame_delay = time.monotonic() - self.started
+                    FrameSender.first_frame_delays.append(self.first_frame_delay)
+                    logging.info(f"First frame for {self.label or 'client'} sent "
+                                 f"{self.first_frame_delay * 1000:.1f} ms after connect")
+            if self._pending is None:
+                self._idle.set()
@@ -1,3 +1,1203 @@
-from django.test import TestCase
+import asyncio
+import gc
+import json
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from django.test import SimpleTestCase
+
+from . import auth
+from .backend import BackendClient
+from .benchmarks import next_collision_scenarios
+from .consumers import PongConsumer, parse_input_fast
+from .game.batch import BatchPhysics
+from .game import delta, wire
+from .game.clock import SimulatedClock
+from .game.game import Game
+from .game.game_status import GameStatus
+from .game.game_manager import GameManager
+from .game.game_wrapper import GameWrapper
+from .game.input_log import InputLog
+from .game.replay import replay
+from .game.scheduler import GameScheduler
+from .game.timer_wheel import TimerWheel
+from .outbox import AUTH_FORM, AUTH_HEADERS, Outbox, SqliteStore
+from .sender import FrameSender
+
+
+class GameAdvanceTest(SimpleTestCase):
+
+    def paused_game(self, tick_rate=1000):
+        # pas de but ni de fin de partie : seule la cadence compte
+        game = Game()
+        game.tick_rate = tick_rate
+        game.pause = True
+        return game
+
+    def run_clock(self, game, duration, step=0.0005):
+        frames = []
+        for i in range(int(duration / step)):
+            while game.advance(i * step):
+                game.emit_frame()
+                frames.append(game.tick)
+        return frames
+
+    def test_sixty_frames_per_second_at_every_tick_rate(self):
+        for tick_rate in (1000, 240, 120, 60):
+            frames = self.run_clock(self.paused_game(tick_rate), 10)
+            gaps = {b - a for a, b in zip(frames, frames[1:])}
+            # 1000 Hz : 16 ou 17 ticks entre deux frames, 60 par seconde en moyenne
+            self.assertEqual(len(frames), 600, tick_rate)
+            self.assertLessEqual(max(gaps) - min(gaps), 1, tick_rate)
+            self.assertEqual(min(gaps), tick_rate // 60, tick_rate)
+
+    def test_stalled_clock_drops_the_backlog(self):
+        game = self.paused_game()
+        self.assertFalse(game.advance(0.0))
+        self.assertEqual(game.tick, 1)
+        # une seconde sans reveil : 50 ticks rattrapes, le reste abandonne
+        frames = []
+        while game.advance(1.0):
+            game.emit_frame()
+            frames.append(game.tick)
+        self.assertEqual(game.dropped_ticks, 949)
+        self.assertEqual(game.tick, 1 + game.max_catch_up_ticks + 1)
+        self.assertEqual(len(frames), 3)
+        # prochaine frame une periode apres la derniere, pas avant
+        deadline = game.next_deadline()
+        self.assertAlmostEqual(deadline, 1.015)
+        self.assertFalse(game.advance(deadline - 0.0005))
+        self.assertTrue(game.advance(deadline))
+        self.assertEqual(game.tick - frames[-1], 17)
+
+
+class GameSchedulerTest(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = SimulatedClock()
+        self.frames = []
+
+    def game(self):
+        game = Game(clock=self.clock)
+        game.pause = True
+        return game
+
+    def recorder(self, game_id):
+        def on_frame(frame):
+            self.frames.append((self.clock.now(), game_id, frame is not None))
+        return on_frame
+
+    def run_scheduler(self, scheduler, duration, during=None):
+        async def scenario():
+            if during is not None:
+                during(scheduler)
+            while self.clock.now() < duration:
+                await asyncio.sleep(0)
+            for game_id in list(scheduler._entries):
+                scheduler.remove(game_id)
+            await scheduler._task
+        asyncio.run(scenario())
+
+    def test_games_are_woken_in_deadline_order(self):
+        scheduler = GameScheduler(clock=self.clock)
+        games = {f"g{i}": self.game() for i in range(5)}
+        def add_all(scheduler):
+            for game_id, game in games.items():
+                scheduler.add(game_id, game, self.recorder(game_id))
+        self.run_scheduler(scheduler, 2, add_all)
+        times = [time for time, _, sent in self.frames if sent]
+        self.assertEqual(times, sorted(times))
+        for game_id, game in games.items():
+            count = sum(1 for _, frame_id, sent in self.frames if sent and frame_id == game_id)
+            self.assertAlmostEqual(count, 120, delta=1)
+            self.assertEqual(game.dropped_ticks, 0)
+        self.assertEqual(scheduler.stats()["overruns"], 0)
+
+    def test_phases_follow_the_golden_ratio(self):
+        async def scenario():
+            scheduler = GameScheduler(clock=self.clock)
+            games = [self.game() for _ in range(8)]
+            for i, game in enumerate(games):
+                scheduler.add(f"g{i}", game, self.recorder(f"g{i}"))
+            phases = [game.next_tick_time * game.frame_rate for game in games]
+            for game_id in list(scheduler._entries):
+                scheduler.remove(game_id)
+            return phases
+        phases = asyncio.run(scenario())
+        for i, phase in enumerate(phases):
+            self.assertAlmostEqual(phase, i * GameScheduler.PHASE_SPREAD % 1)
+        # 8 parties : aucun trou de plus de 2 / 8 de periode entre deux phases voisines
+        spread = sorted(phases) + [1 + min(phases)]
+        self.assertLess(max(b - a for a, b in zip(spread, spread[1:])), 2 / 8)
+
+    def test_overruns_are_counted_and_logged(self):
+        scheduler = GameScheduler(clock=self.clock)
+        stalled = []
+        def slow_frame(frame):
+            # une frame bloque la boucle 100 ms, une seule fois
+            if frame is not None and not stalled:
+                stalled.append(True)
+                self.clock.advance(0.1)
+        def add(scheduler):
+            scheduler.add("slow", self.game(), slow_frame)
+            scheduler.add("other", self.game(), self.recorder("other"))
+        with self.assertLogs(level="WARNING") as logs:
+            self.run_scheduler(scheduler, 0.5, add)
+        stats = scheduler.stats()
+        self.assertGreater(stats["overruns"], 0)
+        self.assertGreaterEqual(stats["max_lateness"], 0.1 - 1 / 60)
+        self.assertIn("overran", logs.output[0])
+
+    def test_numpy_engine_sends_sixty_frames_per_second(self):
+        for tick_rate in (1000, 120):
+            self.frames = []
+            self.clock = SimulatedClock()
+            scheduler = GameScheduler(engine="numpy", clock=self.clock)
+            games = {f"g{i}": self.game() for i in range(3)}
+            ticks = {game_id: [] for game_id in games}
+            def add_all(scheduler):
+                for game_id, game in games.items():
+                    game.tick_rate = tick_rate
+                    def on_frame(frame, game_id=game_id, game=game):
+                        self.recorder(game_id)(frame)
+                        if frame is not None:
+                            ticks[game_id].append(game.tick)
+                    scheduler.add(game_id, game, on_frame)
+            self.run_scheduler(scheduler, 2, add_all)
+            for game_id in games:
+                times = [time for time, frame_id, sent in self.frames if sent and frame_id == game_id]
+                gaps = [b - a for a, b in zip(times, times[1:])]
+                self.assertAlmostEqual(len(times), 120, delta=1, msg=tick_rate)
+                self.assertLess(max(gaps), 1.01 / 60, tick_rate)
+                tick_gaps = {b - a for a, b in zip(ticks[game_id], ticks[game_id][1:])}
+                self.assertLessEqual(tick_gaps, {tick_rate // 60, -(-tick_rate // 60)}, tick_rate)
+
+    def test_a_game_id_can_be_removed_and_added_again(self):
+        scheduler = GameScheduler(clock=self.clock)
+        first, second = self.game(), self.game()
+        def swap(scheduler):
+            scheduler.add("g", first, self.recorder("first"))
+            scheduler.add("g", second, self.recorder("second"))
+        self.run_scheduler(scheduler, 1, swap)
+        # la premiere partie est retiree (on_frame(None)) avant d'avoir avance
+        self.assertEqual(self.frames[0], (0.0, "first", False))
+        self.assertEqual(first.tick, 0)
+        self.assertAlmostEqual(sum(1 for _, game_id, sent in self.frames if sent and game_id == "second"), 60, delta=1)
+        self.assertEqual(scheduler.stats()["games"], 0)
+
+
+class BatchPhysicsEquivalenceTest(SimpleTestCase):
+
+    def make_games(self, count, seed):
+        random.seed(seed)
+        return [Game() for _ in range(count)]
+
+    def play(self, games, step):
+        # memes decisions (raquettes, reprises apres un but) des deux cotes
+        random.seed(42)
+        trace = []
+        for _ in range(600):
+            step(games, 17)
+            for i, game in enumerate(games):
+                if i % 3 == 0:
+                    game.paddle1.y = 0
+                else:
+                    game.paddle1.y = game.ball.y - game.paddle1.height / 2 + (i % 5) * 7
+                    game.paddle2.y = game.ball.y - game.paddle2.height / 2 - (i % 7) * 5
+                if game.pause and not game.isgameover():
+                    asyncio.run(game.resume_on_goal())
+                trace.append((
+                    game.ball.x, game.ball.y, game.ball.x_vel, game.ball.y_vel,
+                    game.ball.touchedWall, game.ball.lastTouch, game.ball.trajectory_epoch,
+                    game.paddle1.score, game.paddle2.score, game.pause, game.nextCollision,
+                ))
+        return trace
+
+    def test_same_trajectories_as_scalar_game(self):
+        def scalar(games, ticks):
+            for game in games:
+                for _ in range(ticks):
+                    game.step()
+
+        def batch(games, ticks):
+            physics = BatchPhysics(games)
+            physics.step(ticks)
+            physics.store()
+
+        expected = self.play(self.make_games(12, 1), scalar)
+        actual = self.play(self.make_games(12, 1), batch)
+
+        self.assertEqual(actual, expected)
+        self.assertTrue(any(score1 or score2 for *_, score1, score2, _, _ in expected))
+
+    def test_batch_kept_across_frames(self):
+        # un seul lot pour toute la partie : actions, reprises, arrets et frames viennent de l'exterieur
+        def play(games, step, emitted=lambda game: None):
+            trace = []
+            for frame in range(600):
+                for i, game in enumerate(games):
+                    game.inputs.push(0, (frame // 20 + i) % 3 - 1)
+                    game.inputs.push(1, (frame // 15 + 2 * i) % 3 - 1)
+                    if i == 5 and frame == 300:
+                        game.suspend()
+                    elif game.pause and not game.isgameover() and i != 5:
+                        game.resume()
+                    game.inputs.sample()
+                step(games, 17)
+                for game in games:
+                    if game.frame_due():
+                        trace.append(json.dumps(game.emit_frame()))
+                        emitted(game)
+            return trace
+
+        def scalar(games, ticks):
+            for game in games:
+                for _ in range(ticks):
+                    game.step()
+
+        expected = play(self.make_games(8, 3), scalar)
+
+        games = self.make_games(8, 3)
+        physics = BatchPhysics(games)
+        def batch(games, ticks):
+            physics.sync()
+            physics.step(ticks)
+            physics.store()
+
+        self.assertEqual(play(games, batch, physics.emitted), expected)
+        self.assertTrue(any('"goal": "1"' in frame or '"goal": "2"' in frame for frame in expected))
+
+
+class NextCollisionPredictionTest(SimpleTestCase):
+
+    def assertSamePrediction(self, ball, paddle, delta):
+        side, y = ball.calculateNextCollisionPosition(paddle)
+        expected_side, expected_y = ball.simulateNextCollisionPosition(paddle)
+        self.assertEqual(side, expected_side)
+        self.assertAlmostEqual(y, expected_y, delta=delta)
+
+    def test_matches_stepwise_simulation(self):
+        for ball, paddle in next_collision_scenarios(count=300, seed=7):
+            self.assertSamePrediction(ball, paddle, delta=1e-6)
+
+    def test_edge_cases(self):
+        game = Game()
+        game.ball.x_vel = 0.84
+        game.ball.y_vel = 0
+        self.assertSamePrediction(game.ball, game.paddle2, delta=1e-6)
+
+        # balle deja sur la raquette
+        game = Game()
+        game.ball.x = game.paddle2.x
+        game.ball.y = game.paddle2.y + 1
+        self.assertSamePrediction(game.ball, game.paddle2, delta=1e-6)
+
+        # balle qui longe un bord : elle rebondit a chaque pas, la parite du dernier
+        # rebond depend des arrondis, l'ecart reste inferieur a un pas vertical
+        for x_vel in (0.24, -0.24, 1.7):
+            game = Game()
+            game.ball.x_vel = x_vel
+            game.ball.y = game.ball.radius
+            game.ball.y_vel = -1.3
+            for paddle in (game.paddle1, game.paddle2):
+                self.assertSamePrediction(game.ball, paddle, delta=abs(game.ball.y_vel) + 1e-6)
+
+
+    def test_cache_follows_a_ball_that_passes_the_paddle(self):
+        # raquette en haut, balle au milieu : pas de renvoi, but puis pause
+        game = Game(seed=6)
+        game.paddle2.y = 0
+        game.ball.x_vel, game.ball.y_vel = 0.3, 0.1
+        game.ball.trajectory_epoch += 1
+        paddle_x = game.paddle2.x + game.paddle2.width + game.ball.radius
+        checked = []
+        for _ in range(5000):
+            ball = game.ball
+            side, y = ball.cachedNextCollisionPosition(game.paddle2)
+            expected_side, expected_y = ball.calculateNextCollisionPosition(game.paddle2)
+            self.assertEqual(side, expected_side)
+            self.assertAlmostEqual(y, expected_y, delta=1e-6)
+            checked.append((ball.x >= paddle_x, game.pause))
+            game.step()
+        # avant la raquette, apres, puis sur la ligne de but pendant la pause
+        self.assertEqual(sorted(set(checked)), [(False, False), (True, False), (True, True)])
+
+    def test_prediction_follows_the_tick_rate(self):
+        scale = Game.REFERENCE_TICK_RATE / 120
+        for ball, paddle in next_collision_scenarios(count=100, seed=11):
+            side, y = ball.calculateNextCollisionPosition(paddle, scale)
+            self.assertEqual(side, ball.simulateNextCollisionPosition(paddle, scale)[0])
+            self.assertAlmostEqual(y, ball.simulateNextCollisionPosition(paddle, scale)[1], delta=1e-6)
+
+        # a 120 Hz, le point annonce est celui ou la balle touche effectivement la raquette
+        # (vitesse sous le seuil de freinage : la trajectoire ne change pas en route)
+        game = Game(seed=4)
+        game.tick_rate = 120
+        game.paddle2.y = 0
+        game.paddle2.height = game.height
+        game.ball.x_vel = 0.4 * math.cos(math.radians(30))
+        game.ball.y_vel = 0.4 * math.sin(math.radians(30))
+        game.ball.trajectory_epoch += 1
+        predicted = game.predicted_collision()
+        while game.ball.lastTouch != "2":
+            game.step()
+        self.assertEqual(predicted[0], 1)
+        self.assertAlmostEqual(predicted[1], game.ball.y, delta=1e-6)
+
+
+class SweptCollisionTest(SimpleTestCase):
+
+    def rally(self, tick_rate, swept, minutes):
+        # raquettes sur toute la hauteur et balle ramenee a sa vitesse maximale a chaque tick :
+        # un but ne peut venir que d'une balle passee a travers une raquette
+        game = Game(seed=9)
+        game.tick_rate = tick_rate
+        game.swept_collisions = swept
+        for paddle in (game.paddle1, game.paddle2):
+            paddle.y = 0
+            paddle.height = game.height
+        ball = game.ball
+        returns = 0
+        for _ in range(int(minutes * 60 * tick_rate)):
+            speed = math.hypot(ball.x_vel, ball.y_vel)
+            ball.x_vel *= ball.max_speed / speed
+            ball.y_vel *= ball.max_speed / speed
+            last_touch = ball.lastTouch
+            game.step()
+            returns += ball.lastTouch != last_touch
+            if game.pause:
+                break
+        return game.paddle1.score + game.paddle2.score, returns
+
+    def test_no_tunnelling_at_low_tick_rates(self):
+        for tick_rate in (60, 120):
+            goals, returns = self.rally(tick_rate, swept=True, minutes=10)
+            self.assertEqual(goals, 0)
+            self.assertGreater(returns, 500)
+        # sans detection continue, la balle traverse une raquette des le premier echange a 60 Hz
+        self.assertEqual(self.rally(60, swept=False, minutes=1)[0], 1)
+
+    def test_tick_rate_and_sweeping_come_from_the_environment(self):
+        with mock.patch.dict(os.environ, {"PONG_TICK_RATE": "120"}):
+            game = asyncio.run(GameManager().create_or_get_game("PVP1")).game
+        self.assertEqual((game.tick_rate, game.swept_collisions), (120, True))
+        with mock.patch.dict(os.environ, {"PONG_TICK_RATE": "120", "PONG_SWEPT_COLLISIONS": "0"}):
+            self.assertFalse(GameManager().swept_collisions)
+
+
+class WireFormatTest(SimpleTestCase):
+
+    def test_binary_frame_round_trip(self):
+        game = Game(seed=3)
+        for _ in range(400):
+            game.step()
+        frame = game.emit_frame()
+        frame["game_mode"] = "PVE"
+        frame["resumeOnGoal"] = True
+
+        data = wire.encode_frame(frame) + wire.side_suffix("p2")
+        decoded = wire.decode_frame(data)
+
+        self.assertEqual(len(data), wire.SIZE)
+        self.assertEqual(data[0], 2)
+        self.assertEqual(decoded["side"], "p2")
+        with self.assertRaises(ValueError):
+            wire.decode_frame(b"\x01" + data[1:])
+        for key in ("playing", "goal", "gameover", "winner", "game_mode", "resumeOnGoal"):
+            self.assertEqual(decoded[key], frame[key])
+        self.assertEqual(decoded["game"]["pause"], frame["game"]["pause"])
+        for key in ("lastTouch", "touchedWall", "rounded_angle"):
+            self.assertEqual(decoded["ball"][key], frame["ball"][key])
+        for key in ("x", "y", "speed"):
+            self.assertAlmostEqual(decoded["ball"][key], frame["ball"][key], delta=1e-4)
+        for paddle in ("paddle1", "paddle2"):
+            self.assertAlmostEqual(decoded[paddle]["y"], frame[paddle]["y"], delta=1e-4)
+            self.assertEqual(decoded[paddle]["score"], frame[paddle]["score"])
+
+
+class DeltaStreamTest(SimpleTestCase):
+
+    def test_deltas_rebuild_every_frame(self):
+        game = Game(seed=5)
+        stream = delta.DeltaStream(keyframe_interval=50)
+        state = None
+        keyframes = 0
+        for _ in range(400):
+            while not game.frame_due():
+                game.step()
+            frame = game.emit_frame()
+            seq, changes = stream.push(frame)
+            if changes is None:
+                keyframes += 1
+                state = {**frame, "seq": seq}
+            else:
+                self.assertNotIn("paddle1", changes)
+                text = delta.encode(seq, changes)
+                self.assertEqual(text, json.dumps({"type": "delta", "seq": seq, **changes}))
+                state = delta.apply(state, json.loads(text))
+            self.assertEqual(state, {**frame, "seq": seq})
+            if game.pause and not game.isgameover():
+                game.resume()
+        self.assertEqual(keyframes, 9)
+
+    def test_encode_matches_json_dumps(self):
+        deltas = [
+            {},
+            {"ball": {"x": 0.1, "y": 1e-17}},
+            {"ball": {"x": 0.5, "lastTouch": 1}, "paddle2": {"y": 0.25, "score": 2}},
+            {"ball": {"touchedWall": None, "rounded_angle": 0.5}},
+            {"ball": {"x": float("nan")}},
+            {"game": {"pause": True}},
+            {"goal": "p1", "paddle1": {"score": 1}},
+        ]
+        for changes in deltas:
+            self.assertEqual(delta.encode(7, changes), json.dumps({"type": "delta", "seq": 7, **changes}))
+
+
+class FrameSenderTest(SimpleTestCase):
+
+    def test_latest_frame_wins_on_slow_client(self):
+        received = []
+
+        async def slow_send(text_data=None, bytes_data=None):
+            await asyncio.sleep(0.01)
+            received.append(text_data)
+
+        async def scenario():
+            sender = FrameSender(slow_send)
+            for i in range(10):
+                sender.push(text_data=str(i))
+                await asyncio.sleep(0.002)
+            await sender.flush()
+            sender.close()
+            return sender
+
+        sender = asyncio.run(scenario())
+
+        self.assertEqual(received[-1], "9")
+        self.assertEqual(received, sorted(received, key=int))
+        self.assertEqual(sender.sent, len(received))
+        self.assertEqual(sender.sent + sender.dropped, 10)
+        self.assertGreater(sender.dropped, 0)
+
+    def test_first_frame_delay_is_recorded_once(self):
+        async def send(text_data=None, bytes_data=None):
+            pass
+
+        async def scenario():
+            sender = FrameSender(send, started=time.monotonic(), label="game g1")
+            for i in range(3):
+                sender.push(text_data=str(i))
+                await sender.flush()
+            sender.close()
+            return sender
+
+        recorded = len(FrameSender.first_frame_delays)
+        with self.assertLogs(level="INFO") as logs:
+            sender = asyncio.run(scenario())
+        self.assertEqual(sender.sent, 3)
+        self.assertEqual(len(FrameSender.first_frame_delays), recorded + 1)
+        self.assertEqual(FrameSender.first_frame_delays[-1], sender.first_frame_delay)
+        self.assertEqual(len([line for line in logs.output if "First frame for game g1" in line]), 1)
+
+
+class ConsumerFramesTest(SimpleTestCase):
+    """Vrais consumers sans socket : messages envoyes gardes tels quels, parties sur une horloge simulee."""
+
+    def setUp(self):
+        self.clock = SimulatedClock()
+        self.manager = GameManager()
+        self.manager.clock = self.clock
+        self.manager.scheduler = GameScheduler(clock=self.clock)
+        for patcher in (mock.patch("pong.consumers.game_manager", self.manager),
+                        mock.patch("pong.consumers.outbox", mock.MagicMock()),
+                        mock.patch.object(auth.uid_cache, "verify", mock.AsyncMock(return_value=True))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def consumer(self, uid, username=None):
+        consumer = PongConsumer()
+        consumer.sent = []
+        is_ai = username is None
+        consumer.scope = {
+            "auth": {"token": "token", "claims": None if is_ai else {"username": username}, "is_ai": is_ai, "error": None},
+            "url_route": {"kwargs": {"uid": uid}},
+            "subprotocols": ["token_token"],
+        }
+        consumer.channel_layer = mock.AsyncMock()
+        consumer.channel_name = f"channel.{username}"
+
+        async def send(text_data=None, bytes_data=None):
+            consumer.sent.append(text_data if text_data is not None else bytes_data)
+
+        async def accept(subprotocol=None):
+            pass
+
+        async def close(code=None):
+            pass
+
+        consumer.send, consumer.accept, consumer.close = send, accept, close
+        return consumer
+
+    def messages(self, consumer, kind=None):
+        messages = [json.loads(text) for text in consumer.sent]
+        return [message for message in messages if kind is None or message.get("type") == kind]
+
+    def frames(self, consumer):
+        return [message for message in self.messages(consumer) if "ball" in message]
+
+    async def receive(self, consumer, **event):
+        await consumer.receive(json.dumps(event))
+
+    async def play(self, human, ai, duration):
+        # horloge simulee : le scheduler avance aussi vite que la boucle le permet
+        end = self.clock.now() + duration
+        while self.clock.now() < end:
+            await asyncio.sleep(0)
+        self.manager.stop_game(human.game_id)
+        # laisse generate_states et les FrameSender vider les frames deja produites
+        for _ in range(10):
+            await asyncio.sleep(0)
+        for consumer in (human, ai):
+            consumer.frame_sender.close()
+
+    async def start_pve(self, uid="pve1-2", ai_rate=None):
+        # un uid qui finit par 2 met l'IA en p2
+        human, ai = self.consumer(uid, "alice"), self.consumer(uid)
+        await human.connect()
+        await ai.connect()
+        await self.receive(ai, type="greetings", sender="AI")
+        if ai_rate is not None:
+            await self.receive(ai, type="observation_rate", sender="AI", rate=ai_rate)
+        await self.receive(human, type="greetings", sender="front", name=["alice"])
+        await self.receive(human, type="start", sender="front")
+        return human, ai
+
+    def test_side_suffix_matches_json_dumps(self):
+        async def scenario():
+            human, ai = await self.start_pve()
+            await self.play(human, ai, 0.5)
+            return human, ai
+
+        human, ai = asyncio.run(scenario())
+        for consumer in (human, ai):
+            spliced = [text for text in consumer.sent if '"side"' in text and '"init"' not in text]
+            self.assertGreater(len(spliced), 10)
+            for text in spliced:
+                frame = json.loads(text)
+                side = frame.pop("side")
+                self.assertEqual(side, consumer.side)
+                # la frame encodee une fois + le suffixe du client == json.dumps de la frame complete
+                self.assertEqual(text, json.dumps({**frame, "side": consumer.side}))
+
+    def test_ai_observations_are_split_from_frames(self):
+        for uid, requested, expected in (("pve1-2", None, 60), ("pve2-2", 20, 20)):
+            async def scenario():
+                human, ai = await self.start_pve(uid, ai_rate=requested)
+                await self.play(human, ai, 2)
+                return human, ai
+
+            with self.subTest(rate=requested):
+                human, ai = asyncio.run(scenario())
+                frames = self.frames(human)
+                self.assertAlmostEqual(len(frames), 120, delta=2)
+                for frame in frames:
+                    self.assertNotIn("ai_data", frame)
+                    self.assertNotIn("next_collision", frame)
+                    self.assertNotIn("observation", frame)
+                # l'IA ne recoit que ses observations, au rythme demande et pas a chaque frame
+                observations = self.messages(ai, "observation")
+                self.assertEqual(len(observations), len(self.messages(ai)) - len(self.messages(ai, "init")))
+                self.assertAlmostEqual(len(observations), 2 * expected, delta=2)
+                self.assertIn("ai_data", observations[0])
+                self.assertIn("next_collision", observations[0])
+
+    def test_each_client_gets_one_init(self):
+        async def pve():
+            human, ai = await self.start_pve()
+            await self.play(human, ai, 0.2)
+            return human, ai
+
+        async def lan():
+            alice, bob = self.consumer("PVP1", "alice"), self.consumer("PVP1", "bob")
+            await alice.connect()
+            await bob.connect()
+            for consumer in (alice, bob):
+                await self.receive(consumer, type="greetings", sender="front", name=["alice", "bob"])
+            for consumer in (alice, bob):
+                await self.receive(consumer, type="start", sender="front")
+            await self.play(alice, bob, 0.2)
+            return alice, bob
+
+        for scenario, mode, p2 in ((pve, "PVE", "AI"), (lan, "PVP_LAN", "bob")):
+            with self.subTest(mode=mode):
+                clients = asyncio.run(scenario())
+                for consumer, side in zip(clients, ("p1", "p2")):
+                    inits = self.messages(consumer, "init")
+                    self.assertEqual(len(inits), 1)
+                    self.assertEqual(inits[0], {"type": "init", "side": side, "game_mode": mode,
+                                                "opponent_connected": True, "p1": "alice", "p2": p2})
+                    self.assertGreater(len(consumer.sent), 5)
+
+    def test_generate_states_waits_on_readiness_signals(self):
+        async def turns():
+            # tours de boucle sans laisser passer le temps : un sleep() reel ne se terminerait pas ici
+            for _ in range(5):
+                await asyncio.sleep(0)
+
+        async def scenario():
+            human, ai = self.consumer("pve1-2", "alice"), self.consumer("pve1-2")
+            await human.connect()
+            await ai.connect()
+            wrapper = ai.game_wrapper
+            await turns()
+            # generate_states est parque sur la condition, pas dans une boucle de sondage
+            self.assertEqual((human.sent, ai.sent), ([], []))
+            self.assertEqual(len(wrapper._waiters), 1)
+            await self.receive(ai, type="greetings", sender="AI")
+            await turns()
+            self.assertEqual(len(self.messages(human, "init")), 1)
+            self.assertEqual(self.frames(human), [])
+            self.assertEqual(len(wrapper._waiters), 1)
+            # aucune partie dans le scheduler avant "start"
+            self.assertEqual(self.clock.now(), 0)
+            await self.receive(human, type="start", sender="front")
+            await turns()
+            self.assertEqual(wrapper._waiters, [])
+            await self.play(human, ai, 0.1)
+            self.assertGreater(len(self.frames(human)), 5)
+
+        asyncio.run(scenario())
+
+
+class InputParsingTest(SimpleTestCase):
+
+    def test_fast_parser_matches_json(self):
+        messages = [
+            '{"type":"keyDown","sender":"front","player":"p1","event":"player1Up","value":[1,0]}',
+            '{"type":"keyDown","sender":"cli","player":"p2","value":[0, -1]}',
+            '{"type":"keyDown","sender":"front","value":[-1,1]}',
+            '{"type":"move","sender":"AI","direction":"down"}',
+        ]
+        for text in messages:
+            event = parse_input_fast(text)
+            expected = json.loads(text)
+            for key, value in event.items():
+                self.assertEqual(value, expected[key])
+
+    def test_unusual_shapes_fall_back_to_json(self):
+        for text in (
+            '{"type":"keyDown","sender":"front","value":[true,false]}',
+            '{"type":"keyDown","sender":"front","value":[2,0]}',
+            ' {"type":"keyDown","sender":"front","value":[1,0]}',
+            '{"type":"move","sender":"AI","direction":"left"}',
+            '{"type":"start","sender":"front","data":"init"}',
+        ):
+            self.assertIsNone(parse_input_fast(text))
+
+    def test_malformed_messages_are_not_parsed(self):
+        for text in (
+            # tronque, ou suivi d'autre chose
+            '{"type": "keyDown", "sender": "p1", "value": [1, 2]',
+            '{"type":"keyDown","sender":"front","value":[1,0]}}',
+            '{"type":"keyDown","sender":"front","value":[1,0]} junk',
+            '{"type":"move","sender":"AI","direction":"up"',
+            # autre type avec le meme debut
+            '{"type":"keyDownX","sender":"front","value":[1,0]}',
+            '{"type":"keyDown","sender":"front","value":[1,0],"extra":1}',
+            '{"type":"keyDown","sender":"front","value":[01,0]}',
+            '{"type":"keyDown","sender":"front","note":"\\"value\\":[1,0]","value":[1,0]}',
+        ):
+            self.assertIsNone(parse_input_fast(text), text)
+
+    def test_latest_input_wins_at_next_tick(self):
+        game = Game(seed=1)
+        game.inputs.push(0, 1)
+        game.inputs.push(0, -1)
+        game.inputs.push(1, 1)
+        self.assertEqual(game.players[0].action, 0)
+        game.step()
+        self.assertEqual([player.action for player in game.players], [-1, 1])
+        game.inputs.push(1, 0)
+        game.step()
+        self.assertEqual([player.action for player in game.players], [-1, 0])
+
+
+class PaddleMotionTest(SimpleTestCase):
+
+    def test_paddle_speed_does_not_depend_on_tick_rate(self):
+        positions = []
+        for tick_rate in (1000, 200, 120):
+            game = Game(seed=2)
+            game.tick_rate = tick_rate
+            game.pause = True
+            start = game.paddle2.y
+            game.inputs.push(1, -1)
+            for _ in range(tick_rate // 4):
+                game.step()
+            positions.append(game.paddle2.y - start)
+        # 5 pas de paddle.vel par frame a 60 frames/s, pendant 0.25 s
+        self.assertAlmostEqual(positions[0], game.paddle2.vel * 5 * 60 * 0.25, delta=1e-6)
+        for moved in positions[1:]:
+            self.assertAlmostEqual(moved, positions[0], delta=1e-6)
+        self.assertEqual(game.input_log.entries, [(1, 2, -1)])
+
+
+class InputLogTest(SimpleTestCase):
+
+    def test_log_is_capped(self):
+        log = InputLog(seed=1, max_entries=2)
+        for tick in range(1, 5):
+            log.record(tick, 1, tick % 2)
+        self.assertEqual(log.entries, [(1, 1, 1), (2, 1, 0)])
+        self.assertTrue(InputLog.from_dict(log.to_dict()).truncated)
+
+    def test_log_is_written_off_the_event_loop(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with mock.patch.dict(os.environ, {"PONG_REPLAY_DIR": directory.name}):
+            manager = GameManager()
+        threads = []
+        write = InputLog.write
+
+        def record_thread(path, data):
+            threads.append(threading.current_thread())
+            write(path, data)
+
+        async def scenario():
+            game = (await manager.create_or_get_game("PVP1")).game
+            game.inputs.push(0, 1)
+            game.step()
+            await manager.remove_game("PVP1")
+            path = os.path.join(directory.name, f"PVP1-{game.seed}.json")
+            for _ in range(100):
+                if threads:
+                    break
+                await asyncio.sleep(0.01)
+            return path
+
+        with mock.patch.object(InputLog, "write", side_effect=record_thread):
+            path = asyncio.run(scenario())
+        self.assertIsNot(threads[0], threading.main_thread())
+        self.assertEqual(InputLog.load(path).entries, [(1, 1, 1)])
+
+    def play(self, game, seed):
+        # partie jouee comme par le scheduler : actions au fil de l'eau, reprise 300 ticks apres un but
+        rng = random.Random(seed)
+        paused_at = None
+        for i in range(200000):
+            if game.gameOver:
+                break
+            if i % 40 == 0:
+                game.inputs.push(rng.randrange(2), rng.choice((-1, 0, 1)))
+            now = i / game.tick_rate
+            while game.advance(now):
+                game.emit_frame()
+                if game.gameOver:
+                    break
+            if game.pause and not game.gameOver:
+                paused_at = game.tick if paused_at is None else paused_at
+                if game.tick - paused_at > 300:
+                    game.resume()
+                    paused_at = None
+        return game
+
+    def test_recorded_game_replays_to_the_same_state(self):
+        for tick_rate in (1000, 120):
+            game = Game(seed=7)
+            game.tick_rate = tick_rate
+            self.play(game, seed=3)
+            self.assertTrue(game.gameOver)
+            # des actions et au moins une reprise apres un but
+            self.assertIn(InputLog.RESUME, [player for _, player, _ in game.input_log.entries])
+            game.input_log.capture_config(game)
+            # aller-retour par le format du fichier
+            replayed = replay(InputLog.from_dict(json.loads(json.dumps(game.input_log.to_dict()))))
+            state = lambda game: (game.tick, game.paddle1.score, game.paddle2.score, game.ball.x, game.ball.y,
+                                  game.ball.x_vel, game.ball.y_vel, game.paddle1.y, game.paddle2.y)
+            self.assertEqual(state(replayed), state(game), tick_rate)
+
+
+class TokenCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.start = self.now = time.time()
+        self.cache = auth.TokenCache(maxsize=2, clock=lambda: self.now)
+
+    def token(self, username, lifetime=3600):
+        return jwt.encode({"username": username, "exp": int(self.start) + lifetime}, "secret", algorithm="HS256")
+
+    def test_verified_claims_are_reused(self):
+        token = self.token("alice")
+        claims = auth.verify_jwt(token, "secret", self.cache)
+        self.assertEqual(claims["username"], "alice")
+        # deja verifie : la cle n'est plus utilisee
+        self.assertIs(auth.verify_jwt(token, "wrong", self.cache), claims)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_bad_signature_is_not_cached(self):
+        token = self.token("alice")
+        with self.assertRaises(jwt.InvalidTokenError):
+            auth.verify_jwt(token, "wrong", self.cache)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_entries_are_evicted_on_exp_and_lru(self):
+        short, alice, bob = self.token("short", lifetime=60), self.token("alice"), self.token("bob")
+        auth.verify_jwt(short, "secret", self.cache)
+        self.now = self.start + 60
+        self.assertIsNone(self.cache.get(short))
+        auth.verify_jwt(alice, "secret", self.cache)
+        auth.verify_jwt(bob, "secret", self.cache)
+        self.cache.get(alice)
+        auth.verify_jwt(self.token("carol"), "secret", self.cache)
+        self.assertIsNotNone(self.cache.get(alice))
+        self.assertIsNone(self.cache.get(bob))
+
+
+class AuthenticateTest(SimpleTestCase):
+
+    def setUp(self):
+        self.token = jwt.encode({"username": "alice", "exp": int(time.time()) + 3600}, "secret", algorithm="HS256")
+        auth.token_cache.put(self.token, {"username": "alice", "exp": int(time.time()) + 3600})
+        self.addCleanup(auth.token_cache.clear)
+
+    def test_authenticate_reads_the_token_subprotocol(self):
+        self.assertIsNotNone(auth.authenticate([])["error"])
+        self.assertIsNotNone(auth.authenticate(["token_not.a.jwt"])["error"])
+        result = auth.authenticate([f"token_{self.token}", "pong.bin.v2"])
+        self.assertEqual((result["token"], result["claims"]["username"], result["error"]), (self.token, "alice", None))
+
+
+class BackendClientTest(SimpleTestCase):
+
+    def test_session_is_closed_at_exit_without_lifespan(self):
+        # comme sous daphne : boucle arretee, jamais fermee, sans evenement lifespan.shutdown
+        client = BackendClient()
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        session = loop.run_until_complete(client.session())
+        client.close_at_exit()
+        self.assertTrue(session.closed)
+        # deja fermee, ou boucle fermee : rien a faire
+        client.close_at_exit()
+
+
+class OutboxTest(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "outbox.sqlite3")
+        self.sent = []
+        self.requests = []
+        self.statuses = []
+
+    async def send(self, method, url, request):
+        self.sent.append((method, url, request.get("json")))
+        self.requests.append(request)
+        return self.statuses.pop(0) if self.statuses else 200
+
+    def outbox(self):
+        return Outbox(self.path, send=self.send, backoff_base=0.01)
+
+    def run_outbox(self, steps):
+        async def run():
+            outbox = self.outbox()
+            try:
+                await steps(outbox)
+                self.assertTrue(await outbox.drain(timeout=2))
+            finally:
+                await outbox.close()
+        asyncio.run(run())
+
+    def test_duplicates_per_key_are_merged(self):
+        async def steps(outbox):
+            outbox.enqueue("cleanup:a", "DELETE", "/game/cleanup/a/", json=1)
+            outbox.enqueue("cleanup:a", "DELETE", "/game/cleanup/a/", json=2)
+            outbox.enqueue("cleanup:b", "DELETE", "/game/cleanup/b/", json=3)
+        self.run_outbox(steps)
+        self.assertEqual(sorted(self.sent), [("DELETE", "/game/cleanup/a/", 2), ("DELETE", "/game/cleanup/b/", 3)])
+
+    def test_failures_are_retried_and_rejections_dropped(self):
+        self.statuses = [503, 502, 200, 403]
+        async def steps(outbox):
+            outbox.enqueue("game_new:a", "POST", "/game/new/", json="a")
+            await asyncio.sleep(0.2)
+            outbox.enqueue("stats:a:p1", "POST", "/stats/", json="b")
+        self.run_outbox(steps)
+        self.assertEqual([body for _, _, body in self.sent], ["a", "a", "a", "b"])
+
+    def test_pending_requests_survive_a_restart(self):
+        async def stopped():
+            outbox = Outbox(self.path, send=self.send)
+            outbox.enqueue("cleanup:a", "DELETE", "/game/cleanup/a/", json=1)
+            # arret avant que la tache n'ait envoye quoi que ce soit
+            await outbox.close()
+        asyncio.run(stopped())
+        self.assertEqual(self.sent, [])
+        async def restarted(outbox):
+            outbox.start()
+        self.run_outbox(restarted)
+        self.assertEqual(self.sent, [("DELETE", "/game/cleanup/a/", 1)])
+
+    def test_credentials_are_added_at_send_time_and_never_stored(self):
+        async def stopped():
+            outbox = Outbox(self.path, send=self.send)
+            outbox.enqueue("cleanup:a", "DELETE", "/game/cleanup/a/", auth=AUTH_HEADERS,
+                           user_token="player-jwt", expires=time.time() + 60)
+            await outbox.close()
+        with mock.patch.dict(os.environ, {"GAME_SERVICE_TOKEN": "service-secret"}):
+            asyncio.run(stopped())
+        with open(self.path, "rb") as database:
+            stored = database.read()
+        self.assertNotIn(b"player-jwt", stored)
+        self.assertNotIn(b"service-secret", stored)
+        async def restarted(outbox):
+            outbox.start()
+        with mock.patch.dict(os.environ, {"GAME_SERVICE_TOKEN": "rotated-secret"}):
+            self.run_outbox(restarted)
+        # token de service relu a l'envoi, token du joueur perdu au redemarrage
+        self.assertEqual(self.requests[0]["headers"]["Authorization"], "rotated-secret")
+        self.assertNotIn("Client_token", self.requests[0]["headers"])
+
+    def test_expired_player_tokens_are_not_sent(self):
+        async def steps(outbox):
+            outbox.enqueue("stats:a:p1", "POST", "/stats/", data={"goals": "3"}, auth=AUTH_FORM,
+                           user_token="player-jwt", expires=time.time() + 60)
+            outbox.enqueue("stats:b:p1", "POST", "/stats/", data={"goals": "1"}, auth=AUTH_FORM,
+                           user_token="old-jwt", expires=time.time() - 1)
+        with self.assertLogs(level="WARNING"):
+            self.run_outbox(steps)
+        self.assertEqual([request["data"]["token"] for request in self.requests], ["player-jwt"])
+
+    def test_unwritable_path_falls_back_to_memory(self):
+        # le "dossier" de la base est un fichier : ni SQLite ni makedirs ne peuvent l'utiliser
+        open(self.path, "w").close()
+        self.path = os.path.join(self.path, "outbox.sqlite3")
+        async def steps(outbox):
+            outbox.enqueue("cleanup:a", "DELETE", "/game/cleanup/a/", json=1)
+        with self.assertLogs(level="WARNING") as logs:
+            self.run_outbox(steps)
+        self.assertIn("kept in memory", logs.output[0])
+        self.assertEqual(self.sent, [("DELETE", "/game/cleanup/a/", 1)])
+
+    def test_database_errors_are_retried(self):
+        due = SqliteStore.due
+        calls = []
+        def locked_once(store, now, limit):
+            calls.append(threading.current_thread())
+            if len(calls) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            return due(store, now, limit)
+        async def steps(outbox):
+            outbox.enqueue("cleanup:a", "DELETE", "/game/cleanup/a/", json=1)
+        with mock.patch.object(SqliteStore, "due", locked_once), self.assertLogs(level="ERROR"):
+            self.run_outbox(steps)
+        self.assertEqual(self.sent, [("DELETE", "/game/cleanup/a/", 1)])
+        # jamais sur la boucle asyncio
+        self.assertNotIn(threading.main_thread(), calls)
+
+    def test_disconnect_without_sqlite(self):
+        # systeme de fichiers en lecture seule : SQLite ne peut pas ouvrir la base
+        token = jwt.encode({"username": "alice", "exp": int(time.time()) + 3600}, "secret", algorithm="HS256")
+        auth.token_cache.put(token, {"username": "alice", "exp": int(time.time()) + 3600})
+        self.addCleanup(auth.token_cache.clear)
+        self.path = "/nonexistent/outbox.sqlite3"
+        async def run():
+            outbox = self.outbox()
+            consumer = PongConsumer()
+            consumer.scope = {"subprotocols": [f"token_{token}"], "url_route": {"kwargs": {"uid": "g1"}}}
+            self.assertTrue(await consumer.verify_token())
+            consumer.game_id, consumer.side, consumer.mode = "g1", "p1", "PVP_LAN"
+            consumer.game_wrapper = mock.MagicMock(game=Game(), present_players=2)
+            consumer.game_wrapper.peer.return_value = None
+            try:
+                with mock.patch("pong.consumers.outbox", outbox), \
+                        mock.patch("sqlite3.connect", side_effect=sqlite3.OperationalError("unable to open database file")):
+                    await consumer.disconnect(1000)
+                    self.assertTrue(await outbox.drain(timeout=2))
+            finally:
+                await outbox.close()
+        with self.assertLogs(level="WARNING") as logs:
+            asyncio.run(run())
+        self.assertTrue(any("kept in memory" in line for line in logs.output))
+        requests = dict(zip((method for method, _, _ in self.sent), self.requests))
+        self.assertEqual(requests["POST"]["data"]["token"], token)
+        self.assertIn("Authorization", requests["DELETE"]["headers"])
+
+
+class VerificationCacheTest(SimpleTestCase):
+
+    def test_concurrent_checks_share_one_request(self):
+        now = [0.0]
+        cache = auth.VerificationCache(ttl=30, clock=lambda: now[0])
+        checked = []
+
+        async def check(uid):
+            checked.append(uid)
+            await asyncio.sleep(0.01)
+            return uid != "bad"
+
+        async def scenario():
+            results = await asyncio.gather(*(cache.verify(uid, check) for uid in ("a", "a", "bad", "bad")))
+            # "a" est garde jusqu'a la fin du ttl, "bad" est redemande
+            results.append(await cache.verify("a", check))
+            results.append(await cache.verify("bad", check))
+            now[0] = 31
+            results.append(await cache.verify("a", check))
+            return results
+
+        self.assertEqual(asyncio.run(scenario()), [True, True, False, False, True, False, True])
+        self.assertEqual(checked, ["a", "bad", "bad", "a"])
+        self.assertEqual((cache.requests, cache.shared, cache.hits), (4, 2, 1))
+
+
+class TimerWheelTest(SimpleTestCase):
+
+    def test_timers_fire_at_their_tick_and_can_be_cancelled(self):
+        clock = SimulatedClock()
+        fired = []
+
+        async def scenario():
+            wheel = TimerWheel(resolution=0.1, slots=8, clock=clock)
+            wheel.call_later(0.25, fired.append, "a")
+            # plus d'un tour de roue : meme case, declenche au bon tour
+            wheel.call_later(1.05, fired.append, "b")
+            wheel.call_later(0.5, fired.append, "cancelled").cancel()
+            clock.advance(0.2)
+            wheel.advance()
+            self.assertEqual(fired, [])
+            clock.advance(0.15)
+            wheel.advance()
+            self.assertEqual(fired, ["a"])
+            clock.advance(1)
+            wheel.advance()
+            self.assertEqual(fired, ["a", "b"])
+            self.assertEqual(len(wheel), 0)
+
+        asyncio.run(scenario())
+
+
+class GameWrapperLifecycleTest(SimpleTestCase):
+
+    def test_transitions(self):
+        async def scenario():
+            wrapper = GameWrapper("PVP1")
+            self.assertFalse(wrapper.transition(GameStatus.IN_PROGRESS))
+            for status in (GameStatus.STARTING, GameStatus.IN_PROGRESS, GameStatus.PAUSED,
+                           GameStatus.IN_PROGRESS, GameStatus.FINISHED):
+                self.assertTrue(wrapper.transition(status))
+            self.assertFalse(wrapper.transition(GameStatus.CANCELLED))
+            self.assertIs(wrapper.status, GameStatus.FINISHED)
+        asyncio.run(scenario())
+
+    def test_waiters_wake_on_ready_steps_and_cancellation(self):
+        async def scenario():
+            wrapper = GameWrapper("PVP1")
+            started = asyncio.ensure_future(wrapper.wait_until(lambda w: "start" in w.ready))
+            cancelled = GameWrapper("PVP2")
+            aborted = asyncio.ensure_future(cancelled.wait_until(lambda w: "start" in w.ready))
+            await asyncio.sleep(0)
+            wrapper.mark_ready("names")
+            await asyncio.sleep(0)
+            self.assertFalse(started.done())
+            wrapper.mark_ready("start")
+            cancelled.transition(GameStatus.CANCELLED)
+            return await started, await aborted
+        self.assertEqual(asyncio.run(scenario()), (True, False))
+
+    def test_lobby_timer_only_fires_while_waiting(self):
+        clock = SimulatedClock()
+        timeouts = []
+
+        async def scenario():
+            wheel = TimerWheel(clock=clock)
+            lonely, joined = GameWrapper("PVP1"), GameWrapper("PVP2")
+            for wrapper in (lonely, joined):
+                wrapper.start_lobby_timer(wheel, 5, lambda wrapper=wrapper: timeouts.append(wrapper.game_id))
+            joined.transition(GameStatus.STARTING)
+            self.assertEqual(len(wheel), 1)
+            clock.advance(5.1)
+            wheel.advance()
+
+        asyncio.run(scenario())
+        self.assertEqual(timeouts, ["PVP1"])
+
+    def test_handshake_timer_cancels_a_stalled_start(self):
+        clock = SimulatedClock()
+
+        async def scenario():
+            wheel = TimerWheel(clock=clock)
+            stalled, started = GameWrapper("PVP1"), GameWrapper("PVP2")
+            waiters = []
+            for wrapper in (stalled, started):
+                wrapper.transition(GameStatus.STARTING)
+                wrapper.start_handshake_timer(wheel, 15, lambda wrapper=wrapper: wrapper.transition(GameStatus.CANCELLED))
+                waiters.append(asyncio.ensure_future(wrapper.wait_until(lambda w: "start" in w.ready)))
+            await asyncio.sleep(0)
+            started.mark_ready("start")
+            started.transition(GameStatus.IN_PROGRESS)
+            self.assertEqual(len(wheel), 1)
+            clock.advance(15.1)
+            wheel.advance()
+            return [await waiter for waiter in waiters], stalled.status, started.status
+
+        self.assertEqual(asyncio.run(scenario()), ([False, True], GameStatus.CANCELLED, GameStatus.IN_PROGRESS))
+
+
+class GameRegistryTest(SimpleTestCase):
+
+    class Consumer:
+        pass
+
+    def test_client_slots(self):
+        wrapper = GameWrapper("PVP1")
+        first, second, third = self.Consumer(), self.Consumer(), self.Consumer()
+        self.assertTrue(wrapper.add_client(first))
+        self.assertIsNone(wrapper.peer(first))
+        self.assertTrue(wrapper.add_client(second))
+        self.assertFalse(wrapper.add_client(third))
+        self.assertIs(wrapper.peer(first), second)
+        wrapper.remove_client(second)
+        self.assertEqual(wrapper.clients, [first])
+        self.assertTrue(wrapper.add_client(third))
+        self.assertIs(wrapper.peer(first), third)
+
+    def test_orphaned_game_is_removed(self):
+        async def scenario():
+            manager = GameManager()
+            wrapper = await manager.create_or_get_game("PVP1")
+            self.assertIs(await manager.create_or_get_game("PVP1"), wrapper)
+            consumer = self.Consumer()
+            wrapper.add_client(consumer)
+            del consumer
+            gc.collect()
+            # rien n'est retire pendant le GC, seulement au tour de boucle suivant
+            self.assertIn("PVP1", manager.active_games)
+            await asyncio.sleep(0)
+            return manager, wrapper
+        manager, wrapper = asyncio.run(scenario())
+        self.assertNotIn("PVP1", manager.active_games)
+        self.assertIs(wrapper.status, GameStatus.CANCELLED)
+
+    def test_reconnect_replaces_a_game_that_is_over(self):
+        async def scenario():
+            manager = GameManager()
+            cancelled = await manager.create_or_get_game("PVP1")
+            # annulee (timeout du lobby) mais pas encore retiree du registre
+            cancelled.transition(GameStatus.CANCELLED)
+            replacement = await manager.create_or_get_game("PVP1")
+            self.assertIsNot(replacement, cancelled)
+            self.assertIs(replacement.status, GameStatus.WAITING)
+            # le retrait tardif de l'ancienne partie ne touche pas la nouvelle
+            self.assertFalse(await manager.remove_game("PVP1", cancelled))
+            return manager, replacement
+        manager, replacement = asyncio.run(scenario())
+        self.assertIs(manager.active_games["PVP1"], replacement)